@@ -1,24 +1,51 @@
 from google.adk.agents import Agent
-import psycopg2
-import psycopg2.extras
 from typing import Optional
-import decimal
 import datetime
 import requests
+import numpy as np
 
-# Conexión a Postgres (el host será "db" porque así lo definimos en docker-compose)
-def get_connection():
-    return psycopg2.connect(
-        dbname="finanzas",
-        user="postgres",
-        password="postgres",
-        host="db",
-        port="5432"
-    )
+from .dinero import (Dinero, a_minimo, desde_minimo, aplicar_porcentaje, como_fraccion,
+                     convertir_por_moneda, sumar_array)
+from . import atajos, cache, categorizacion, conciliacion, estadisticas_gasto, plazos, recurrentes
+from .instrumentacion import estadisticas, instrumentar_herramienta, UMBRAL_LENTA_MS
+from .proyeccion import formatear_filas
+from .repositorio import ORIGENES_BUSQUEDA, INTERVALOS_PATRIMONIO, obtener_repositorio, solo_lectura
+from .simulacion_fx import simular_escenarios_fx
+
+# El almacenamiento se elige con FINANZAS_BACKEND (postgres por defecto, sqlite para modo local);
+# ver repositorio.py
+
+# Campos por defecto del modo compacto de cada listado (el parámetro campos los reemplaza)
+COMPACT_FIELDS = {
+    "transacciones": ["id", "fecha", "tipo", "monto", "contraparte"],
+    "busqueda": ["origen", "id", "fecha", "monto", "moneda", "contraparte", "relevancia"],
+    "prestamos": ["id", "persona", "moneda", "monto_total", "monto_en_mano", "saldo_pendiente",
+                  "estado", "fecha_prestamo", "monto_total_usd"],
+    "historial": ["id", "fecha_operacion", "tipo_operacion", "monto_operacion", "saldo_nuevo"],
+}
+
+# Plazo (segundos) de las herramientas que necesitan más que el de por defecto (plazos.py)
+TOOL_DEADLINES = {
+    "simulate_fx_scenarios": 60,
+    "get_net_worth_history": 30,
+    "rebuild_daily_balances": 120,
+    "recategorize_ledger": 600,
+    "reconcile_ledger": 300,
+}
+
+# Herramientas que no escriben: con FINANZAS_DSN_LECTURA se resuelven en la réplica de lectura
+READ_ONLY_TOOLS = {
+    "get_balance", "get_period_report", "list_transactions", "search_transactions",
+    "get_exchange_rate", "convert_to_usd", "list_loans", "list_loan_payments", "get_fx_pnl_report",
+    "get_counterparty_exposure", "get_counterparty_history", "get_current_balance", "get_total_money",
+    "get_balance_history", "get_net_worth_history", "simulate_fx_scenarios", "list_recurring_rules",
+    "get_category_stats", "get_spending_by_category", "list_category_rules",
+}
 
 # ---------------- TOOLS ---------------- #
 
-def add_transaction(tipo: str, monto: float, fecha: str, descripcion: str, contraparte: Optional[str] = None) -> dict:
+def add_transaction(tipo: str, monto: float, fecha: str, descripcion: str, contraparte: Optional[str] = None,
+                    categoria: Optional[str] = None) -> dict:
     """
     Agrega una transacción a la base de datos.
     
@@ -28,30 +55,21 @@ def add_transaction(tipo: str, monto: float, fecha: str, descripcion: str, contr
         fecha (str): fecha en formato YYYY-MM-DD.
         descripcion (str): contexto de la operación.
         contraparte (str, optional): persona o entidad relacionada.
+        categoria (str, optional): categoría; por defecto se deduce de la descripción.
     """
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        
-        cur.execute(
-            """
-            INSERT INTO transacciones (tipo, monto, fecha, descripcion, contraparte)
-            VALUES (%s, %s, %s, %s, %s) RETURNING id;
-            """,
-            (tipo, monto, fecha, descripcion, contraparte)
-        )
-        
-        transaction_id = cur.fetchone()[0]
-        conn.commit()
-        cur.close()
-        conn.close()
-        
+        repo = obtener_repositorio()
+        categoria = (estadisticas_gasto.normalizar_categoria(categoria) if categoria
+                     else repo.categorizador.categorizar(descripcion, tipo))
+        transaction_id = repo.agregar_transaccion(tipo, monto, fecha, descripcion, contraparte, categoria)
+
         return {
             "status": "success",
             "message": f"Transacción de {tipo} registrada exitosamente",
             "transaction_id": transaction_id,
             "monto": monto,
-            "fecha": fecha
+            "fecha": fecha,
+            "categoria": categoria
         }
     except Exception as e:
         return {"status": "error", "error_message": str(e)}
@@ -59,63 +77,142 @@ def add_transaction(tipo: str, monto: float, fecha: str, descripcion: str, contr
 def get_balance() -> dict:
     """Devuelve el balance actual (ingresos - gastos - préstamos)."""
     try:
-        conn = get_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cur.execute(
-            """
-            SELECT
-                SUM(CASE WHEN tipo = 'ingreso' THEN monto ELSE 0 END) -
-                SUM(CASE WHEN tipo IN ('gasto','prestamo') THEN monto ELSE 0 END) AS balance
-            FROM transacciones;
-            """
-        )
-        balance = cur.fetchone()["balance"] or 0
-        cur.close()
-        conn.close()
+        # Se lee del rollup mensual, no de la tabla de transacciones
+        balance = obtener_repositorio().balance_transacciones()
         return {"status": "success", "balance": balance}
     except Exception as e:
         return {"status": "error", "error_message": str(e)}
 
+def get_period_report(desde: Optional[str] = None, hasta: Optional[str] = None,
+                      por_contraparte: bool = False, por_categoria: bool = False) -> dict:
+    """
+    Devuelve ingresos, gastos, préstamos y balance por mes (desde el rollup mensual).
+    
+    Args:
+        desde (str, optional): mes inicial en formato YYYY-MM (por defecto, hace 11 meses).
+        hasta (str, optional): mes final en formato YYYY-MM (por defecto, el mes actual).
+        por_contraparte (bool): si es True, desglosa cada mes por contraparte.
+        por_categoria (bool): si es True, desglosa cada mes por categoría.
+    """
+    try:
+        if por_contraparte and por_categoria:
+            return {"status": "error", "error_message": "Elegir un solo desglose: por_contraparte o por_categoria"}
+        hoy = datetime.datetime.now().date()
+        try:
+            hasta_mes = datetime.datetime.strptime(hasta, "%Y-%m").date() if hasta else hoy.replace(day=1)
+            if desde:
+                desde_mes = datetime.datetime.strptime(desde, "%Y-%m").date()
+            else:
+                # Últimos 12 meses incluyendo el mes final
+                indice = hasta_mes.year * 12 + hasta_mes.month - 1 - 11
+                desde_mes = datetime.date(indice // 12, indice % 12 + 1, 1)
+        except ValueError:
+            return {"status": "error", "error_message": "Formato de mes inválido. Use YYYY-MM (ej: 2025-09)"}
+        
+        repo = obtener_repositorio()
+        if por_categoria:
+            # La categoría no está en el rollup: se agrupa la tabla en el rango (índice por fecha)
+            rows, desglose = repo.reporte_categorias_transacciones(desde_mes, hasta_mes), "categoria"
+        else:
+            rows = repo.reporte_mensual(desde_mes, hasta_mes, por_contraparte)
+            desglose = "contraparte" if por_contraparte else None
+
+        filas = []
+        for row in rows:
+            fila = [str(row["mes"])[:7]]
+            if desglose:
+                fila.append(row[desglose] or None)
+            fila += [round(float(row[c] or 0), 2) for c in ("ingresos", "gastos", "prestamos", "balance")]
+            fila.append(row["cantidad"])
+            filas.append(fila)
+        
+        columnas = ["mes"] + ([desglose] if desglose else []) + \
+                   ["ingresos", "gastos", "prestamos", "balance", "cantidad"]
+        idx = {c: columnas.index(c) for c in ("ingresos", "gastos", "prestamos", "balance")}
+        
+        return {
+            "status": "success",
+            "desde": desde_mes.strftime("%Y-%m"),
+            "hasta": hasta_mes.strftime("%Y-%m"),
+            "columnas": columnas,
+            "filas": filas,
+            "totales": {c: round(sum(f[i] for f in filas), 2) for c, i in idx.items()}
+        }
+    except Exception as e:
+        return {"status": "error", "error_message": str(e)}
+
 
     
-def list_transactions(limit: int = 10) -> dict:
+def list_transactions(limit: int = 10, compacto: bool = False, campos: Optional[str] = None) -> dict:
     """
     Lista las últimas transacciones.
     
     Si limit es 0 o mayor a 100, devuelve hasta 100 transacciones.
-    Además, imprime cada transacción por consola.
+
+    Args:
+        limit (int): cantidad de transacciones.
+        compacto (bool): devuelve columnas + filas solo con los campos esenciales.
+        campos (str, optional): campos a incluir, separados por coma (ej: 'fecha,monto').
     """
     if limit <= 0 or limit > 100:
         limit = 100
 
     try:
-        conn = get_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cur.execute(
-            "SELECT * FROM transacciones ORDER BY fecha DESC, id DESC LIMIT %s;",
-            (limit,)
-        )
-        rows = cur.fetchall()
-        print("[DEBUG] New consulta:")
-        
-        # Convertir Decimal a float y date a string
+        rows = obtener_repositorio().listar_transacciones(limit)
+
+        return {
+            "status": "success",
+            **formatear_filas(rows, "transactions", campos, compacto, COMPACT_FIELDS["transacciones"])
+        }
+
+    except Exception as e:
+        return {"status": "error", "error_message": str(e)}
+
+def search_transactions(consulta: str, origen: str = "todos", pagina: int = 1, por_pagina: int = 20,
+                        compacto: bool = False, campos: Optional[str] = None) -> dict:
+    """
+    Busca por texto en descripciones y contrapartes (tolera errores de tipeo) y
+    devuelve los resultados ordenados por relevancia, paginados.
+
+    Args:
+        consulta (str): texto a buscar (ej: 'Juan', 'alquiler').
+        origen (str): 'todos', 'transacciones', 'saldo_actual', 'prestamos' o 'historial_saldo'.
+        pagina (int): número de página (desde 1).
+        por_pagina (int): resultados por página (máximo 100).
+        compacto (bool): devuelve columnas + filas sin las descripciones.
+        campos (str, optional): campos a incluir, separados por coma (ej: 'fecha,monto,descripcion').
+    """
+    consulta = (consulta or "").strip()
+    if not consulta:
+        return {"status": "error", "error_message": "La consulta no puede estar vacía"}
+    if origen != "todos" and origen not in ORIGENES_BUSQUEDA:
+        return {
+            "status": "error",
+            "error_message": f"origen inválido. Opciones: todos, {', '.join(ORIGENES_BUSQUEDA)}"
+        }
+    if pagina < 1:
+        pagina = 1
+    if por_pagina <= 0 or por_pagina > 100:
+        por_pagina = 100
+
+    try:
+        origenes = list(ORIGENES_BUSQUEDA) if origen == "todos" else [origen]
+        rows, total = obtener_repositorio().buscar(consulta, origenes, por_pagina, (pagina - 1) * por_pagina)
         for row in rows:
-            for k, v in row.items():
-                if isinstance(v, decimal.Decimal):
-                    row[k] = float(v)
-                elif isinstance(v, (datetime.date, datetime.datetime)):
-                    row[k] = v.isoformat()
-            # Imprimir cada transacción en consola
-            print("[DEBUG] Transacción:", row)
-
-        cur.close()
-        conn.close()
-        return {"status": "success", "transactions": rows}
+            row["relevancia"] = round(row["relevancia"], 3)
 
+        return {
+            "status": "success",
+            "consulta": consulta,
+            **formatear_filas(rows, "resultados", campos, compacto, COMPACT_FIELDS["busqueda"]),
+            "pagina": pagina,
+            "por_pagina": por_pagina,
+            "total_resultados": total,
+            "total_paginas": (total + por_pagina - 1) // por_pagina
+        }
     except Exception as e:
-        print("[ERROR] list_transactions:", e)
         return {"status": "error", "error_message": str(e)}
-    
+
 
 
 # Tool para obtener la fecha actual
@@ -141,24 +238,8 @@ def update_exchange_rate(moneda_origen: str, tasa: float, moneda_destino: str =
         moneda_destino (str): Moneda destino (por defecto USD)
     """
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        
-        cur.execute(
-            """
-            INSERT INTO tasas_cambio (moneda_origen, moneda_destino, tasa, fecha_actualizacion)
-            VALUES (%s, %s, %s, NOW())
-            ON CONFLICT (moneda_origen, moneda_destino)
-            DO UPDATE SET tasa = EXCLUDED.tasa, fecha_actualizacion = NOW()
-            RETURNING id;
-            """,
-            (moneda_origen.upper(), moneda_destino.upper(), tasa)
-        )
-        
-        rate_id = cur.fetchone()[0]
-        conn.commit()
-        cur.close()
-        conn.close()
+        # Guarda la tasa vigente y también la cotización del día en el historial
+        rate_id = obtener_repositorio().guardar_tasa(moneda_origen.upper(), moneda_destino.upper(), tasa)
         
         return {
             "status": "success",
@@ -173,27 +254,13 @@ def get_exchange_rate(moneda_origen: str, moneda_destino: str = "USD") -> dict:
     Obtiene la tasa de cambio actual.
     """
     try:
-        conn = get_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        
-        cur.execute(
-            """
-            SELECT tasa, fecha_actualizacion 
-            FROM tasas_cambio 
-            WHERE moneda_origen = %s AND moneda_destino = %s;
-            """,
-            (moneda_origen.upper(), moneda_destino.upper())
-        )
-        
-        result = cur.fetchone()
-        cur.close()
-        conn.close()
+        result = obtener_repositorio().obtener_tasa(moneda_origen.upper(), moneda_destino.upper())
         
         if result:
             return {
                 "status": "success",
                 "tasa": float(result["tasa"]),
-                "fecha_actualizacion": result["fecha_actualizacion"].isoformat()
+                "fecha_actualizacion": result["fecha_actualizacion"]
             }
         else:
             return {
@@ -220,12 +287,13 @@ def convert_to_usd(monto: float, moneda: str) -> dict:
         return rate_result
     
     tasa = rate_result["tasa"]
-    monto_usd = monto * tasa
+    # Conversión exacta en centavos (sin error de punto flotante)
+    monto_usd = Dinero.de(monto, moneda).convertir(tasa, "USD").a_float()
     
     return {
         "status": "success",
         "monto_original": monto,
-        "monto_usd": round(monto_usd, 2),
+        "monto_usd": monto_usd,
         "tasa_usada": tasa
     }
 
@@ -272,7 +340,8 @@ def get_current_exchange_rate_from_api(moneda: str, fecha: Optional[str] = None)
         try:
             # Usando API gratuita de exchangerate-api.com
             url = f"https://api.exchangerate-api.com/v4/latest/USD"
-            response = requests.get(url, timeout=10)
+            # El timeout HTTP no pasa de lo que le queda al plazo de la herramienta
+            response = requests.get(url, timeout=plazos.limitar(10))
             
             if response.status_code == 200:
                 data = response.json()
@@ -345,6 +414,23 @@ def save_exchange_rate_from_api(moneda: str, fecha: Optional[str] = None) -> dic
     except Exception as e:
         return {"status": "error", "error_message": str(e)}
 
+def get_current_usd_rate(moneda: str) -> Optional[float]:
+    """
+    Devuelve cuántos USD vale 1 unidad de la moneda hoy: primero la API y, si falla,
+    la tasa guardada en la base de datos. None si no hay cotización disponible.
+    """
+    if moneda.upper() == "USD":
+        return 1.0
+    
+    api_result = get_current_exchange_rate_from_api(moneda)
+    if api_result["status"] == "success":
+        return api_result["cotizacion_usd"]
+    
+    existing_rate = get_exchange_rate(moneda, "USD")
+    if existing_rate["status"] == "success":
+        return existing_rate["tasa"]
+    return None
+
 # ---------------- FUNCIONES DE PRÉSTAMOS ---------------- #
 
 def add_loan(monto_total: float, moneda: str, persona: str, fecha_prestamo: str,
@@ -421,32 +507,33 @@ def add_loan(monto_total: float, moneda: str, persona: str, fecha_prestamo: str,
         if tiene_intermediario:
             porcentaje_neto = porcentaje_interes - porcentaje_intermediario
         
+        # Montos calculados en centavos exactos (los porcentajes se restan como decimales)
+        monto_prestado = Dinero.de(monto_total, moneda)
+        porcentaje_neto_exacto = como_fraccion(float(porcentaje_interes))
+        if tiene_intermediario:
+            porcentaje_neto_exacto -= como_fraccion(float(porcentaje_intermediario))
+        
         # Ganancia neta final
-        ganancia_neta = monto_total * (porcentaje_neto / 100)
+        ganancia_neta = monto_prestado.porcentaje(porcentaje_neto_exacto).a_float()
         
         # Monto del intermediario (sobre el monto total, no sobre los intereses)
-        monto_intermediario = monto_total * (porcentaje_intermediario / 100) if tiene_intermediario else 0
-        
-        conn = get_connection()
-        cur = conn.cursor()
-        
-        cur.execute(
-            """
-            INSERT INTO prestamos (monto_total, moneda, persona, porcentaje_interes,
-                                 tiene_intermediario, porcentaje_intermediario, 
-                                 monto_intermediario, monto_en_mano, fecha_prestamo, 
-                                 cotizacion_momento, descripcion)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id;
-            """,
-            (monto_total, moneda.upper(), persona, porcentaje_interes, tiene_intermediario,
-             porcentaje_intermediario, monto_intermediario, ganancia_neta, fecha_obj, 
-             cotizacion_momento, descripcion)
-        )
-        
-        loan_id = cur.fetchone()[0]
-        conn.commit()
-        cur.close()
-        conn.close()
+        monto_intermediario = monto_prestado.porcentaje(porcentaje_intermediario).a_float() if tiene_intermediario else 0
+        
+        # Intereses totales y deuda de la persona (capital + intereses)
+        intereses = monto_prestado.porcentaje(porcentaje_interes)
+        deuda_total = (monto_prestado + intereses).a_float()
+        
+        repo = obtener_repositorio()
+        with repo.transaccion():
+            loan_id = repo.crear_prestamo(
+                monto_total, moneda.upper(), persona, porcentaje_interes, tiene_intermediario,
+                porcentaje_intermediario, monto_intermediario, ganancia_neta, fecha_obj,
+                cotizacion_momento, descripcion, deuda_total
+            )
+            repo.registrar_exposicion(
+                persona, moneda.upper(), 1, monto_total,
+                intereses.a_float(), ganancia_neta, nuevo=True
+            )
         
         result = {
             "status": "success",
@@ -465,7 +552,7 @@ def add_loan(monto_total: float, moneda: str, persona: str, fecha_prestamo: str,
             "persona": persona,
             "calculo_detalle": {
                 "explicacion": f"Préstamo: {monto_total} {moneda}",
-                "interes_total": f"{porcentaje_interes}% sobre {monto_total} = {monto_total * (porcentaje_interes / 100)} {moneda}",
+                "interes_total": f"{porcentaje_interes}% sobre {monto_total} = {intereses.a_float()} {moneda}",
                 "descuento_intermediario": f"Intermediario: {porcentaje_intermediario}% del monto total = {monto_intermediario} {moneda}" if tiene_intermediario else "Sin intermediario",
                 "porcentaje_neto": f"Tu porcentaje neto: {porcentaje_neto}% (era {porcentaje_interes}% - {porcentaje_intermediario}% intermediario)",
                 "ganancia_final": f"Tu ganancia: {monto_total} × {porcentaje_neto}% = {ganancia_neta} {moneda}",
@@ -482,107 +569,106 @@ def add_loan(monto_total: float, moneda: str, persona: str, fecha_prestamo: str,
     except Exception as e:
         return {"status": "error", "error_message": str(e)}
 
-def list_loans(estado: str = "activo") -> dict:
+def list_loans(estado: str = "activo", compacto: bool = False, campos: Optional[str] = None) -> dict:
     """
     Lista todos los préstamos activos o finalizados con conversiones de moneda al momento de consulta.
+
+    Args:
+        estado (str): 'activo', 'finalizado' o 'todos'.
+        compacto (bool): devuelve columnas + filas y totales numéricos, sin explicaciones.
+        campos (str, optional): campos de cada préstamo, separados por coma (ej: 'id,persona,saldo_pendiente').
     """
     try:
-        conn = get_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        
-        if estado == "todos":
-            cur.execute("SELECT * FROM prestamos ORDER BY fecha_prestamo DESC;")
-        else:
-            cur.execute("SELECT * FROM prestamos WHERE estado = %s ORDER BY fecha_prestamo DESC;", (estado,))
-        
-        loans = cur.fetchall()
-        cur.close()
-        conn.close()
+        loans = obtener_repositorio().listar_prestamos(estado)
         
         loans_with_conversions = []
         
-        # Totales por moneda original
-        totales_por_moneda = {}
-        
-        # Totales convertidos a USD y ARS
-        total_prestado_usd = 0
-        total_en_mano_usd = 0
-        total_prestado_ars = 0
-        total_en_mano_ars = 0
-        
         # Obtener cotización actual para conversiones
         fecha_hoy = datetime.datetime.now().date().isoformat()
         cotizacion_ars = get_current_exchange_rate_from_api("ARS", fecha_hoy)
         ars_por_usd = cotizacion_ars.get("cotizacion_original", 1362.33) if cotizacion_ars["status"] == "success" else 1362.33
         
-        for loan in loans:
-            # Convertir Decimal a float y date a string
-            for k, v in loan.items():
-                if isinstance(v, decimal.Decimal):
-                    loan[k] = float(v)
-                elif isinstance(v, (datetime.date, datetime.datetime)):
-                    loan[k] = v.isoformat()
-            
+        # Montos en unidades mínimas enteras: sumas y conversiones exactas y vectorizadas
+        monedas = np.array([loan["moneda"] for loan in loans], dtype=object)
+        unidades_total = np.array([a_minimo(loan["monto_total"], loan["moneda"]) for loan in loans], dtype=np.int64)
+        unidades_en_mano = np.array([a_minimo(loan["monto_en_mano"], loan["moneda"]) for loan in loans], dtype=np.int64)
+        
+        tasa_ars = como_fraccion(ars_por_usd)
+        tasas_a_usd = {"USD": 1, "ARS": 1 / tasa_ars}
+        tasas_a_ars = {"ARS": 1, "USD": tasa_ars}
+        total_usd = convertir_por_moneda(unidades_total, monedas, tasas_a_usd, "USD")
+        en_mano_usd = convertir_por_moneda(unidades_en_mano, monedas, tasas_a_usd, "USD")
+        total_ars = convertir_por_moneda(unidades_total, monedas, tasas_a_ars, "ARS")
+        en_mano_ars = convertir_por_moneda(unidades_en_mano, monedas, tasas_a_ars, "ARS")
+        
+        # Totales por moneda original
+        totales_por_moneda = {}
+        for moneda in dict.fromkeys(monedas.tolist()):
+            mascara = monedas == moneda
+            totales_por_moneda[moneda] = {
+                "prestado": desde_minimo(sumar_array(unidades_total[mascara]), moneda),
+                "en_mano": desde_minimo(sumar_array(unidades_en_mano[mascara]), moneda),
+                "cantidad": int(mascara.sum())
+            }
+        
+        for i, loan in enumerate(loans):
             moneda = loan["moneda"]
             monto_total = loan["monto_total"]
             monto_en_mano = loan["monto_en_mano"]
             
-            # Acumular por moneda original
-            if moneda not in totales_por_moneda:
-                totales_por_moneda[moneda] = {
-                    "prestado": 0,
-                    "en_mano": 0,
-                    "cantidad": 0
-                }
-            
-            totales_por_moneda[moneda]["prestado"] += monto_total
-            totales_por_moneda[moneda]["en_mano"] += monto_en_mano
-            totales_por_moneda[moneda]["cantidad"] += 1
+            # Convertir a USD y ARS
+            if moneda in ("USD", "ARS"):
+                loan["monto_total_usd"] = desde_minimo(total_usd[i], "USD")
+                loan["monto_en_mano_usd"] = desde_minimo(en_mano_usd[i], "USD")
+                loan["monto_total_ars"] = desde_minimo(total_ars[i], "ARS")
+                loan["monto_en_mano_ars"] = desde_minimo(en_mano_ars[i], "ARS")
             
-            # Convertir a USD y ARS para totales
-            if moneda == "USD":
-                loan["monto_total_usd"] = monto_total
-                loan["monto_en_mano_usd"] = monto_en_mano
-                loan["monto_total_ars"] = monto_total * ars_por_usd
-                loan["monto_en_mano_ars"] = monto_en_mano * ars_por_usd
-                
-                total_prestado_usd += monto_total
-                total_en_mano_usd += monto_en_mano
-                total_prestado_ars += monto_total * ars_por_usd
-                total_en_mano_ars += monto_en_mano * ars_por_usd
-                
-            elif moneda == "ARS":
-                loan["monto_total_ars"] = monto_total
-                loan["monto_en_mano_ars"] = monto_en_mano
-                loan["monto_total_usd"] = monto_total / ars_por_usd
-                loan["monto_en_mano_usd"] = monto_en_mano / ars_por_usd
-                
-                total_prestado_ars += monto_total
-                total_en_mano_ars += monto_en_mano
-                total_prestado_usd += monto_total / ars_por_usd
-                total_en_mano_usd += monto_en_mano / ars_por_usd
+            ganancia_intereses = desde_minimo(aplicar_porcentaje(int(unidades_total[i]), loan["porcentaje_interes"]), moneda)
+            loan["ganancia_intereses"] = ganancia_intereses
+            if compacto:
+                loans_with_conversions.append(loan)
+                continue
             
             # Añadir explicación del cálculo
-            ganancia_intereses = monto_total * (loan["porcentaje_interes"] / 100)
-            loan["ganancia_intereses"] = ganancia_intereses
             loan["calculo_explicacion"] = {
                 "monto_prestado": f"{monto_total:,.2f} {moneda}",
                 "ganancia_intereses": f"{ganancia_intereses:,.2f} {moneda} ({loan['porcentaje_interes']}%)",
                 "descuento_intermediario": f"{loan['monto_intermediario']:,.2f} {moneda} ({loan['porcentaje_intermediario']}%)" if loan["tiene_intermediario"] else "Sin intermediario",
-                "monto_en_mano": f"{monto_en_mano:,.2f} {moneda}"
+                "monto_en_mano": f"{monto_en_mano:,.2f} {moneda}",
+                "saldo_pendiente": f"{loan['saldo_pendiente']:,.2f} {moneda} (ganancia ya cobrada: {loan['ganancia_cobrada']:,.2f} {moneda})"
             }
             
             loans_with_conversions.append(loan)
         
+        # Totales convertidos a USD y ARS
+        total_prestado_usd = desde_minimo(sumar_array(total_usd), "USD")
+        total_en_mano_usd = desde_minimo(sumar_array(en_mano_usd), "USD")
+        total_prestado_ars = desde_minimo(sumar_array(total_ars), "ARS")
+        total_en_mano_ars = desde_minimo(sumar_array(en_mano_ars), "ARS")
+        
+        if compacto:
+            return {
+                "status": "success",
+                **formatear_filas(loans_with_conversions, "prestamos", campos, True, COMPACT_FIELDS["prestamos"]),
+                "totales_convertidos": {
+                    "total_prestado_usd": total_prestado_usd,
+                    "total_en_mano_usd": total_en_mano_usd,
+                    "total_prestado_ars": total_prestado_ars,
+                    "total_en_mano_ars": total_en_mano_ars
+                },
+                "cantidad_prestamos": len(loans_with_conversions),
+                "ars_por_usd": ars_por_usd
+            }
+        
         return {
             "status": "success",
-            "prestamos": loans_with_conversions,
+            **formatear_filas(loans_with_conversions, "prestamos", campos),
             "totales_por_moneda_original": totales_por_moneda,
             "totales_convertidos": {
-                "total_prestado_usd": round(total_prestado_usd, 2),
-                "total_en_mano_usd": round(total_en_mano_usd, 2),
-                "total_prestado_ars": round(total_prestado_ars, 2),
-                "total_en_mano_ars": round(total_en_mano_ars, 2)
+                "total_prestado_usd": total_prestado_usd,
+                "total_en_mano_usd": total_en_mano_usd,
+                "total_prestado_ars": total_prestado_ars,
+                "total_en_mano_ars": total_en_mano_ars
             },
             "cantidad_prestamos": len(loans_with_conversions),
             "cotizacion_usada": f"1 USD = {ars_por_usd:,.2f} ARS (fecha: {fecha_hoy})",
@@ -599,40 +685,48 @@ def finish_loan(loan_id: int) -> dict:
     Marca un préstamo como finalizado y devuelve las GANANCIAS (monto en mano) al saldo actual.
     """
     try:
-        conn = get_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        
-        # Obtener datos del préstamo
-        cur.execute("SELECT * FROM prestamos WHERE id = %s AND estado = 'activo';", (loan_id,))
-        loan = cur.fetchone()
-        
+        repo = obtener_repositorio()
+        loan = repo.obtener_prestamo(loan_id, solo_activo=True)
         if not loan:
             return {"status": "error", "error_message": f"No se encontró préstamo activo con ID {loan_id}"}
         
-        # Convertir el MONTO EN MANO (las ganancias reales) a USD
-        monto_en_mano = float(loan["monto_en_mano"])
-        conversion = convert_to_usd(monto_en_mano, loan["moneda"])
-        monto_en_mano_usd = conversion["monto_usd"] if conversion["status"] == "success" else 0
-        
-        # Marcar préstamo como finalizado
-        cur.execute("UPDATE prestamos SET estado = 'finalizado' WHERE id = %s;", (loan_id,))
-        
-        # Añadir las GANANCIAS al saldo actual (no el monto total prestado)
-        add_to_current_balance_result = add_to_current_balance(
-            monto_en_mano, 
-            loan["moneda"],
-            f"Préstamo finalizado: {loan['persona']} - Ganancia: {monto_en_mano} {loan['moneda']}", 
-            "prestamo_finalizado"
-        )
+        # Cotización del día de cierre (para el P&L cambiario realizado), pedida antes de
+        # bloquear el préstamo para no retenerlo durante la llamada HTTP
+        cotizacion_finalizacion = get_current_usd_rate(loan["moneda"])
         
-        conn.commit()
-        cur.close()
-        conn.close()
+        with repo.transaccion():
+            # Obtener datos del préstamo (bloqueando la fila frente a pagos concurrentes)
+            loan = repo.obtener_prestamo(loan_id, solo_activo=True, bloquear=True)
+            
+            if not loan:
+                return {"status": "error", "error_message": f"No se encontró préstamo activo con ID {loan_id}"}
+            
+            # Convertir el MONTO EN MANO (las ganancias reales) a USD, descontando lo ya cobrado en pagos parciales
+            ganancia_cobrada = loan["ganancia_cobrada"]
+            monto_en_mano = round(loan["monto_en_mano"] - ganancia_cobrada, 2)
+            conversion = convert_to_usd(monto_en_mano, loan["moneda"])
+            monto_en_mano_usd = conversion["monto_usd"] if conversion["status"] == "success" else 0
+            
+            # Marcar préstamo como finalizado
+            repo.finalizar_prestamo(loan_id, cotizacion_finalizacion)
+            capital_pendiente, intereses_pendientes = split_outstanding_balance(loan)
+            repo.registrar_exposicion(
+                loan["persona"], loan["moneda"], -1, -capital_pendiente,
+                -intereses_pendientes, -monto_en_mano
+            )
+            
+            # Añadir las GANANCIAS al saldo actual (no el monto total prestado), en la misma transacción
+            saldo_anterior_usd = repo.saldo_moneda("USD")
+            repo.registrar_movimiento_saldo(
+                monto_en_mano, loan["moneda"],
+                f"Préstamo finalizado: {loan['persona']} - Ganancia: {monto_en_mano} {loan['moneda']}",
+                "prestamo_finalizado", monto_en_mano_usd, saldo_anterior_usd
+            )
         
         # Calcular detalles para mostrar
-        monto_total = float(loan["monto_total"])
-        ganancia_intereses = monto_total * (float(loan["porcentaje_interes"]) / 100)
-        monto_intermediario = float(loan["monto_intermediario"])
+        monto_total = loan["monto_total"]
+        ganancia_intereses = Dinero.de(monto_total, loan["moneda"]).porcentaje(loan["porcentaje_interes"]).a_float()
+        monto_intermediario = loan["monto_intermediario"]
         
         return {
             "status": "success",
@@ -643,6 +737,7 @@ def finish_loan(loan_id: int) -> dict:
             "ganancia_intereses": ganancia_intereses,
             "descuento_intermediario": monto_intermediario,
             "monto_recuperado": monto_en_mano,
+            "ganancia_cobrada_en_pagos": ganancia_cobrada,
             "moneda": loan["moneda"],
             "monto_recuperado_usd": monto_en_mano_usd,
             "explicacion": f"Se devolvieron {monto_en_mano} {loan['moneda']} (${monto_en_mano_usd} USD) al saldo - esto son tus ganancias reales"
@@ -650,44 +745,309 @@ def finish_loan(loan_id: int) -> dict:
     except Exception as e:
         return {"status": "error", "error_message": str(e)}
 
-# ---------------- FUNCIONES DE SALDO ACTUAL ---------------- #
+def split_outstanding_balance(loan: dict) -> tuple:
+    """
+    Divide el saldo pendiente de un préstamo en (capital, intereses). Los pagos se
+    imputan en proporción a la deuda total (capital + intereses).
+    """
+    monto_total = float(loan["monto_total"])
+    deuda_total = monto_total * (1 + float(loan["porcentaje_interes"]) / 100)
+    saldo_pendiente = float(loan["saldo_pendiente"])
+    capital = monto_total * saldo_pendiente / deuda_total if deuda_total else 0
+    return round(capital, 2), round(saldo_pendiente - capital, 2)
 
-def get_current_balance() -> dict:
+def add_loan_payment(loan_id: int, monto: float, fecha_pago: Optional[str] = None,
+                     descripcion: Optional[str] = None) -> dict:
     """
-    Obtiene el saldo actual por moneda y total convertido a USD y ARS.
+    Registra un pago parcial de un préstamo activo. En una sola transacción guarda el pago,
+    descuenta el saldo pendiente del préstamo, suma la parte proporcional de la ganancia
+    al saldo actual y, si la deuda queda en cero, finaliza el préstamo.
+    
+    Args:
+        loan_id (int): ID del préstamo
+        monto (float): Monto pagado, en la moneda del préstamo (capital + intereses)
+        fecha_pago (str): Fecha del pago en formato YYYY-MM-DD (por defecto hoy)
+        descripcion (str): Descripción adicional
     """
+    if monto <= 0:
+        return {"status": "error", "error_message": "El monto del pago debe ser mayor a cero"}
+    
+    try:
+        fecha_obj = datetime.datetime.strptime(fecha_pago, "%Y-%m-%d").date() if fecha_pago else datetime.datetime.now().date()
+    except ValueError:
+        return {
+            "status": "error",
+            "error_message": "Formato de fecha inválido. Use YYYY-MM-DD (ej: 2025-09-05)"
+        }
+    
     try:
-        conn = get_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        repo = obtener_repositorio()
+        loan = repo.obtener_prestamo(loan_id, solo_activo=True)
+        if not loan:
+            return {"status": "error", "error_message": f"No se encontró préstamo activo con ID {loan_id}"}
         
-        # Obtener saldo por moneda
-        cur.execute(
-            """
-            SELECT moneda, SUM(monto) as total_por_moneda 
-            FROM saldo_actual 
-            GROUP BY moneda 
-            HAVING SUM(monto) != 0
-            ORDER BY moneda;
-            """
-        )
-        saldos_por_moneda = cur.fetchall()
+        # Si el pago salda la deuda hace falta la cotización de cierre: se pide antes de
+        # bloquear el préstamo para no retenerlo durante la llamada HTTP
+        cotizacion_finalizacion = None
+        if monto >= loan["saldo_pendiente"] - 0.005:
+            cotizacion_finalizacion = get_current_usd_rate(loan["moneda"])
         
-        # También obtener el total en USD (como antes para compatibilidad)
-        cur.execute("SELECT SUM(CASE WHEN moneda = 'USD' THEN monto ELSE 0 END) as total_usd FROM saldo_actual;")
-        total_usd_result = cur.fetchone()
+        with repo.transaccion():
+            loan = repo.obtener_prestamo(loan_id, solo_activo=True, bloquear=True)
+            if not loan:
+                return {"status": "error", "error_message": f"No se encontró préstamo activo con ID {loan_id}"}
+            
+            moneda = loan["moneda"]
+            saldo_pendiente = loan["saldo_pendiente"]
+            if monto > saldo_pendiente + 0.005:
+                return {
+                    "status": "error",
+                    "error_message": f"El pago ({monto} {moneda}) supera el saldo pendiente ({saldo_pendiente:,.2f} {moneda})"
+                }
+            
+            monto_total = loan["monto_total"]
+            deuda_total = monto_total * (1 + loan["porcentaje_interes"] / 100)
+            nuevo_saldo = round(saldo_pendiente - monto, 2)
+            liquidado = nuevo_saldo <= 0.005
+            
+            # Parte del pago que es ganancia propia y parte que es capital
+            ganancia_total = loan["monto_en_mano"]
+            ganancia_cobrada = loan["ganancia_cobrada"]
+            if liquidado:
+                ganancia_pago = round(ganancia_total - ganancia_cobrada, 2)
+                nuevo_saldo = 0
+            else:
+                ganancia_pago = round(ganancia_total * monto / deuda_total, 2)
+            capital_pago = round(monto_total * monto / deuda_total, 2)
+            
+            if not liquidado:
+                cotizacion_finalizacion = None
+            elif cotizacion_finalizacion is None:
+                # Un pago concurrente hizo que este salde la deuda: tasa guardada, sin llamada HTTP
+                tasa = repo.obtener_tasa(moneda, "USD") if moneda != "USD" else {"tasa": 1.0}
+                cotizacion_finalizacion = float(tasa["tasa"]) if tasa else None
+            payment_id = repo.registrar_pago_prestamo(
+                loan_id, monto, fecha_obj, ganancia_pago, descripcion, nuevo_saldo, liquidado,
+                cotizacion_finalizacion
+            )
+            
+            if liquidado:
+                capital_pago, intereses_pago = split_outstanding_balance(loan)
+            else:
+                intereses_pago = round(monto - capital_pago, 2)
+            repo.registrar_exposicion(
+                loan["persona"], moneda, -1 if liquidado else 0,
+                -capital_pago, -intereses_pago, -ganancia_pago
+            )
+            
+            # La ganancia cobrada se suma al saldo actual en la misma transacción
+            monto_usd = 0
+            if ganancia_pago > 0:
+                conversion = convert_to_usd(ganancia_pago, moneda)
+                monto_usd = conversion["monto_usd"] if conversion["status"] == "success" else 0
+                saldo_anterior_usd = repo.saldo_moneda("USD")
+                repo.registrar_movimiento_saldo(
+                    ganancia_pago, moneda,
+                    f"Pago de préstamo: {loan['persona']} - Ganancia: {ganancia_pago} {moneda}",
+                    "pago_prestamo", monto_usd, saldo_anterior_usd
+                )
         
-        cur.close()
-        conn.close()
+        return {
+            "status": "success",
+            "message": "Préstamo saldado y finalizado" if liquidado else "Pago parcial registrado",
+            "payment_id": payment_id,
+            "loan_id": loan_id,
+            "persona": loan["persona"],
+            "moneda": moneda,
+            "monto_pagado": monto,
+            "capital_pagado": capital_pago,
+            "intereses_pagados": intereses_pago,
+            "ganancia_sumada_al_saldo": ganancia_pago,
+            "ganancia_sumada_usd": monto_usd,
+            "saldo_pendiente": nuevo_saldo,
+            "estado": "finalizado" if liquidado else "activo"
+        }
+    except Exception as e:
+        return {"status": "error", "error_message": str(e)}
+
+def list_loan_payments(loan_id: int) -> dict:
+    """
+    Lista los pagos registrados de un préstamo junto con su saldo pendiente.
+    """
+    try:
+        repo = obtener_repositorio()
+        with repo.transaccion():
+            loan = repo.obtener_prestamo(loan_id)
+            if not loan:
+                return {"status": "error", "error_message": f"No se encontró préstamo con ID {loan_id}"}
+            pagos = repo.listar_pagos_prestamo(loan_id)
         
-        total_usd = float(total_usd_result["total_usd"]) if total_usd_result["total_usd"] else 0
+        loan = {k: loan[k] for k in ("persona", "moneda", "monto_total", "saldo_pendiente",
+                                     "ganancia_cobrada", "monto_cobrado", "estado")}
         
-        # Convertir Decimal a float
-        saldos_detallados = []
-        for saldo in saldos_por_moneda:
-            saldos_detallados.append({
-                "moneda": saldo["moneda"],
-                "monto": float(saldo["total_por_moneda"])
+        return {
+            "status": "success",
+            "loan_id": loan_id,
+            "prestamo": loan,
+            "pagos": pagos,
+            "cantidad_pagos": len(pagos)
+        }
+    except Exception as e:
+        return {"status": "error", "error_message": str(e)}
+
+def get_counterparty_exposure(persona: Optional[str] = None) -> dict:
+    """
+    Devuelve cuánto debe cada persona (capital + intereses pendientes) por moneda y
+    el total convertido a USD. Lee el resumen exposicion_contraparte, no los préstamos.
+
+    Args:
+        persona (str, optional): Nombre de la persona. Si se omite, lista todas las
+            personas con préstamos activos.
+    """
+    try:
+        rows = obtener_repositorio().exposicion_contrapartes(persona)
+
+        if persona and not rows:
+            return {"status": "error", "error_message": f"No hay préstamos registrados para {persona}"}
+
+        # Una cotización por moneda presente
+        tasas = {moneda: get_current_usd_rate(moneda) for moneda in {row["moneda"] for row in rows}}
+
+        personas = {}
+        for row in rows:
+            tasa = tasas.get(row["moneda"])
+            monto_activo = row["monto_activo"]
+            intereses = row["intereses_pendientes"]
+            deuda = monto_activo + intereses
+            detalle = personas.setdefault(row["nombre"], {
+                "persona": row["nombre"],
+                "por_moneda": [],
+                "total_adeudado_usd": 0,
+                "monedas_sin_cotizacion": []
             })
+            detalle["por_moneda"].append({
+                "moneda": row["moneda"],
+                "prestamos_activos": row["prestamos_activos"],
+                "capital_activo": monto_activo,
+                "intereses_pendientes": intereses,
+                "total_adeudado": round(deuda, 2),
+                "ganancia_neta_pendiente": row["ganancia_pendiente"],
+                "prestamos_totales": row["prestamos_totales"],
+                "monto_prestado_historico": row["monto_historico"]
+            })
+            if tasa is None:
+                detalle["monedas_sin_cotizacion"].append(row["moneda"])
+            else:
+                detalle["total_adeudado_usd"] = round(detalle["total_adeudado_usd"] + deuda * tasa, 2)
+
+        return {
+            "status": "success",
+            "exposicion": list(personas.values()),
+            "cantidad_personas": len(personas)
+        }
+    except Exception as e:
+        return {"status": "error", "error_message": str(e)}
+
+def get_counterparty_history(persona: str, limite: int = 50) -> dict:
+    """
+    Devuelve los préstamos y transacciones de una persona, más recientes primero.
+
+    Args:
+        persona (str): Nombre de la persona o contraparte
+        limite (int): Máximo de registros por tipo (máximo 200)
+    """
+    if limite <= 0 or limite > 200:
+        limite = 200
+
+    try:
+        # Ambas consultas usan los índices por nombre normalizado
+        prestamos, transacciones = obtener_repositorio().historial_contraparte(persona, limite)
+
+        return {
+            "status": "success",
+            "persona": persona,
+            "prestamos": prestamos,
+            "transacciones": transacciones,
+            "cantidad_prestamos": len(prestamos),
+            "cantidad_transacciones": len(transacciones)
+        }
+    except Exception as e:
+        return {"status": "error", "error_message": str(e)}
+
+# Columnas de agrupación permitidas para el reporte de P&L cambiario
+FX_PNL_GROUPINGS = {
+    "prestamo": ["id", "persona", "moneda", "estado"],
+    "persona": ["persona"],
+    "moneda": ["moneda"],
+    "persona_moneda": ["persona", "moneda"]
+}
+
+def get_fx_pnl_report(agrupar_por: str = "prestamo", estado: str = "todos") -> dict:
+    """
+    Calcula el P&L cambiario de los préstamos comparando la cotización al originar el
+    préstamo (cotizacion_momento) con la del cierre (finalizados) o la de hoy (activos).
+
+    P&L realizado = préstamos finalizados, P&L no realizado = préstamos activos.
+    Todos los montos se expresan en USD.
+
+    Args:
+        agrupar_por (str): 'prestamo', 'persona', 'moneda' o 'persona_moneda'
+        estado (str): 'activo', 'finalizado' o 'todos'
+    """
+    if agrupar_por not in FX_PNL_GROUPINGS:
+        return {
+            "status": "error",
+            "error_message": f"agrupar_por inválido. Opciones: {', '.join(FX_PNL_GROUPINGS)}"
+        }
+    if estado not in ("activo", "finalizado", "todos"):
+        return {"status": "error", "error_message": "estado inválido. Opciones: activo, finalizado, todos"}
+
+    try:
+        repo = obtener_repositorio()
+
+        # Cotización de hoy una sola vez por moneda con préstamos activos
+        monedas = repo.monedas_prestamos_activos()
+        tasas_hoy = {moneda: get_current_usd_rate(moneda) for moneda in monedas}
+        tasas_hoy = {moneda: tasa for moneda, tasa in tasas_hoy.items() if tasa is not None}
+
+        columnas_grupo = FX_PNL_GROUPINGS[agrupar_por]
+        filas, sin_cotizacion = repo.pnl_cambiario(columnas_grupo, estado, tasas_hoy)
+
+        columnas = columnas_grupo + [
+            "cantidad", "prestado_usd_origen", "prestado_usd_cierre",
+            "pnl_realizado_usd", "pnl_no_realizado_usd", "ganancia_intereses_usd"
+        ]
+
+        idx_realizado = columnas.index("pnl_realizado_usd")
+        idx_no_realizado = columnas.index("pnl_no_realizado_usd")
+        idx_ganancia = columnas.index("ganancia_intereses_usd")
+
+        return {
+            "status": "success",
+            "agrupado_por": agrupar_por,
+            "columnas": columnas,
+            "filas": filas,
+            "totales": {
+                "pnl_realizado_usd": round(sum(f[idx_realizado] for f in filas), 2),
+                "pnl_no_realizado_usd": round(sum(f[idx_no_realizado] for f in filas), 2),
+                "ganancia_intereses_usd": round(sum(f[idx_ganancia] for f in filas), 2)
+            },
+            "prestamos_sin_cotizacion": sin_cotizacion,
+            "cotizaciones_hoy_usd": tasas_hoy
+        }
+    except Exception as e:
+        return {"status": "error", "error_message": str(e)}
+
+# ---------------- FUNCIONES DE SALDO ACTUAL ---------------- #
+
+def get_current_balance() -> dict:
+    """
+    Obtiene el saldo actual por moneda y total convertido a USD y ARS.
+    """
+    try:
+        # Saldo por moneda (el total en USD se mantiene para compatibilidad)
+        saldos_detallados = obtener_repositorio().saldos_por_moneda()
+        total_usd = next((s["monto"] for s in saldos_detallados if s["moneda"] == "USD"), 0)
         
         return {
             "status": "success",
@@ -708,45 +1068,22 @@ def add_to_current_balance(monto: float, moneda: str, descripcion: str, tipo_ope
             moneda = 'ARS'
         moneda = moneda.upper()
         
-        conn = get_connection()
-        cur = conn.cursor()
-        
-        # Obtener saldo anterior (solo para el historial, calculado en USD para compatibilidad)
-        balance_result = get_current_balance()
-        saldo_anterior_usd = balance_result.get("saldo_actual_usd", 0) if balance_result["status"] == "success" else 0
-        
-        # Añadir al saldo en la moneda original
-        cur.execute(
-            """
-            INSERT INTO saldo_actual (monto, moneda, descripcion, updated_at)
-            VALUES (%s, %s, %s, NOW());
-            """,
-            (monto, moneda, descripcion)
-        )
-        
-        # Convertir el monto a USD para el historial
-        if moneda == "USD":
-            monto_usd = monto
-        else:
-            conversion = convert_to_usd(monto, moneda)
-            monto_usd = conversion["monto_usd"] if conversion["status"] == "success" else 0
-        
-        # Calcular nuevo saldo en USD (para el historial)
-        saldo_nuevo_usd = saldo_anterior_usd + monto_usd
-        
-        # Registrar en historial (en USD para compatibilidad)
-        cur.execute(
-            """
-            INSERT INTO historial_saldo (tipo_operacion, monto_operacion, saldo_anterior, 
-                                       saldo_nuevo, descripcion)
-            VALUES (%s, %s, %s, %s, %s);
-            """,
-            (tipo_operacion, monto_usd, saldo_anterior_usd, saldo_nuevo_usd, f"{descripcion} ({monto} {moneda})")
-        )
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+        repo = obtener_repositorio()
+        with repo.transaccion():
+            # Saldo anterior (solo para el historial, en USD para compatibilidad), del rollup diario
+            saldo_anterior_usd = repo.saldo_moneda("USD")
+            
+            # Convertir el monto a USD para el historial
+            if moneda == "USD":
+                monto_usd = monto
+            else:
+                conversion = convert_to_usd(monto, moneda)
+                monto_usd = conversion["monto_usd"] if conversion["status"] == "success" else 0
+            
+            # Añadir al saldo en la moneda original y registrar en historial (en USD para compatibilidad)
+            saldo_nuevo_usd = repo.registrar_movimiento_saldo(
+                monto, moneda, descripcion, tipo_operacion, monto_usd, saldo_anterior_usd
+            )
         
         return {
             "status": "success",
@@ -760,7 +1097,8 @@ def add_to_current_balance(monto: float, moneda: str, descripcion: str, tipo_ope
     except Exception as e:
         return {"status": "error", "error_message": str(e)}
 
-def subtract_from_current_balance(monto: float, moneda: str, descripcion: str, tipo_operacion: str = "gasto") -> dict:
+def subtract_from_current_balance(monto: float, moneda: str, descripcion: str, tipo_operacion: str = "gasto",
+                                  categoria: Optional[str] = None) -> dict:
     """
     Resta dinero del saldo actual en la moneda especificada.
     """
@@ -770,53 +1108,31 @@ def subtract_from_current_balance(monto: float, moneda: str, descripcion: str, t
             moneda = 'ARS'
         moneda = moneda.upper()
         
-        conn = get_connection()
-        cur = conn.cursor()
-        
-        # Obtener saldo anterior
-        balance_result = get_current_balance()
-        saldo_anterior_usd = balance_result.get("saldo_actual_usd", 0) if balance_result["status"] == "success" else 0
-        
-        # Convertir el monto a USD para verificar si hay suficiente saldo
-        if moneda == "USD":
-            monto_usd = monto
-        else:
-            conversion = convert_to_usd(monto, moneda)
-            if conversion["status"] == "error":
-                return conversion
-            monto_usd = conversion["monto_usd"]
-        
-        if saldo_anterior_usd < monto_usd:
-            return {
-                "status": "error",
-                "error_message": f"Saldo insuficiente. Saldo actual: ${saldo_anterior_usd:.2f} USD, Intento de gasto: {monto} {moneda} (${monto_usd:.2f} USD)"
-            }
-        
-        # Restar del saldo en la moneda original
-        cur.execute(
-            """
-            INSERT INTO saldo_actual (monto, moneda, descripcion, updated_at)
-            VALUES (%s, %s, %s, NOW());
-            """,
-            (-monto, moneda, descripcion)
-        )
-        
-        # Calcular nuevo saldo en USD (para el historial)
-        saldo_nuevo_usd = saldo_anterior_usd - monto_usd
-        
-        # Registrar en historial
-        cur.execute(
-            """
-            INSERT INTO historial_saldo (tipo_operacion, monto_operacion, saldo_anterior, 
-                                       saldo_nuevo, descripcion)
-            VALUES (%s, %s, %s, %s, %s);
-            """,
-            (tipo_operacion, monto_usd, saldo_anterior_usd, saldo_nuevo_usd, f"{descripcion} ({monto} {moneda})")
-        )
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+        repo = obtener_repositorio()
+        with repo.transaccion():
+            # Obtener saldo anterior (con el libro bloqueado hasta registrar el gasto)
+            repo.bloquear_saldo()
+            saldo_anterior_usd = repo.saldo_moneda("USD")
+            
+            # Convertir el monto a USD para verificar si hay suficiente saldo
+            if moneda == "USD":
+                monto_usd = monto
+            else:
+                conversion = convert_to_usd(monto, moneda)
+                if conversion["status"] == "error":
+                    return conversion
+                monto_usd = conversion["monto_usd"]
+            
+            if saldo_anterior_usd < monto_usd:
+                return {
+                    "status": "error",
+                    "error_message": f"Saldo insuficiente. Saldo actual: ${saldo_anterior_usd:.2f} USD, Intento de gasto: {monto} {moneda} (${monto_usd:.2f} USD)"
+                }
+            
+            # Restar del saldo en la moneda original y registrar en historial
+            saldo_nuevo_usd = repo.registrar_movimiento_saldo(
+                -monto, moneda, descripcion, tipo_operacion, monto_usd, saldo_anterior_usd, categoria
+            )
         
         return {
             "status": "success",
@@ -830,57 +1146,339 @@ def subtract_from_current_balance(monto: float, moneda: str, descripcion: str, t
     except Exception as e:
         return {"status": "error", "error_message": str(e)}
 
-def add_expense(monto: float, moneda: str, descripcion: str) -> dict:
+def add_expense(monto: float, moneda: str, descripcion: str, categoria: Optional[str] = None) -> dict:
     """
-    Registra un gasto y lo descuenta del saldo actual en la moneda especificada.
+    Registra un gasto y lo descuenta del saldo actual en la moneda especificada. Actualiza
+    las estadísticas de la categoría y avisa si el gasto es inusual o supera el presupuesto.
+
+    Args:
+        monto (float): cantidad gastada.
+        moneda (str): moneda del gasto ('pesos' = ARS).
+        descripcion (str): en qué se gastó.
+        categoria (str, optional): categoría del gasto (ej: 'supermercado', 'transporte').
+            Por defecto se deduce de la descripción ('general' si no hay palabras clave).
     """
     try:
         # Normalizar moneda
         if moneda.lower() in ['pesos', 'peso', 'ars']:
             moneda = 'ARS'
         
-        # Descontar del saldo
-        result = subtract_from_current_balance(
-            monto, 
-            moneda,
-            f"Gasto: {descripcion} - {monto} {moneda.upper()}", 
-            "gasto"
-        )
+        repo = obtener_repositorio()
+        categoria = (estadisticas_gasto.normalizar_categoria(categoria) if categoria
+                     else repo.categorizador.categorizar(descripcion, "gasto"))
+        with repo.transaccion():
+            # Descontar del saldo
+            result = subtract_from_current_balance(
+                monto, 
+                moneda,
+                f"Gasto: {descripcion} - {monto} {moneda.upper()}", 
+                "gasto",
+                categoria
+            )
+            if result["status"] != "success":
+                return result
+            # Estadísticas de la categoría en la misma transacción que el gasto
+            evaluacion = estadisticas_gasto.registrar_gastos(
+                repo, [{"categoria": categoria, "monto_usd": result.get("monto_usd_equivalente", 0)}]
+            )[0]
         
-        if result["status"] == "success":
-            return {
-                "status": "success",
-                "message": f"Gasto registrado y descontado del saldo",
-                "monto_original": monto,
-                "moneda": moneda.upper(),
-                "monto_usd_equivalente": result.get("monto_usd_equivalente", 0),
-                "saldo_anterior_usd": result.get("saldo_anterior_usd", 0),
-                "saldo_nuevo_usd": result.get("saldo_nuevo_usd", 0),
-                "descripcion": descripcion
-            }
-        else:
-            return result
+        return {
+            "status": "success",
+            "message": f"Gasto registrado y descontado del saldo",
+            "monto_original": monto,
+            "moneda": moneda.upper(),
+            "monto_usd_equivalente": result.get("monto_usd_equivalente", 0),
+            "saldo_anterior_usd": result.get("saldo_anterior_usd", 0),
+            "saldo_nuevo_usd": result.get("saldo_nuevo_usd", 0),
+            "descripcion": descripcion,
+            **evaluacion
+        }
     except Exception as e:
         return {"status": "error", "error_message": str(e)}
 
-def check_for_monthly_money_update() -> dict:
+def set_category_budget(categoria: str, limite: Optional[float] = None, moneda: str = "USD",
+                        periodo: str = "mensual") -> dict:
     """
-    Verifica si es día 10 del mes y pregunta si hay dinero nuevo.
+    Fija (o quita) el presupuesto de una categoría de gastos. Cada gasto de la categoría
+    avisa al llegar al 80% del presupuesto y al excederlo.
+
+    Args:
+        categoria (str): categoría de gastos (ej: 'supermercado').
+        limite (float, optional): tope del período en la moneda indicada. Si se omite, se quita el presupuesto.
+        moneda (str): moneda del límite ('pesos' = ARS); se guarda convertido a USD.
+        periodo (str): 'mensual' (por defecto) o 'semanal'.
     """
     try:
-        today = datetime.datetime.now()
-        if today.day == 10:
-            return {
-                "status": "success",
-                "should_ask": True,
-                "message": "Es día 10 del mes. ¿Tienes dinero nuevo este mes para añadir al saldo?"
-            }
+        categoria = estadisticas_gasto.normalizar_categoria(categoria)
+        repo = obtener_repositorio()
+        if limite is None:
+            if not repo.eliminar_presupuesto(categoria):
+                return {"status": "error", "error_message": f"La categoría '{categoria}' no tiene presupuesto"}
+            return {"status": "success", "message": f"Presupuesto de '{categoria}' eliminado"}
+
+        periodo = periodo.lower()
+        if periodo not in estadisticas_gasto.PERIODOS_PRESUPUESTO:
+            return {"status": "error",
+                    "error_message": f"Período inválido: '{periodo}'. Opciones: {', '.join(estadisticas_gasto.PERIODOS_PRESUPUESTO)}"}
+        if limite <= 0:
+            return {"status": "error", "error_message": "El límite debe ser mayor a cero"}
+
+        if moneda.lower() in ['pesos', 'peso', 'ars']:
+            moneda = 'ARS'
+        moneda = moneda.upper()
+        if moneda == "USD":
+            limite_usd = limite
         else:
-            return {
-                "status": "success",
-                "should_ask": False,
-                "message": f"Hoy es día {today.day}. Solo pregunto por dinero nuevo los días 10."
-            }
+            conversion = convert_to_usd(limite, moneda)
+            if conversion["status"] == "error":
+                return conversion
+            limite_usd = conversion["monto_usd"]
+
+        repo.fijar_presupuesto(categoria, limite_usd, periodo)
+        return {
+            "status": "success",
+            "message": f"Presupuesto {periodo} de '{categoria}': {limite} {moneda} (${limite_usd:.2f} USD)",
+            "categoria": categoria,
+            "limite_usd": limite_usd,
+            "periodo": periodo
+        }
+    except Exception as e:
+        return {"status": "error", "error_message": str(e)}
+
+def get_category_stats(categoria: Optional[str] = None) -> dict:
+    """
+    Estadísticas de gasto por categoría: cantidad, media y desvío por gasto, máximo, gasto
+    de los últimos 7 y 30 días, de la semana y del mes, y el uso del presupuesto.
+
+    Args:
+        categoria (str, optional): una sola categoría; por defecto, todas.
+    """
+    try:
+        repo = obtener_repositorio()
+        hoy = datetime.date.today()
+        desde = min(hoy - datetime.timedelta(days=29), hoy.replace(day=1))
+        with repo.transaccion():
+            filas = repo.listar_estadisticas_categorias()
+            if categoria:
+                categoria = estadisticas_gasto.normalizar_categoria(categoria)
+                filas = [f for f in filas if f["categoria"] == categoria]
+                if not filas:
+                    return {"status": "error", "error_message": f"No hay gastos ni presupuesto para '{categoria}'"}
+            categorias = [
+                estadisticas_gasto.resumen_categoria(f, repo.gasto_categoria_por_dia(f["categoria"], desde), hoy)
+                for f in filas
+            ]
+        return {"status": "success", "categorias": categorias, "total": len(categorias)}
+    except Exception as e:
+        return {"status": "error", "error_message": str(e)}
+
+def get_spending_by_category(desde: Optional[str] = None, hasta: Optional[str] = None,
+                             por_mes: bool = False) -> dict:
+    """
+    Gastos del saldo agrupados por categoría (y moneda), con el total de cada categoría en
+    USD a la cotización guardada. Sirve para '¿en qué gasté este mes?'.
+
+    Args:
+        desde (str, optional): fecha inicial YYYY-MM-DD (por defecto, el primer día del mes actual).
+        hasta (str, optional): fecha final YYYY-MM-DD, inclusive (por defecto, hoy).
+        por_mes (bool): si es True, desglosa además por mes.
+    """
+    try:
+        hoy = datetime.date.today()
+        try:
+            desde_fecha = datetime.date.fromisoformat(desde) if desde else hoy.replace(day=1)
+            hasta_fecha = datetime.date.fromisoformat(hasta) if hasta else hoy
+        except ValueError:
+            return {"status": "error", "error_message": "Formato de fecha inválido. Use YYYY-MM-DD"}
+
+        repo = obtener_repositorio()
+        rows = [r for r in repo.reporte_categorias_saldo(desde_fecha, hasta_fecha, por_mes) if r["gastos"]]
+
+        tasas = {"USD": 1.0}
+        for moneda in {r["moneda"] for r in rows} - set(tasas):
+            tasa = repo.obtener_tasa(moneda, "USD")
+            tasas[moneda] = float(tasa["tasa"]) if tasa else None
+
+        columnas = (["mes"] if por_mes else []) + ["categoria", "moneda", "gastos", "gastos_usd", "cantidad"]
+        filas, totales = [], {}
+        for row in rows:
+            tasa = tasas[row["moneda"]]
+            gastos_usd = round(float(row["gastos"]) * tasa, 2) if tasa is not None else None
+            filas.append(([str(row["mes"])[:7]] if por_mes else []) +
+                         [row["categoria"], row["moneda"], float(row["gastos"]), gastos_usd, row["cantidad_gastos"]])
+            if gastos_usd is not None:
+                totales[row["categoria"]] = round(totales.get(row["categoria"], 0) + gastos_usd, 2)
+
+        return {
+            "status": "success",
+            "desde": desde_fecha.isoformat(),
+            "hasta": hasta_fecha.isoformat(),
+            "columnas": columnas,
+            "filas": filas,
+            "total_usd_por_categoria": dict(sorted(totales.items(), key=lambda t: -t[1])),
+            "monedas_sin_tasa": sorted(m for m, t in tasas.items() if t is None)
+        }
+    except Exception as e:
+        return {"status": "error", "error_message": str(e)}
+
+def add_category_rule(palabras: str, categoria: str) -> dict:
+    """
+    Enseña una categoría: las descripciones que contengan alguna de las palabras o frases
+    (separadas por coma) se categorizan así, con prioridad sobre el diccionario base.
+    Afecta a los movimientos nuevos; para los anteriores usar recategorize_ledger(todas=True).
+
+    Args:
+        palabras (str): palabras o frases clave, separadas por coma (ej: 'la anonima, granja').
+        categoria (str): categoría a asignar (ej: 'supermercado').
+    """
+    try:
+        patrones = [p.strip() for p in palabras.split(",") if categorizacion.normalizar_texto(p).strip()]
+        if not patrones:
+            return {"status": "error", "error_message": "No se recibieron palabras clave"}
+        categoria = estadisticas_gasto.normalizar_categoria(categoria)
+        repo = obtener_repositorio()
+        with repo.transaccion():
+            ids = [repo.crear_regla_categoria(patron, categoria) for patron in patrones]
+        return {
+            "status": "success",
+            "message": f"{len(ids)} regla(s) para '{categoria}'",
+            "regla_ids": ids,
+            "categoria": categoria
+        }
+    except Exception as e:
+        return {"status": "error", "error_message": str(e)}
+
+def list_category_rules() -> dict:
+    """Lista las reglas de categorías del usuario y las categorías del diccionario base."""
+    try:
+        reglas = obtener_repositorio().listar_reglas_categoria()
+        return {
+            "status": "success",
+            "reglas": reglas,
+            "total": len(reglas),
+            "categorias_base": sorted(categorizacion.DICCIONARIO)
+        }
+    except Exception as e:
+        return {"status": "error", "error_message": str(e)}
+
+def delete_category_rule(rule_id: int) -> dict:
+    """
+    Elimina una regla de categoría del usuario.
+
+    Args:
+        rule_id (int): id de la regla (ver list_category_rules).
+    """
+    try:
+        if not obtener_repositorio().eliminar_regla_categoria(rule_id):
+            return {"status": "error", "error_message": f"No existe la regla {rule_id}"}
+        return {"status": "success", "message": f"Regla {rule_id} eliminada"}
+    except Exception as e:
+        return {"status": "error", "error_message": str(e)}
+
+def recategorize_ledger(todas: bool = False) -> dict:
+    """
+    Categoriza en una pasada los movimientos del libro (transacciones y saldo) que no tienen
+    categoría. Con todas=True recategoriza todo, por ejemplo después de agregar reglas.
+
+    Args:
+        todas (bool): recategorizar también los que ya tienen categoría.
+    """
+    try:
+        resultado = categorizacion.rellenar(obtener_repositorio(), todas)
+        return {
+            "status": "success",
+            "message": f"{sum(t['filas'] for t in resultado.values())} movimiento(s) revisados, "
+                       f"{sum(t['actualizadas'] for t in resultado.values())} con categoría nueva",
+            "tablas": resultado
+        }
+    except Exception as e:
+        return {"status": "error", "error_message": str(e)}
+
+def add_recurring_rule(tipo: str, monto: float, moneda: str, descripcion: str, frecuencia: str = "mensual",
+                       dia: Optional[int] = None, desde: Optional[str] = None) -> dict:
+    """
+    Crea una regla de ingreso o gasto recurrente (sueldo, alquiler, suscripciones). Los
+    movimientos se generan solos en cada vencimiento; no hace falta cargarlos a mano.
+
+    Args:
+        tipo (str): 'ingreso', 'gasto' o 'dinero_nuevo_mes'.
+        monto (float): cantidad en la moneda indicada.
+        moneda (str): moneda del movimiento ('pesos' = ARS).
+        descripcion (str): concepto (ej: 'Sueldo', 'Alquiler').
+        frecuencia (str): 'mensual' (por defecto), 'semanal' o 'anual'.
+        dia (int, optional): día del mes (1-31) o de la semana (0 = lunes) en que vence.
+            Por defecto el de `desde`.
+        desde (str, optional): fecha YYYY-MM-DD a partir de la cual aplica (por defecto hoy).
+            Si es pasada, se generan también los vencimientos atrasados.
+    """
+    try:
+        tipo = tipo.lower()
+        frecuencia = frecuencia.lower()
+        if moneda.lower() in ['pesos', 'peso', 'ars']:
+            moneda = 'ARS'
+        moneda = moneda.upper()
+
+        if tipo not in recurrentes.TIPOS:
+            return {"status": "error", "error_message": f"Tipo inválido: '{tipo}'. Opciones: {', '.join(recurrentes.TIPOS)}"}
+        if frecuencia not in recurrentes.FRECUENCIAS:
+            return {"status": "error",
+                    "error_message": f"Frecuencia inválida: '{frecuencia}'. Opciones: {', '.join(recurrentes.FRECUENCIAS)}"}
+        if monto <= 0:
+            return {"status": "error", "error_message": "El monto debe ser mayor a cero"}
+        if not descripcion:
+            return {"status": "error", "error_message": "Falta la descripción"}
+
+        inicio = datetime.date.fromisoformat(desde) if desde else datetime.date.today()
+        if dia is None:
+            dia = inicio.weekday() if frecuencia == "semanal" else inicio.day
+        if frecuencia == "semanal" and not 0 <= dia <= 6:
+            return {"status": "error", "error_message": "Para reglas semanales el día va de 0 (lunes) a 6 (domingo)"}
+        if frecuencia != "semanal" and not 1 <= dia <= 31:
+            return {"status": "error", "error_message": "El día del mes debe estar entre 1 y 31"}
+
+        repo = obtener_repositorio()
+        proxima = recurrentes.primera_fecha(frecuencia, dia, inicio)
+        regla_id = repo.crear_regla_recurrente(tipo, monto, moneda, descripcion, frecuencia, dia, proxima.isoformat())
+
+        resultado = {
+            "status": "success",
+            "message": f"Regla recurrente creada: {descripcion} ({tipo}, {monto} {moneda}, {frecuencia})",
+            "regla_id": regla_id,
+            "proxima_fecha": proxima.isoformat()
+        }
+        # Lo que ya venció (hoy o atrasado) se genera en el momento, sin esperar al programador
+        if proxima <= datetime.date.today():
+            aplicacion = recurrentes.aplicar_vencidas(repo)
+            resultado["aplicados"] = [a for a in aplicacion["aplicados"] if a["regla_id"] == regla_id]
+            resultado["pendientes"] = [p for p in aplicacion["pendientes"] if p["regla_id"] == regla_id]
+        return resultado
+    except Exception as e:
+        return {"status": "error", "error_message": str(e)}
+
+def list_recurring_rules(incluir_inactivas: bool = False) -> dict:
+    """
+    Lista las reglas de ingresos y gastos recurrentes con su próximo vencimiento.
+
+    Args:
+        incluir_inactivas (bool): incluir también las reglas canceladas.
+    """
+    try:
+        reglas = obtener_repositorio().listar_reglas_recurrentes(incluir_inactivas)
+        return {"status": "success", "reglas": reglas, "total": len(reglas)}
+    except Exception as e:
+        return {"status": "error", "error_message": str(e)}
+
+def cancel_recurring_rule(rule_id: int) -> dict:
+    """
+    Cancela una regla recurrente: deja de generar movimientos (los ya generados no se tocan).
+
+    Args:
+        rule_id (int): id de la regla (ver list_recurring_rules).
+    """
+    try:
+        if not obtener_repositorio().desactivar_regla_recurrente(rule_id):
+            return {"status": "error", "error_message": f"No existe una regla activa con id {rule_id}"}
+        return {"status": "success", "message": f"Regla recurrente {rule_id} cancelada"}
     except Exception as e:
         return {"status": "error", "error_message": str(e)}
 
@@ -940,16 +1538,156 @@ def add_money_to_balance(monto: float, moneda: str, descripcion: Optional[str] =
     except Exception as e:
         return {"status": "error", "error_message": str(e)}
 
+# Operaciones de batch_operations: tipo -> (signo, tipo_operacion del historial, descripción por defecto)
+BATCH_OPERATIONS = {
+    "gasto": (-1, "gasto", "Gasto: {descripcion} - {monto} {moneda}"),
+    "ingreso": (1, "dinero_añadido", "Dinero añadido al saldo - {monto} {moneda}"),
+    "dinero_nuevo_mes": (1, "dinero_nuevo_mes", "Dinero nuevo del mes - {monto} {moneda}"),
+}
+
+def batch_operations(operaciones: list[dict], atomico: bool = False) -> dict:
+    """
+    Aplica varias operaciones de saldo en una sola transacción. Equivale a llamar
+    add_expense / add_money_to_balance / add_monthly_money una por una, pero lee el
+    saldo una sola vez e inserta todos los movimientos juntos.
+
+    Args:
+        operaciones (list): cada una con tipo ('gasto', 'ingreso' o 'dinero_nuevo_mes'),
+            monto, moneda, descripcion (obligatoria para gastos) y, en gastos, categoria opcional.
+            Ej: [{"tipo": "gasto", "monto": 500, "moneda": "ARS", "descripcion": "comida", "categoria": "supermercado"}]
+        atomico (bool): si es True, un error en cualquier operación cancela todas.
+    """
+    try:
+        if not operaciones:
+            return {"status": "error", "error_message": "No se recibieron operaciones"}
+
+        repo = obtener_repositorio()
+        with repo.transaccion():
+            # Una sola lectura del saldo (en USD para el historial, igual que las herramientas individuales),
+            # con el libro bloqueado hasta registrar los movimientos
+            repo.bloquear_saldo()
+            saldo_usd = repo.saldo_moneda("USD")
+            tasas = {"USD": 1.0}
+            resultados = []
+            movimientos = []
+            gastos = []
+
+            for indice, operacion in enumerate(operaciones):
+                tipo = str(operacion.get("tipo", "")).lower()
+                monto = operacion.get("monto")
+                moneda = str(operacion.get("moneda") or "")
+                descripcion = operacion.get("descripcion")
+
+                if moneda.lower() in ['pesos', 'peso', 'ars']:
+                    moneda = 'ARS'
+                moneda = moneda.upper()
+
+                error = None
+                if tipo not in BATCH_OPERATIONS:
+                    error = f"Tipo inválido: '{tipo}'. Opciones: {', '.join(BATCH_OPERATIONS)}"
+                elif not isinstance(monto, (int, float)) or isinstance(monto, bool) or monto <= 0:
+                    error = "El monto debe ser un número mayor a cero"
+                elif not moneda:
+                    error = "Falta la moneda"
+                elif tipo == "gasto" and not descripcion:
+                    error = "Los gastos necesitan una descripción"
+
+                # Cotización a USD, consultada una vez por moneda
+                if error is None and moneda not in tasas:
+                    tasa = get_exchange_rate(moneda, "USD")
+                    tasas[moneda] = tasa["tasa"] if tasa["status"] == "success" else None
+                if error is None and tasas[moneda] is None:
+                    if tipo == "gasto":
+                        error = f"No se encontró tasa para {moneda}/USD"
+
+                if error is None:
+                    signo, tipo_operacion, plantilla = BATCH_OPERATIONS[tipo]
+                    monto_usd = (Dinero.de(monto, moneda).convertir(tasas[moneda], "USD").a_float()
+                                 if tasas[moneda] is not None else 0)
+                    if signo < 0 and saldo_usd < monto_usd:
+                        error = (f"Saldo insuficiente. Saldo actual: ${saldo_usd:.2f} USD, "
+                                 f"Intento de gasto: {monto} {moneda} (${monto_usd:.2f} USD)")
+
+                if error is not None:
+                    resultados.append({"indice": indice, "status": "error", "tipo": tipo, "error_message": error})
+                    continue
+
+                # Misma descripción que dejan las herramientas individuales
+                desc = (descripcion if tipo != "gasto" and descripcion
+                        else plantilla.format(descripcion=descripcion, monto=monto, moneda=moneda))
+                saldo_nuevo_usd = saldo_usd + signo * monto_usd
+                # Sin categoría, los gastos se categorizan acá (para sus estadísticas) y el resto al insertar
+                categoria = operacion.get("categoria")
+                if categoria:
+                    categoria = estadisticas_gasto.normalizar_categoria(categoria)
+                elif tipo == "gasto":
+                    categoria = repo.categorizador.categorizar(descripcion, "gasto")
+                movimientos.append({
+                    "monto": signo * monto, "moneda": moneda, "descripcion": desc,
+                    "tipo_operacion": tipo_operacion, "monto_usd": monto_usd,
+                    "saldo_anterior_usd": saldo_usd, "saldo_nuevo_usd": saldo_nuevo_usd,
+                    "categoria": categoria
+                })
+                resultados.append({
+                    "indice": indice,
+                    "status": "success",
+                    "tipo": tipo,
+                    "monto": monto,
+                    "moneda": moneda,
+                    "monto_usd_equivalente": monto_usd,
+                    "saldo_anterior_usd": saldo_usd,
+                    "saldo_nuevo_usd": saldo_nuevo_usd,
+                    "descripcion": desc
+                })
+                if tipo == "gasto":
+                    gastos.append((resultados[-1], {"categoria": categoria, "monto_usd": monto_usd}))
+                # El saldo en USD solo cambia con movimientos en USD (como al leerlo de nuevo)
+                if moneda == "USD":
+                    saldo_usd = saldo_nuevo_usd
+
+            fallidas = sum(1 for r in resultados if r["status"] == "error")
+            if atomico and fallidas:
+                return {
+                    "status": "error",
+                    "error_message": f"{fallidas} operación(es) con error; no se aplicó ninguna (modo atómico)",
+                    "resultados": resultados
+                }
+
+            if not movimientos:
+                return {
+                    "status": "error",
+                    "error_message": "Ninguna operación pudo aplicarse",
+                    "resultados": resultados
+                }
+            repo.registrar_movimientos_saldo(movimientos)
+            evaluaciones = estadisticas_gasto.registrar_gastos(repo, [gasto for _, gasto in gastos])
+            for (resultado, _), evaluacion in zip(gastos, evaluaciones):
+                resultado.update(evaluacion)
+
+        return {
+            "status": "success",
+            "message": f"{len(movimientos)} de {len(operaciones)} operación(es) aplicadas",
+            "aplicadas": len(movimientos),
+            "fallidas": fallidas,
+            "resultados": resultados,
+            "saldo_actualizado": "Usa get_total_money() para ver el saldo completo"
+        }
+    except Exception as e:
+        return {"status": "error", "error_message": str(e)}
+
 # ---------------- FUNCIÓN DE RESUMEN TOTAL ---------------- #
 
-def get_total_money() -> dict:
+def get_total_money(compacto: bool = False) -> dict:
     """
     Calcula el saldo base total mostrando detalle por moneda original y convertido a ARS y USD.
     SALDO BASE = dinero que tienes trabajando + dinero disponible
+
+    Args:
+        compacto (bool): devuelve solo los totales numéricos y el saldo por moneda, sin textos.
     """
     try:
-        # Obtener préstamos activos
-        loans_result = list_loans("activo")
+        # Obtener préstamos activos (solo se usan los totales: no hace falta armar explicaciones)
+        loans_result = list_loans("activo", compacto=True)
         if loans_result["status"] == "error":
             return loans_result
         
@@ -969,9 +1707,10 @@ def get_total_money() -> dict:
             ars_por_usd = cotizacion_result["cotizacion_original"]  # ej: 1362.33 ARS = 1 USD
             usd_por_ars = cotizacion_result["cotizacion_usd"]       # ej: 1 ARS = 0.000734 USD
             
-            # Convertir todo el saldo disponible a ambas monedas
-            saldo_total_usd = 0
-            saldo_total_ars = 0
+            # Convertir todo el saldo disponible a ambas monedas (en centavos exactos)
+            tasa_ars = como_fraccion(float(ars_por_usd))
+            saldo_usd = Dinero(0, "USD")
+            saldo_ars = Dinero(0, "ARS")
             detalle_saldos = []
             
             for saldo in saldos_por_moneda:
@@ -979,33 +1718,51 @@ def get_total_money() -> dict:
                 monto = saldo["monto"]
                 
                 if moneda == "USD":
-                    monto_usd = monto
-                    monto_ars = monto * ars_por_usd
+                    monto_usd = Dinero.de(monto, "USD")
+                    monto_ars = monto_usd.convertir(tasa_ars, "ARS")
                 elif moneda == "ARS":
-                    monto_usd = monto * usd_por_ars
-                    monto_ars = monto
+                    monto_ars = Dinero.de(monto, "ARS")
+                    monto_usd = monto_ars.convertir(1 / tasa_ars, "USD")
                 else:
                     # Convertir otras monedas
                     conversion = convert_to_usd(monto, moneda)
-                    monto_usd = conversion["monto_usd"] if conversion["status"] == "success" else 0
-                    monto_ars = monto_usd * ars_por_usd
+                    monto_usd = Dinero.de(conversion["monto_usd"] if conversion["status"] == "success" else 0, "USD")
+                    monto_ars = monto_usd.convertir(tasa_ars, "ARS")
                 
-                saldo_total_usd += monto_usd
-                saldo_total_ars += monto_ars
+                saldo_usd += monto_usd
+                saldo_ars += monto_ars
                 
                 detalle_saldos.append({
                     "moneda_original": moneda,
                     "monto_original": monto,
-                    "equivalente_ars": round(monto_ars, 2),
-                    "equivalente_usd": round(monto_usd, 2)
+                    "equivalente_ars": monto_ars.a_float(),
+                    "equivalente_usd": monto_usd.a_float()
                 })
             
-            # Convertir préstamos a ARS
-            total_prestado_ars = total_prestado_usd * ars_por_usd
+            saldo_total_usd = saldo_usd.a_float()
+            saldo_total_ars = saldo_ars.a_float()
+            
+            # Préstamos en ARS (convertidos en list_loans con la misma cotización)
+            total_prestado_ars = loans_result.get("totales_convertidos", {}).get("total_prestado_ars", 0)
             
             # Totales generales
-            saldo_base_total_usd = total_prestado_usd + saldo_total_usd
-            saldo_base_total_ars = total_prestado_ars + saldo_total_ars
+            saldo_base_total_usd = (Dinero.de(total_prestado_usd, "USD") + saldo_usd).a_float()
+            saldo_base_total_ars = (Dinero.de(total_prestado_ars, "ARS") + saldo_ars).a_float()
+            
+            if compacto:
+                return {
+                    "status": "success",
+                    "fecha_cotizacion": fecha_hoy,
+                    "ars_por_usd": ars_por_usd,
+                    "prestado_ars": round(total_prestado_ars, 2),
+                    "disponible_ars": round(saldo_total_ars, 2),
+                    "total_ars": round(saldo_base_total_ars, 2),
+                    "prestado_usd": total_prestado_usd,
+                    "disponible_usd": round(saldo_total_usd, 2),
+                    "total_usd": round(saldo_base_total_usd, 2),
+                    "saldos_por_moneda": {d["moneda_original"]: d["monto_original"] for d in detalle_saldos},
+                    "prestamos_activos": loans_result.get("cantidad_prestamos", 0)
+                }
             
             return {
                 "status": "success",
@@ -1065,46 +1822,252 @@ def get_total_money() -> dict:
     except Exception as e:
         return {"status": "error", "error_message": str(e)}
 
-def get_balance_history(limit: int = 20) -> dict:
+def get_balance_history(limit: int = 20, compacto: bool = False, campos: Optional[str] = None) -> dict:
     """
     Obtiene el historial de cambios del saldo.
+
+    Args:
+        limit (int): cantidad de registros.
+        compacto (bool): devuelve columnas + filas sin las descripciones.
+        campos (str, optional): campos a incluir, separados por coma.
     """
     try:
-        conn = get_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        
-        cur.execute(
-            """
-            SELECT * FROM historial_saldo 
-            ORDER BY fecha_operacion DESC 
-            LIMIT %s;
-            """,
-            (limit,)
-        )
-        
-        history = cur.fetchall()
-        cur.close()
-        conn.close()
-        
-        # Convertir decimales y fechas
-        for record in history:
-            for k, v in record.items():
-                if isinstance(v, decimal.Decimal):
-                    record[k] = float(v)
-                elif isinstance(v, (datetime.date, datetime.datetime)):
-                    record[k] = v.isoformat()
+        history = obtener_repositorio().historial_saldo(limit)
         
         return {
             "status": "success",
-            "historial": history,
+            **formatear_filas(history, "historial", campos, compacto, COMPACT_FIELDS["historial"]),
             "cantidad_registros": len(history)
         }
     except Exception as e:
         return {"status": "error", "error_message": str(e)}
 
+def get_net_worth_history(dias: int = 730, intervalo: str = "mes") -> dict:
+    """
+    Devuelve la evolución del saldo disponible valuado en USD con la cotización
+    histórica de cada día. Lee del rollup diario (saldo_diario), no de saldo_actual.
+
+    Args:
+        dias (int): Cuántos días hacia atrás (por defecto 730 = dos años)
+        intervalo (str): 'dia', 'semana' o 'mes'
+    """
+    if intervalo not in INTERVALOS_PATRIMONIO:
+        return {"status": "error", "error_message": "intervalo inválido. Opciones: dia, semana, mes"}
+    if dias <= 0 or dias > 3650:
+        return {"status": "error", "error_message": "dias debe estar entre 1 y 3650"}
+
+    try:
+        desde = datetime.datetime.now().date() - datetime.timedelta(days=dias)
+        rows = obtener_repositorio().serie_patrimonio(desde, intervalo)
+
+        filas = []
+        for fecha, patrimonio_usd, patrimonio_ars, variacion_usd, monedas_sin_tasa in rows:
+            filas.append([
+                fecha,
+                round(float(patrimonio_usd or 0), 2),
+                round(float(patrimonio_ars), 2) if patrimonio_ars is not None else None,
+                round(float(variacion_usd), 2) if variacion_usd is not None else None,
+                monedas_sin_tasa
+            ])
+
+        return {
+            "status": "success",
+            "intervalo": intervalo,
+            "desde": desde.isoformat(),
+            "columnas": ["fecha", "patrimonio_usd", "patrimonio_ars", "variacion_usd", "monedas_sin_tasa"],
+            "filas": filas,
+            "explicacion": "Saldo disponible al cierre de cada fecha valuado con la cotización de ese día (sin préstamos)"
+        }
+    except Exception as e:
+        return {"status": "error", "error_message": str(e)}
+
+def rebuild_daily_balances() -> dict:
+    """
+    Reconstruye el rollup diario (saldo_diario) desde saldo_actual.
+    Solo hace falta si el rollup quedó desincronizado (por ejemplo, ediciones manuales).
+    """
+    try:
+        filas = obtener_repositorio().reconstruir_saldo_diario()
+
+        return {
+            "status": "success",
+            "message": "Rollup diario reconstruido",
+            "filas_generadas": filas
+        }
+    except Exception as e:
+        return {"status": "error", "error_message": str(e)}
+
+def reconcile_ledger(completa: bool = False, sellar: bool = False) -> dict:
+    """
+    Verifica que saldo_actual e historial_saldo registren los mismos movimientos comparando
+    sumas de control por bloques de 1000 filas; solo los bloques que difieren se revisan
+    fila por fila. Con completa=True también detecta filas editadas o borradas por fuera
+    del asistente (recalcula las sumas de cada tabla).
+
+    Args:
+        completa (bool): recalcular las sumas de control de todas las tablas del libro.
+        sellar (bool): aceptar el estado actual como correcto (vincula el historial anterior
+            y vuelve a sellar los bloques). Solo si el usuario lo pide.
+    """
+    try:
+        repositorio = obtener_repositorio()
+        resultado = {"status": "success"}
+        if sellar:
+            resultado["sellado"] = conciliacion.sellar(repositorio)
+        resultado.update(conciliacion.conciliar(repositorio, completa or sellar))
+        resultado["message"] = (
+            "El libro está conciliado" if resultado["consistente"] else
+            f"{resultado['total_diferencias']} diferencia(s) entre saldo e historial, "
+            f"{resultado['total_bloques_alterados']} bloque(s) alterado(s)"
+        )
+        return resultado
+    except Exception as e:
+        return {"status": "error", "error_message": str(e)}
+
+# ---------------- SIMULACIÓN DE ESCENARIOS CAMBIARIOS ---------------- #
+
+def simulate_fx_scenarios(horizonte_dias: int = 180, n_simulaciones: int = 10000,
+                          devaluacion_anual: float = 0.30, volatilidad_anual: float = 0.25,
+                          semilla: int = 42) -> dict:
+    """
+    Simula miles de caminos del tipo de cambio ARS/USD sobre los préstamos activos y el
+    saldo actual, y reporta percentiles del patrimonio final en USD y ARS.
+
+    Args:
+        horizonte_dias (int): Días a simular (máximo 730)
+        n_simulaciones (int): Cantidad de caminos (máximo 100000)
+        devaluacion_anual (float): Devaluación anual esperada del peso (0.30 = 30%)
+        volatilidad_anual (float): Volatilidad anual del tipo de cambio (0.25 = 25%)
+        semilla (int): Semilla para que el resultado sea reproducible
+    """
+    if horizonte_dias <= 0 or horizonte_dias > 730:
+        return {"status": "error", "error_message": "horizonte_dias debe estar entre 1 y 730"}
+    if n_simulaciones <= 0 or n_simulaciones > 100000:
+        return {"status": "error", "error_message": "n_simulaciones debe estar entre 1 y 100000"}
+    if volatilidad_anual < 0 or devaluacion_anual <= -1:
+        return {"status": "error", "error_message": "Parámetros de devaluación o volatilidad inválidos"}
+
+    try:
+        # Foto agregada de la posición: préstamos activos y saldo por moneda
+        posiciones = obtener_repositorio().posiciones_por_moneda()
+
+        fecha_hoy = datetime.datetime.now().date().isoformat()
+        cotizacion_ars = get_current_exchange_rate_from_api("ARS", fecha_hoy)
+        if cotizacion_ars["status"] != "success":
+            return cotizacion_ars
+        ars_por_usd = cotizacion_ars["cotizacion_original"]
+
+        # Todo lo que no es ARS se valúa en USD a la tasa actual
+        usd_fijo = 0.0
+        monedas_sin_tasa = []
+        for moneda, monto in posiciones.items():
+            if moneda == "ARS":
+                continue
+            conversion = convert_to_usd(monto, moneda)
+            if conversion["status"] == "success":
+                usd_fijo += conversion["monto_usd"]
+            else:
+                monedas_sin_tasa.append(moneda)
+        ars = posiciones.get("ARS", 0.0)
+
+        inicio = datetime.datetime.now()
+        distribucion = simular_escenarios_fx(
+            round(usd_fijo, 2), round(ars, 2), ars_por_usd, horizonte_dias,
+            n_simulaciones, devaluacion_anual, volatilidad_anual, semilla
+        )
+        duracion_ms = (datetime.datetime.now() - inicio).total_seconds() * 1000
+
+        result = {
+            "status": "success",
+            "fecha_cotizacion": fecha_hoy,
+            "cotizacion_inicial": f"1 USD = {ars_por_usd:,.2f} ARS",
+            "posicion": {
+                "ars": round(ars, 2),
+                "usd_equivalente_otras_monedas": round(usd_fijo, 2),
+                "por_moneda": posiciones
+            },
+            "parametros": {
+                "horizonte_dias": horizonte_dias,
+                "n_simulaciones": n_simulaciones,
+                "devaluacion_anual": devaluacion_anual,
+                "volatilidad_anual": volatilidad_anual,
+                "semilla": semilla
+            },
+            "distribucion": distribucion,
+            "duracion_ms": round(duracion_ms, 2),
+            "explicacion": "Préstamos activos (monto prestado) + saldo actual; sin intereses pendientes"
+        }
+        if monedas_sin_tasa:
+            result["monedas_excluidas"] = monedas_sin_tasa
+        return result
+    except Exception as e:
+        return {"status": "error", "error_message": str(e)}
+
+
+# ---------------- DIAGNÓSTICO ---------------- #
+
+QUERY_STATS_ORDERS = ("total_ms", "max_ms", "promedio_ms", "llamadas", "lentas")
+
+def get_query_stats(ordenar_por: str = "total_ms", limite: int = 10, reiniciar: bool = False) -> dict:
+    """
+    Estadísticas de las consultas a la base desde que arrancó el proceso: llamadas,
+    tiempo total/promedio/máximo, filas, cuántas fueron lentas y qué herramientas las usan.
+    También la latencia de los mensajes resueltos sin modelo (atajos) frente a los que usaron el modelo.
+
+    Args:
+        ordenar_por (str): total_ms, max_ms, promedio_ms, llamadas o lentas.
+        limite (int): cantidad de consultas a devolver.
+        reiniciar (bool): borra las estadísticas después de devolverlas.
+    """
+    try:
+        if ordenar_por not in QUERY_STATS_ORDERS:
+            return {
+                "status": "error",
+                "error_message": f"ordenar_por inválido. Opciones: {', '.join(QUERY_STATS_ORDERS)}"
+            }
+        consultas = estadisticas.resumen(ordenar_por, max(1, limite))
+        resumen_atajos = atajos.estadisticas.resumen()
+        if reiniciar:
+            estadisticas.reiniciar()
+            atajos.estadisticas.reiniciar()
+        resultado = {
+            "status": "success",
+            "ordenado_por": ordenar_por,
+            "umbral_lenta_ms": UMBRAL_LENTA_MS,
+            "consultas": consultas,
+            "cantidad": len(consultas),
+            "caches": cache.estadisticas(),
+            "atajos": resumen_atajos
+        }
+        lecturas = obtener_repositorio().estadisticas_lectura()
+        if lecturas is not None:
+            resultado["lecturas"] = lecturas
+        return resultado
+    except Exception as e:
+        return {"status": "error", "error_message": str(e)}
+
 
 # ---------------- AGENTE ---------------- #
 
+def preparar_herramienta(tool):
+    """
+    Instrumenta la herramienta (sus consultas se registran con su nombre), le da un plazo (al
+    vencer se cancela lo que esté corriendo y devuelve un timeout estructurado) y, si no
+    escribe, la marca para leer de la réplica.
+    """
+    if tool.__name__ in READ_ONLY_TOOLS:
+        tool = solo_lectura(tool)
+    return instrumentar_herramienta(plazos.con_plazo(tool, TOOL_DEADLINES.get(tool.__name__)))
+
+
+def atender_sin_modelo(callback_context):
+    """
+    Resuelve las frases frecuentes ('gasté 500 pesos en comida', 'cuánta plata tengo') con
+    las herramientas del agente, sin pasar por el modelo (atajos.py).
+    """
+    return atajos.antes_del_agente(callback_context, {tool.__name__: tool for tool in root_agent.tools})
+
+
 root_agent = Agent(
     name="finance_agent",
     model="gemini-2.0-flash",
@@ -1158,20 +2121,83 @@ root_agent = Agent(
         "- % neto tuyo: 10% - 5% = 5%\n"
         "- Tu ganancia: 400,000 × 5% = 20,000 ARS = $25 USD\n"
         "- Intermediario: 400,000 × 5% = 20,000 ARS = $25 USD\n\n"
+        "🧾 VARIAS OPERACIONES EN UN MENSAJE:\n"
+        "- Si el usuario menciona varios gastos o ingresos juntos ('gasté 500 en comida, 1200 de alquiler y cobré 3000'),\n"
+        "  usar UNA llamada a batch_operations con todas las operaciones en lugar de varias llamadas\n"
+        "- Informar el resultado de cada operación (algunas pueden fallar, p. ej. por saldo insuficiente)\n\n"
+        "🛒 CATEGORÍAS Y PRESUPUESTOS:\n"
+        "- Los gastos se categorizan solos por su descripción; indicar categoria solo si el usuario la dice\n"
+        "- Para '¿en qué gasté este mes?' usar get_spending_by_category; por mes, get_period_report(por_categoria=True)\n"
+        "- Si el usuario corrige una categoría ('la anónima es supermercado'), usar add_category_rule\n"
+        "  y ofrecer recategorize_ledger(todas=True) para aplicarla a lo anterior\n"
+        "- Si el resultado trae alertas (gasto inusual, presupuesto cerca del límite o excedido), mostrarlas\n"
+        "- Para fijar un tope por categoría usar set_category_budget; para ver gastos por categoría, get_category_stats\n\n"
+        "🔁 INGRESOS Y GASTOS RECURRENTES:\n"
+        "- Sueldo, alquiler, suscripciones y el dinero nuevo de cada mes se cargan UNA vez con add_recurring_rule\n"
+        "  (ej: 'cobro 1,500,000 pesos el 10 de cada mes' → tipo='dinero_nuevo_mes', dia=10)\n"
+        "- Los movimientos se generan solos en cada vencimiento: NO preguntar por dinero nuevo ni cargarlos a mano\n"
+        "- Para verlas usar list_recurring_rules; para darlas de baja, cancel_recurring_rule\n"
+        "- Si un gasto recurrente queda pendiente (saldo insuficiente), avisar al usuario\n\n"
+        "📦 RESPUESTAS COMPACTAS:\n"
+        "- Con libros grandes o cuando solo se necesitan números, usar compacto=True en list_loans, list_transactions,\n"
+        "  search_transactions, get_balance_history y get_total_money (devuelven columnas + filas, sin textos)\n"
+        "- Para pedir solo algunos campos usar campos='id,persona,saldo_pendiente'\n\n"
+        "🔎 BÚSQUEDA:\n"
+        "- Para 'todos los pagos a Juan' o 'todo lo del alquiler' usar search_transactions\n"
+        "- Si hay más páginas, ofrecer ver la siguiente (parámetro pagina)\n\n"
+        "🗓️ REPORTES POR PERÍODO:\n"
+        "- Para ingresos, gastos y balance por mes usar get_period_report (formato de mes YYYY-MM)\n\n"
+        "📉 EVOLUCIÓN DEL PATRIMONIO:\n"
+        "- Para '¿cómo evolucionó mi plata?' usar get_net_worth_history (por defecto 2 años, por mes)\n\n"
+        "💵 PAGOS PARCIALES:\n"
+        "- Si la persona devuelve una parte, usar add_loan_payment (capital + intereses, en la moneda del préstamo)\n"
+        "- La ganancia proporcional se suma al saldo; al llegar a cero el préstamo se finaliza solo\n\n"
+        "👤 DEUDA POR PERSONA:\n"
+        "- Para '¿cuánto me debe Pedro?' usar get_counterparty_exposure (todas las monedas + total USD)\n"
+        "- Para el historial con una persona usar get_counterparty_history\n\n"
+        "💱 P&L CAMBIARIO:\n"
+        "- Para saber cuánto se ganó o perdió por tipo de cambio en préstamos, usar get_fx_pnl_report\n"
+        "- Realizado = préstamos finalizados, no realizado = préstamos activos (cotización de hoy)\n\n"
+        "🎲 ESCENARIOS CAMBIARIOS:\n"
+        "- Si preguntan cómo afectaría una devaluación, usar simulate_fx_scenarios\n"
+        "- Mostrar mediana y percentiles 5/95 del patrimonio en USD y ARS\n\n"
+        "⏱️ TIEMPO LÍMITE:\n"
+        "- Si una herramienta devuelve error_type='timeout', avisar que la operación se canceló\n"
+        "  y ofrecer reintentar (por ejemplo, con un rango o límite menor)\n\n"
+        "🩺 DIAGNÓSTICO:\n"
+        "- Si preguntan qué consultas son lentas o por qué una herramienta tarda, usar get_query_stats\n"
+        "- Si el saldo no cierra con el historial o se editó la base a mano, usar reconcile_ledger(completa=True)\n"
+        "  y mostrar las diferencias; usar sellar=True solo si el usuario confirma que el estado actual es correcto\n\n"
         "IMPORTANTE: NO incluir intereses en saldo base hasta que se cobren manualmente."
     ),
-    tools=[
+    tools=[preparar_herramienta(tool) for tool in [
         # Herramientas originales
-        add_transaction, get_balance, list_transactions, get_today_date,
+        add_transaction, get_balance, get_period_report, list_transactions, search_transactions,
+        get_today_date,
         # Tasas de cambio y cotizaciones automáticas
         update_exchange_rate, get_exchange_rate, convert_to_usd,
         get_current_exchange_rate_from_api, save_exchange_rate_from_api,
         # Préstamos
-        add_loan, list_loans, finish_loan,
+        add_loan, list_loans, finish_loan, add_loan_payment, list_loan_payments, get_fx_pnl_report,
+        get_counterparty_exposure, get_counterparty_history,
         # Saldo actual
         get_current_balance, add_to_current_balance, subtract_from_current_balance,
-        add_expense, check_for_monthly_money_update, add_monthly_money, add_money_to_balance,
+        add_expense, add_monthly_money, add_money_to_balance, batch_operations,
+        # Estadísticas y presupuestos por categoría
+        set_category_budget, get_category_stats,
+        # Categorización automática
+        get_spending_by_category, add_category_rule, list_category_rules, delete_category_rule,
+        recategorize_ledger,
+        # Ingresos y gastos recurrentes
+        add_recurring_rule, list_recurring_rules, cancel_recurring_rule,
         # Resumen y historial
-        get_total_money, get_balance_history
-    ],
+        get_total_money, get_balance_history, get_net_worth_history, rebuild_daily_balances,
+        reconcile_ledger,
+        # Simulación de escenarios
+        simulate_fx_scenarios,
+        # Diagnóstico
+        get_query_stats
+    ]],
+    before_agent_callback=atender_sin_modelo,
+    after_agent_callback=atajos.despues_del_agente,
 )
\ No newline at end of file
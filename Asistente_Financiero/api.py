@@ -0,0 +1,236 @@
+# API REST de las herramientas financieras: las mismas funciones del agente, sin modelo en el medio
+import hashlib
+import inspect
+import json
+import os
+import secrets
+import time
+from typing import Any, Optional
+
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, create_model
+
+from .agent import READ_ONLY_TOOLS, root_agent
+from .repositorio import obtener_repositorio
+
+# Si está definido, cada pedido debe traer "Authorization: Bearer <FINANZAS_API_TOKEN>"
+TOKEN = os.environ.get("FINANZAS_API_TOKEN") or None
+MAX_LLAMADAS_LOTE = 100
+
+# Herramientas ya preparadas (instrumentación, plazo y réplica de lectura), igual que en el agente
+HERRAMIENTAS = {tool.__name__: tool for tool in root_agent.tools}
+
+
+def _modelo_argumentos(herramienta) -> type:
+    """Modelo pydantic con los parámetros de la herramienta (tipos y valores por defecto de su firma)."""
+    campos = {
+        nombre: (parametro.annotation, ... if parametro.default is inspect.Parameter.empty else parametro.default)
+        for nombre, parametro in inspect.signature(herramienta).parameters.items()
+    }
+    return create_model(f"{herramienta.__name__}_argumentos", __config__=ConfigDict(extra="forbid"), **campos)
+
+
+MODELOS = {nombre: _modelo_argumentos(herramienta) for nombre, herramienta in HERRAMIENTAS.items()}
+
+
+def codigo_http(resultado: dict) -> int:
+    """Código HTTP del resultado de una herramienta: los errores de plazo son 504, el resto 400."""
+    if not isinstance(resultado, dict) or resultado.get("status") != "error":
+        return 200
+    return 504 if resultado.get("error_type") == "timeout" else 400
+
+
+def _json(datos) -> bytes:
+    return json.dumps(datos, ensure_ascii=False, default=str, separators=(",", ":")).encode("utf-8")
+
+
+def _etag(cuerpo: bytes) -> str:
+    return f'"{hashlib.blake2b(cuerpo, digest_size=16).hexdigest()}"'
+
+
+def _coincide_etag(encabezado: Optional[str], etag: str) -> bool:
+    """If-None-Match: lista de etags (débiles o no) o '*'."""
+    if not encabezado:
+        return False
+    candidatos = [e.strip().removeprefix("W/") for e in encabezado.split(",")]
+    return "*" in candidatos or etag in candidatos
+
+
+def _ejecutar(nombre: str, argumentos: dict) -> tuple:
+    """Llama a la herramienta y devuelve (resultado, milisegundos)."""
+    inicio = time.perf_counter()
+    try:
+        resultado = HERRAMIENTAS[nombre](**argumentos)
+    except Exception as e:
+        resultado = {"status": "error", "error_message": str(e)}
+    return resultado, (time.perf_counter() - inicio) * 1000
+
+
+def _respuesta(nombre: str, resultado: dict, milisegundos: float, request: Optional[Request] = None) -> Response:
+    """
+    Respuesta JSON con Server-Timing. Las lecturas llevan ETag: si el cliente ya tiene esa
+    versión (If-None-Match) vuelve 304 sin cuerpo.
+    """
+    cuerpo = _json(resultado)
+    encabezados = {"Server-Timing": f"{nombre};dur={milisegundos:.1f}"}
+    if request is not None:
+        etag = _etag(cuerpo)
+        encabezados.update({"ETag": etag, "Cache-Control": "no-cache"})
+        if codigo_http(resultado) == 200 and _coincide_etag(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=encabezados)
+    return Response(cuerpo, status_code=codigo_http(resultado), media_type="application/json", headers=encabezados)
+
+
+def verificar_token(credenciales: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False))):
+    if TOKEN is None:
+        return
+    if credenciales is None or not secrets.compare_digest(credenciales.credentials, TOKEN):
+        raise HTTPException(status_code=401, detail="Token inválido o ausente",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+
+app = FastAPI(
+    title="Asistente Financiero",
+    description="Herramientas del asistente financiero como endpoints HTTP, sin el modelo. "
+                "Las de solo lectura son GET (con ETag); las que escriben, POST.",
+    dependencies=[Depends(verificar_token)],
+)
+
+
+def _endpoint_lectura(nombre: str, herramienta):
+    """GET con los parámetros de la herramienta como query string."""
+    def endpoint(request: Request, **argumentos):
+        resultado, milisegundos = _ejecutar(nombre, argumentos)
+        return _respuesta(nombre, resultado, milisegundos, request)
+
+    parametros = [inspect.Parameter("request", inspect.Parameter.KEYWORD_ONLY, annotation=Request)]
+    parametros += [p.replace(kind=inspect.Parameter.KEYWORD_ONLY)
+                   for p in inspect.signature(herramienta).parameters.values()]
+    endpoint.__signature__ = inspect.Signature(parametros)
+    return endpoint
+
+
+def _endpoint_escritura(nombre: str, modelo: type):
+    """POST con los parámetros de la herramienta en el cuerpo JSON."""
+    if not modelo.model_fields:
+        def endpoint():
+            resultado, milisegundos = _ejecutar(nombre, {})
+            return _respuesta(nombre, resultado, milisegundos)
+        return endpoint
+
+    def endpoint(argumentos):
+        resultado, milisegundos = _ejecutar(nombre, argumentos.model_dump())
+        return _respuesta(nombre, resultado, milisegundos)
+
+    endpoint.__signature__ = inspect.Signature(
+        [inspect.Parameter("argumentos", inspect.Parameter.POSITIONAL_OR_KEYWORD, annotation=modelo)]
+    )
+    return endpoint
+
+
+for _nombre, _herramienta in HERRAMIENTAS.items():
+    _resumen = (inspect.getdoc(_herramienta) or "").split("\n\n")[0]
+    if _nombre in READ_ONLY_TOOLS:
+        app.add_api_route(f"/api/{_nombre}", _endpoint_lectura(_nombre, _herramienta), methods=["GET"],
+                          name=_nombre, summary=_nombre, description=_resumen, tags=["lectura"])
+    else:
+        app.add_api_route(f"/api/{_nombre}", _endpoint_escritura(_nombre, MODELOS[_nombre]), methods=["POST"],
+                          name=_nombre, summary=_nombre, description=_resumen, tags=["escritura"])
+
+
+# ---------------- Lotes ---------------- #
+
+class Llamada(BaseModel):
+    herramienta: str
+    argumentos: dict[str, Any] = Field(default_factory=dict)
+
+
+class Lote(BaseModel):
+    llamadas: list[Llamada] = Field(min_length=1, max_length=MAX_LLAMADAS_LOTE)
+    atomico: bool = False
+
+
+class _LoteFallido(Exception):
+    """Corta un lote atómico: la transacción que lo envuelve se deshace."""
+
+
+@app.post("/api/batch", tags=["lotes"])
+def batch(lote: Lote) -> Response:
+    """
+    Varias llamadas en un solo pedido, ejecutadas en orden y con los resultados en el mismo
+    orden. Los argumentos se validan todos antes de ejecutar nada. Con atomico=True corren
+    dentro de una transacción: la primera que falla deshace todas y las siguientes no se ejecutan.
+    """
+    inicio = time.perf_counter()
+    validadas, errores = [], []
+    for indice, llamada in enumerate(lote.llamadas):
+        if llamada.herramienta not in HERRAMIENTAS:
+            errores.append({"indice": indice, "error_message": f"Herramienta desconocida: {llamada.herramienta}"})
+            continue
+        try:
+            validadas.append((llamada.herramienta, MODELOS[llamada.herramienta](**llamada.argumentos).model_dump()))
+        except ValidationError as e:
+            errores.append({"indice": indice, "errores": e.errors(include_url=False, include_input=False)})
+    if errores:
+        raise HTTPException(status_code=422, detail=errores)
+
+    resultados = [None] * len(validadas)
+    if lote.atomico:
+        try:
+            with obtener_repositorio().transaccion():
+                for indice, (nombre, argumentos) in enumerate(validadas):
+                    resultados[indice] = _ejecutar(nombre, argumentos)
+                    if codigo_http(resultados[indice][0]) != 200:
+                        raise _LoteFallido()
+        except _LoteFallido:
+            pass
+    else:
+        resultados = [_ejecutar(nombre, argumentos) for nombre, argumentos in validadas]
+
+    salida = [
+        {"indice": indice, "herramienta": nombre, "status_code": codigo_http(r[0]), "ms": round(r[1], 1), "resultado": r[0]}
+        if r is not None else
+        {"indice": indice, "herramienta": nombre, "status_code": 424, "resultado": None}
+        for indice, ((nombre, _), r) in enumerate(zip(validadas, resultados))
+    ]
+    fallidas = sum(1 for s in salida if s["status_code"] != 200)
+    cuerpo = {
+        "status": "success" if not fallidas else "error",
+        "llamadas": len(salida),
+        "fallidas": fallidas,
+        "deshecho": bool(lote.atomico and fallidas),
+        "resultados": salida,
+    }
+    milisegundos = (time.perf_counter() - inicio) * 1000
+    return Response(_json(cuerpo), status_code=200 if not (lote.atomico and fallidas) else 409,
+                    media_type="application/json", headers={"Server-Timing": f"batch;dur={milisegundos:.1f}"})
+
+
+@app.get("/api", tags=["lectura"])
+def herramientas() -> dict:
+    """Herramientas disponibles, con su método HTTP."""
+    return {
+        "herramientas": [
+            {"nombre": nombre, "metodo": "GET" if nombre in READ_ONLY_TOOLS else "POST", "ruta": f"/api/{nombre}"}
+            for nombre in HERRAMIENTAS
+        ],
+        "lotes": "/api/batch"
+    }
+
+
+if __name__ == "__main__":
+    # python -m Asistente_Financiero.api [--host 0.0.0.0] [--port 8001]
+    import argparse
+
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="API REST de las herramientas financieras")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+    # Sin token, cualquiera que llegue al puerto puede usar las herramientas que escriben
+    if TOKEN is None and args.host not in ("127.0.0.1", "localhost", "::1"):
+        parser.error(f"FINANZAS_API_TOKEN es obligatorio para escuchar en {args.host}")
+    uvicorn.run("Asistente_Financiero.api:app", host=args.host, port=args.port, workers=args.workers)
@@ -0,0 +1,430 @@
+# Atajos sin modelo: frases financieras frecuentes resueltas con reglas antes de llamar a Gemini
+import collections
+import datetime
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Optional
+
+from google.genai import types
+
+# FINANZAS_ATAJOS=0 manda todos los mensajes al modelo
+ACTIVOS = os.environ.get("FINANZAS_ATAJOS", "1") != "0"
+
+# Alias de monedas (sin tildes, en minúscula). '$' solo no alcanza: puede ser ARS o USD.
+ALIAS_MONEDAS = {
+    "pesos": "ARS", "peso": "ARS", "ars": "ARS",
+    "dolares": "USD", "dolar": "USD", "usd": "USD", "u$s": "USD", "us$": "USD", "u$d": "USD",
+    "euros": "EUR", "euro": "EUR", "eur": "EUR",
+    "reales": "BRL", "real": "BRL", "brl": "BRL",
+}
+
+MESES = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6, "julio": 7,
+    "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12,
+}
+
+MULTIPLICADORES = {"k": 1_000, "mil": 1_000, "millon": 1_000_000, "millones": 1_000_000}
+
+_MONEDA = "|".join(re.escape(a) for a in sorted(ALIAS_MONEDAS, key=len, reverse=True))
+_NUMERO = r"\d+(?:[.,]\d+)*"
+# Importe: "500 pesos", "1.500,50 ars", "2 mil pesos", "usd 300", "u$s 1k"
+_IMPORTE = (rf"(?:(?P<monto>{_NUMERO})\s*(?P<multiplicador>k|mil|millones|millon)?\s*(?:de\s+)?(?P<moneda>{_MONEDA})"
+            rf"|(?P<moneda_antes>{_MONEDA})\s*(?P<monto_despues>{_NUMERO})\s*(?P<multiplicador_despues>k|mil|millones|millon)?)")
+_FECHA = (r"(?:hoy|ayer|anteayer|antes de ayer|\d{4}-\d{1,2}-\d{1,2}|\d{1,2}[/-]\d{1,2}(?:[/-]\d{2,4})?"
+          rf"|\d{{1,2}} de (?:{'|'.join(MESES)})(?: (?:de )?\d{{4}})?)")
+
+FRASE_GASTO = re.compile(
+    rf"(?:gaste|pague|compre|me gaste)\s+{_IMPORTE}\s+(?:en|de|por|para)\s+(?P<descripcion>.+)"
+)
+FRASE_INGRESO = re.compile(
+    rf"(?:cobre|recibi|ingrese|me pagaron|me depositaron|me entraron)\s+{_IMPORTE}"
+    rf"(?:\s+(?:de|por|del)\s+(?P<descripcion>.+))?"
+)
+# Gastos e ingresos se registran con la fecha de hoy: si la frase nombra una fecha, va al modelo
+_MENCIONA_FECHA = re.compile(
+    rf"\b(?:{_FECHA}|anoche|mañana|pasado|lunes|martes|miercoles|jueves|viernes|sabado|domingo"
+    rf"|semana|mes|{'|'.join(MESES)})\b"
+)
+FRASE_SALDO = re.compile(
+    r"(?:cuant[oa]s?\s+(?:plata|dinero|guita)\s+(?:tengo|me queda|hay)|cuanto tengo|"
+    r"(?:cual es\s+|ver\s+|mostrame\s+)?mi\s+saldo(?:\s+total)?|saldo(?:\s+total)?)"
+    r"(?:\s+(?:en total|ahora|hoy|en este momento))?"
+)
+FRASE_PRESTAMO = re.compile(
+    rf"(?:le\s+)?preste\s+{_IMPORTE}\s+a\s+(?P<persona>[a-zñ]+(?:\s+[a-zñ]+){{0,3}}?)"
+    rf"\s+al\s+(?P<interes>\d+(?:[.,]\d+)?)\s*%(?P<resto>.*)"
+)
+# Lo que puede seguir al interés de un préstamo: fecha e intermediario, en cualquier orden
+_RESTO_FECHA = re.compile(rf"(?:,|\by\b)?\s*(?:el\s+|del\s+|con fecha\s+)?(?P<fecha>{_FECHA})")
+_RESTO_INTERMEDIARIO = re.compile(
+    r"(?:,|\by\b)?\s*(?:(?P<sin>sin intermediario)"
+    r"|con\s+(?:un\s+)?intermediario\s+(?:del|de|al)\s+(?P<pct>\d+(?:[.,]\d+)?)\s*%"
+    r"|con\s+(?:un\s+)?(?P<pct2>\d+(?:[.,]\d+)?)\s*%\s+(?:de|para el|del|al)\s+intermediario)"
+)
+
+
+def normalizar(texto: str) -> str:
+    """
+    Minúsculas y sin tildes, carácter por carácter: el resultado tiene el mismo largo que el
+    texto, así que las posiciones de una coincidencia sirven para recortar el original.
+    """
+    def sin_tilde(caracter: str) -> str:
+        caracter = caracter.lower()[:1]
+        if caracter.isascii() or caracter == "ñ":
+            return caracter
+        # NFKD separa la tilde de la letra: queda la letra
+        return unicodedata.normalize("NFKD", caracter)[0]
+
+    return "".join(sin_tilde(c) for c in texto)
+
+
+def parsear_monto(numero: str, multiplicador: Optional[str] = None) -> Optional[float]:
+    """
+    Importe escrito a la argentina ('1.500,50', '1.500.000') o a la inglesa ('1,500.50').
+    Devuelve None si es ambiguo: '1,500' puede ser 1.5 o 1500.
+    """
+    puntos, comas = numero.count("."), numero.count(",")
+    if puntos and comas:
+        # El último separador es el decimal
+        miles, decimal = (".", ",") if numero.rfind(",") > numero.rfind(".") else (",", ".")
+        entero, fraccion = numero.rsplit(decimal, 1)
+        if numero.count(decimal) > 1 or not all(len(g) == 3 for g in entero.split(miles)[1:]):
+            return None
+        valor = float(entero.replace(miles, "") + "." + fraccion)
+    elif puntos or comas:
+        separador = "." if puntos else ","
+        grupos = numero.split(separador)
+        if len(grupos) > 2 or len(grupos[-1]) == 3:
+            # Miles: todos los grupos de 3 ('1.500', '1.500.000'); '1,500' queda ambiguo
+            if not all(len(g) == 3 for g in grupos[1:]) or (separador == "," and len(grupos) == 2):
+                return None
+            valor = float("".join(grupos))
+        else:
+            valor = float(grupos[0] + "." + grupos[1])
+    else:
+        valor = float(numero)
+    return round(valor * MULTIPLICADORES.get(multiplicador or "", 1), 2)
+
+
+def parsear_fecha(texto: str, hoy: Optional[datetime.date] = None) -> Optional[str]:
+    """Fecha en YYYY-MM-DD desde 'hoy', 'ayer', '2025-09-01', '5/9', '5/9/2025' o '5 de septiembre'."""
+    hoy = hoy or datetime.date.today()
+    texto = texto.strip()
+    relativas = {"hoy": 0, "ayer": 1, "anteayer": 2, "antes de ayer": 2}
+    if texto in relativas:
+        return (hoy - datetime.timedelta(days=relativas[texto])).isoformat()
+    try:
+        if re.fullmatch(r"\d{4}-\d{1,2}-\d{1,2}", texto):
+            anio, mes, dia = (int(p) for p in texto.split("-"))
+        elif partes := re.fullmatch(r"(\d{1,2})[/-](\d{1,2})(?:[/-](\d{2,4}))?", texto):
+            dia, mes = int(partes[1]), int(partes[2])
+            anio = int(partes[3]) if partes[3] else hoy.year
+            anio += 2000 if anio < 100 else 0
+        elif partes := re.fullmatch(r"(\d{1,2}) de ([a-z]+)(?: (?:de )?(\d{4}))?", texto):
+            dia, mes = int(partes[1]), MESES[partes[2]]
+            anio = int(partes[3]) if partes[3] else hoy.year
+        else:
+            return None
+        return datetime.date(anio, mes, dia).isoformat()
+    except (ValueError, KeyError):
+        return None
+
+
+def _importe(coincidencia) -> Optional[tuple]:
+    """(monto, moneda ISO) del grupo de importe de una frase."""
+    if coincidencia["monto"] is not None:
+        monto = parsear_monto(coincidencia["monto"], coincidencia["multiplicador"])
+        moneda = coincidencia["moneda"]
+    else:
+        monto = parsear_monto(coincidencia["monto_despues"], coincidencia["multiplicador_despues"])
+        moneda = coincidencia["moneda_antes"]
+    if monto is None or monto <= 0:
+        return None
+    return monto, ALIAS_MONEDAS[moneda]
+
+
+def _porcentaje(texto: str) -> float:
+    return float(texto.replace(",", "."))
+
+
+def _resto_prestamo(resto: str, hoy: Optional[datetime.date]) -> Optional[dict]:
+    """
+    Fecha e intermediario que siguen al interés de un préstamo. Los dos son obligatorios (el
+    agente siempre los pide): el intermediario, como 'sin intermediario' o con su %. Si falta
+    alguno o queda texto que no se reconoce, la frase no es segura.
+    """
+    datos = {}
+    resto = resto.strip(" ,.")
+    while resto:
+        if "fecha_prestamo" not in datos and (parte := _RESTO_FECHA.match(resto)):
+            datos["fecha_prestamo"] = parsear_fecha(parte["fecha"], hoy)
+            if datos["fecha_prestamo"] is None:
+                return None
+        elif "tiene_intermediario" not in datos and (parte := _RESTO_INTERMEDIARIO.match(resto)):
+            porcentaje = parte["pct"] or parte["pct2"]
+            datos["tiene_intermediario"] = porcentaje is not None
+            if porcentaje is not None:
+                datos["porcentaje_intermediario"] = _porcentaje(porcentaje)
+        else:
+            return None
+        resto = resto[parte.end():].strip(" ,.")
+    return datos if "fecha_prestamo" in datos and "tiene_intermediario" in datos else None
+
+
+def interpretar(texto: str, hoy: Optional[datetime.date] = None) -> Optional[dict]:
+    """
+    Herramienta y argumentos de una frase frecuente ({"herramienta", "argumentos"}), o None
+    si la frase no coincide entera con un patrón o algo queda dudoso (moneda sin indicar,
+    importe ambiguo, varias operaciones, gasto o ingreso con fecha, préstamo sin fecha o sin
+    aclarar el intermediario):
+    esas van al modelo.
+    """
+    original = texto.strip().strip("¿?¡!. ")
+    normalizado = normalizar(original)
+
+    if FRASE_SALDO.fullmatch(normalizado):
+        return {"herramienta": "get_total_money", "argumentos": {}}
+
+    if frase := FRASE_GASTO.fullmatch(normalizado):
+        importe = _importe(frase)
+        descripcion = original[frase.start("descripcion"):frase.end("descripcion")].strip()
+        # Otro número en la descripción suele ser otra operación ('... y 1200 de alquiler')
+        if importe is None or re.search(r"\d", descripcion) or _MENCIONA_FECHA.search(normalizado):
+            return None
+        return {"herramienta": "add_expense",
+                "argumentos": {"monto": importe[0], "moneda": importe[1], "descripcion": descripcion}}
+
+    if frase := FRASE_INGRESO.fullmatch(normalizado):
+        importe = _importe(frase)
+        descripcion = (original[frase.start("descripcion"):frase.end("descripcion")].strip()
+                       if frase["descripcion"] else None)
+        if (importe is None or (descripcion and re.search(r"\d", descripcion))
+                or _MENCIONA_FECHA.search(normalizado)):
+            return None
+        argumentos = {"monto": importe[0], "moneda": importe[1]}
+        if descripcion:
+            argumentos["descripcion"] = descripcion
+        return {"herramienta": "add_money_to_balance", "argumentos": argumentos}
+
+    if frase := FRASE_PRESTAMO.fullmatch(normalizado):
+        importe = _importe(frase)
+        resto = _resto_prestamo(frase["resto"], hoy)
+        if importe is None or resto is None:
+            return None
+        persona = " ".join(p.capitalize() if p.islower() else p
+                           for p in original[frase.start("persona"):frase.end("persona")].split())
+        return {"herramienta": "add_loan",
+                "argumentos": {"monto_total": importe[0], "moneda": importe[1], "persona": persona,
+                               "porcentaje_interes": _porcentaje(frase["interes"]), **resto}}
+    return None
+
+
+# ---------------- Respuestas ---------------- #
+
+def _alertas(resultado: dict) -> str:
+    return "".join(f"\n⚠️ {a['mensaje']}" for a in resultado.get("alertas") or [])
+
+
+def _responder_gasto(r: dict) -> str:
+    return (f"✅ Gasto registrado: {r['monto_original']:,.2f} {r['moneda']} en {r['descripcion']}"
+            f" (categoría {r.get('categoria', 'general')}, ${r['monto_usd_equivalente']:,.2f} USD)."
+            f"\nSaldo: ${r['saldo_nuevo_usd']:,.2f} USD{_alertas(r)}")
+
+
+def _responder_ingreso(r: dict) -> str:
+    return (f"✅ {r['monto_original']:,.2f} {r['moneda']} añadidos al saldo"
+            f" (${r['monto_usd_equivalente']:,.2f} USD): {r['descripcion']}")
+
+
+def _responder_saldo(r: dict) -> str:
+    usd = r["resumen_usd"]
+    if "resumen_ars" not in r:
+        return (f"💰 ${usd['dinero_prestado_usd']:,.2f} USD (prestado) + ${usd['saldo_disponible_usd']:,.2f} USD"
+                f" (disponible) = ${usd['saldo_total_usd']:,.2f} USD\n{r.get('message', '')}").strip()
+    ars = r["resumen_ars"]
+    return (f"💰 Tu dinero al {r['fecha_cotizacion']}:\n"
+            f"${ars['dinero_prestado_ars']:,.0f} ARS (prestado) + ${ars['saldo_disponible_ars']:,.0f} ARS"
+            f" (disponible) = ${ars['saldo_total_ars']:,.0f} ARS\n"
+            f"${usd['dinero_prestado_usd']:,.2f} USD (prestado) + ${usd['saldo_disponible_usd']:,.2f} USD"
+            f" (disponible) = ${usd['saldo_total_usd']:,.2f} USD ({r['cotizacion']['detalle']})")
+
+
+def _responder_prestamo(r: dict) -> str:
+    detalle = r["calculo_detalle"]
+    return "\n".join([f"✅ Préstamo #{r['loan_id']} a {r['persona']} registrado ({r['fecha_prestamo']})",
+                      *(f"- {detalle[clave]}" for clave in ("explicacion", "interes_total", "descuento_intermediario",
+                                                            "porcentaje_neto", "ganancia_final", "cotizacion"))])
+
+
+RESPUESTAS = {
+    "add_expense": _responder_gasto,
+    "add_money_to_balance": _responder_ingreso,
+    "get_total_money": _responder_saldo,
+    "add_loan": _responder_prestamo,
+}
+
+
+def responder(herramienta: str, resultado: dict) -> str:
+    """Texto para el usuario con el resultado de la herramienta (el modelo no interviene)."""
+    if resultado.get("status") == "error":
+        return f"❌ No se pudo completar la operación: {resultado.get('error_message', 'error desconocido')}"
+    try:
+        texto = RESPUESTAS[herramienta](resultado)
+    except (KeyError, TypeError):
+        # Resultado con otra forma: la herramienta ya corrió, así que se informa su mensaje
+        texto = resultado.get("message") or "✅ Listo"
+    if resultado.get("status") == "warning" and resultado.get("message") and resultado["message"] not in texto:
+        texto += f"\n⚠️ {resultado['message']}"
+    return texto
+
+
+# ---------------- Latencia ---------------- #
+
+class EstadisticasAtajos:
+    """
+    Latencia de los mensajes resueltos con atajos y de los que fueron al modelo (de punta a
+    punta, medidos en los callbacks del agente), para estimar cuánto se ahorra.
+    """
+
+    MUESTRAS = 1000
+
+    def __init__(self):
+        self._bloqueo = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._bloqueo:
+            self._ms = {"atajo": collections.deque(maxlen=self.MUESTRAS),
+                        "modelo": collections.deque(maxlen=self.MUESTRAS)}
+            self._llamadas = collections.Counter()
+            self._por_herramienta = collections.Counter()
+
+    def registrar(self, ruta: str, milisegundos: float, herramienta: Optional[str] = None):
+        with self._bloqueo:
+            self._ms[ruta].append(milisegundos)
+            self._llamadas[ruta] += 1
+            if herramienta:
+                self._por_herramienta[herramienta] += 1
+
+    @staticmethod
+    def _percentil(valores: list, p: float) -> Optional[float]:
+        if not valores:
+            return None
+        return round(valores[min(len(valores) - 1, int(p * len(valores)))], 2)
+
+    def resumen(self) -> dict:
+        with self._bloqueo:
+            muestras = {ruta: sorted(ms) for ruta, ms in self._ms.items()}
+            llamadas = dict(self._llamadas)
+            por_herramienta = dict(self._por_herramienta.most_common())
+        rutas = {
+            ruta: {"mensajes": llamadas.get(ruta, 0), "p50_ms": self._percentil(ms, 0.5),
+                   "p95_ms": self._percentil(ms, 0.95)}
+            for ruta, ms in muestras.items()
+        }
+        total = sum(r["mensajes"] for r in rutas.values())
+        ahorro = None
+        if rutas["atajo"]["p50_ms"] is not None and rutas["modelo"]["p50_ms"] is not None:
+            ahorro = round(rutas["atajo"]["mensajes"] * (rutas["modelo"]["p50_ms"] - rutas["atajo"]["p50_ms"]))
+        return {
+            **rutas,
+            "proporcion_atajos": round(rutas["atajo"]["mensajes"] / total, 3) if total else None,
+            "por_herramienta": por_herramienta,
+            # Mensajes resueltos con atajos × (mediana por el modelo - mediana por atajo)
+            "ahorro_estimado_ms": ahorro,
+        }
+
+
+estadisticas = EstadisticasAtajos()
+# Inicio de cada invocación que fue al modelo (por invocation_id), hasta after_agent_callback.
+# Si el modelo falla no hay after_agent_callback: se descartan las más viejas.
+_inicios = {}
+MAX_INICIOS = 1000
+
+
+def _texto_usuario(callback_context) -> Optional[str]:
+    contenido = callback_context.user_content
+    if contenido is None or not contenido.parts:
+        return None
+    partes = [p.text for p in contenido.parts if p.text]
+    # Adjuntos (archivos, imágenes) van al modelo
+    return " ".join(partes) if len(partes) == len(contenido.parts) else None
+
+
+def antes_del_agente(callback_context, herramientas: dict) -> Optional[types.Content]:
+    """
+    before_agent_callback: si el mensaje es una frase frecuente, llama a la herramienta
+    directamente (con su instrumentación y plazo) y responde sin invocar al modelo.
+    Si no, devuelve None y el agente sigue normalmente.
+    """
+    inicio = time.perf_counter()
+    texto = _texto_usuario(callback_context) if ACTIVOS else None
+    interpretacion = interpretar(texto) if texto else None
+    if interpretacion is None or interpretacion["herramienta"] not in herramientas:
+        _inicios[callback_context.invocation_id] = inicio
+        if len(_inicios) > MAX_INICIOS:
+            _inicios.pop(next(iter(_inicios)), None)
+        return None
+    nombre = interpretacion["herramienta"]
+    respuesta = responder(nombre, herramientas[nombre](**interpretacion["argumentos"]))
+    estadisticas.registrar("atajo", (time.perf_counter() - inicio) * 1000, nombre)
+    return types.Content(role="model", parts=[types.Part(text=respuesta)])
+
+
+def despues_del_agente(callback_context) -> None:
+    """after_agent_callback: latencia de punta a punta de los mensajes que resolvió el modelo."""
+    inicio = _inicios.pop(callback_context.invocation_id, None)
+    if inicio is not None:
+        estadisticas.registrar("modelo", (time.perf_counter() - inicio) * 1000)
+    return None
+
+
+# Frases de ejemplo para medir cobertura y tiempo del intérprete (python -m Asistente_Financiero.atajos)
+FRASES_DE_EJEMPLO = (
+    "gasté 500 pesos en comida",
+    "Gasté 1.500,50 ARS en el súper",
+    "pagué 12 mil pesos de luz",
+    "compré u$s 30 de ropa",
+    "gasté 500 en comida",
+    "gasté 500 pesos en comida y 1200 de alquiler",
+    "ayer gasté 500 pesos en comida",
+    "¿cuánta plata tengo?",
+    "cuanto dinero tengo en total",
+    "mi saldo",
+    "cobré 300000 pesos de sueldo",
+    "me pagaron 200 dólares",
+    "presté 1000 USD a Juan al 10% sin intermediario el 2025-09-01",
+    "presté 1000 USD a Juan al 10% el 2025-09-01",
+    "le presté 400.000 pesos a María Pérez al 10% con 5% de intermediario el 1/9/2025",
+    "presté 1000 USD a Juan al 10%",
+    "¿cuánto me debe Pedro?",
+    "mostrame los préstamos activos",
+)
+
+
+if __name__ == "__main__":
+    # python -m Asistente_Financiero.atajos ["frase" ...] [--repeticiones N]
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Interpreta frases con los atajos (no ejecuta herramientas).")
+    parser.add_argument("frases", nargs="*", help="frases a interpretar (por defecto, FRASES_DE_EJEMPLO)")
+    parser.add_argument("--repeticiones", type=int, default=1000, help="veces que se interpreta cada frase")
+    args = parser.parse_args()
+    frases = args.frases or FRASES_DE_EJEMPLO
+    resultados = []
+    for frase in frases:
+        inicio = time.perf_counter()
+        for _ in range(args.repeticiones):
+            interpretacion = interpretar(frase)
+        resultados.append({
+            "frase": frase,
+            "interpretacion": interpretacion,
+            "us": round((time.perf_counter() - inicio) / args.repeticiones * 1e6, 1)
+        })
+    resueltas = sum(1 for r in resultados if r["interpretacion"])
+    print(json.dumps({"frases": resultados, "resueltas": resueltas, "al_modelo": len(resultados) - resueltas},
+                     indent=2, ensure_ascii=False))
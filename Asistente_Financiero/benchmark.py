@@ -0,0 +1,452 @@
+# Benchmark de las herramientas del agente sobre libros sintéticos de distintos tamaños
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import pathlib
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import psycopg2
+import psycopg2.extensions
+import requests
+
+from . import cache, conciliacion
+from .instrumentacion import estadisticas
+from .repositorio import crear_repositorio, usar_repositorio
+
+# Base dedicada en el mismo servidor que FINANZAS_DSN: se borra y se vuelve a sembrar en cada tamaño
+BASE_POR_DEFECTO = "finanzas_bench"
+ESQUEMA_POR_DEFECTO = pathlib.Path(__file__).resolve().parent.parent / "init.sql"
+TAMANOS_POR_DEFECTO = (1_000, 10_000, 100_000, 1_000_000)
+
+# Cotizaciones del proveedor simulado (unidades de cada moneda por 1 USD, como exchangerate-api)
+TASAS_FX = {"USD": 1.0, "ARS": 1362.33, "BOB": 6.91, "EUR": 0.92, "BRL": 5.45}
+MONEDAS = ("ARS", "USD", "EUR")
+DESCRIPCIONES = ("supermercado", "alquiler", "sueldo", "comida", "transporte", "servicios",
+                 "farmacia", "regalo", "cena", "ropa")
+DIAS_HISTORIA = 1095
+
+# Herramientas caras: como mucho estas repeticiones por tamaño
+REPETICIONES_MAXIMAS = {"rebuild_daily_balances": 3, "simulate_fx_scenarios": 5, "recategorize_ledger": 3}
+
+# Filas de cada tabla base según el tamaño (cantidad de transacciones)
+PROPORCIONES = {"prestamos": 10, "saldo_actual": 2, "historial_saldo": 2, "pagos_prestamo": 20}
+
+SIEMBRA = """
+SELECT setseed(%(semilla)s);
+
+INSERT INTO transacciones (tipo, monto, fecha, descripcion, contraparte, created_at)
+SELECT (ARRAY['ingreso', 'gasto', 'gasto', 'gasto', 'prestamo'])[1 + floor(random() * 5)::int],
+       round((1 + random() * 5000)::numeric, 2),
+       CURRENT_DATE - floor(random() * %(dias)s)::int,
+       (%(descripciones)s::text[])[1 + floor(random() * %(n_descripciones)s)::int] || ' ' || i,
+       CASE WHEN random() < 0.6 THEN 'Persona ' || (1 + floor(random() * %(personas)s)::int) END,
+       NOW()
+FROM generate_series(1, %(transacciones)s) i;
+
+INSERT INTO prestamos (monto_total, moneda, persona, porcentaje_interes, tiene_intermediario,
+                       porcentaje_intermediario, monto_intermediario, monto_en_mano, fecha_prestamo,
+                       cotizacion_momento, descripcion, estado, fecha_finalizacion, cotizacion_finalizacion)
+SELECT monto, moneda, persona, interes, intermediario > 0, intermediario,
+       round(monto * intermediario / 100, 2), round(monto * (interes - intermediario) / 100, 2),
+       fecha, usd_por_unidad * (0.8 + random() * 0.4), 'préstamo ' || i,
+       CASE WHEN activo THEN 'activo' ELSE 'finalizado' END,
+       CASE WHEN activo THEN NULL ELSE LEAST(fecha + 30 + floor(random() * 300)::int, CURRENT_DATE) END,
+       CASE WHEN activo THEN NULL ELSE usd_por_unidad * (0.7 + random() * 0.4) END
+FROM (
+    SELECT i, round((100 + random() * 100000)::numeric, 2) AS monto,
+           (%(monedas)s::text[])[1 + i %% %(n_monedas)s] AS moneda,
+           (%(usd_por_unidad)s::numeric[])[1 + i %% %(n_monedas)s] AS usd_por_unidad,
+           'Persona ' || (1 + floor(random() * %(personas)s)::int) AS persona,
+           round((random() * 20)::numeric, 2) AS interes,
+           CASE WHEN random() < 0.3 THEN round((random() * 5)::numeric, 2) ELSE 0 END AS intermediario,
+           CURRENT_DATE - floor(random() * %(dias)s)::int AS fecha,
+           random() < 0.7 AS activo
+    FROM generate_series(1, %(prestamos)s) i
+) p;
+
+INSERT INTO saldo_actual (monto, moneda, descripcion, updated_at)
+SELECT round((random() * 7000 - 2000)::numeric, 2),
+       (%(monedas)s::text[])[1 + floor(random() * %(n_monedas)s)::int],
+       (%(descripciones)s::text[])[1 + floor(random() * %(n_descripciones)s)::int] || ' ' || i,
+       NOW() - (random() * %(dias)s) * INTERVAL '1 day'
+FROM generate_series(1, %(saldo_actual)s) i;
+
+INSERT INTO historial_saldo (tipo_operacion, monto_operacion, saldo_anterior, saldo_nuevo, descripcion,
+                             fecha_operacion, saldo_id)
+SELECT (ARRAY['gasto', 'dinero_añadido', 'dinero_nuevo_mes'])[1 + floor(random() * 3)::int], monto,
+       saldo, saldo + monto, 'movimiento ' || i, NOW() - (random() * %(dias)s) * INTERVAL '1 day', i
+FROM (
+    SELECT i, round((random() * 7000 - 2000)::numeric, 2) AS monto,
+           round((random() * 100000)::numeric, 2) AS saldo
+    FROM generate_series(1, %(historial_saldo)s) i
+) h;
+
+INSERT INTO pagos_prestamo (prestamo_id, monto, fecha_pago, ganancia, descripcion)
+SELECT 1 + floor(random() * %(prestamos)s)::int, round((10 + random() * 1000)::numeric, 2),
+       CURRENT_DATE - floor(random() * %(dias)s)::int, round((random() * 100)::numeric, 2), 'pago ' || i
+FROM generate_series(1, %(pagos_prestamo)s) i;
+
+INSERT INTO tasas_cambio (moneda_origen, moneda_destino, tasa)
+SELECT moneda, 'USD', usd_por_unidad
+FROM unnest(%(monedas_fx)s::text[], %(usd_por_unidad_fx)s::numeric[]) AS m(moneda, usd_por_unidad);
+
+INSERT INTO tasas_cambio_historial (moneda_origen, moneda_destino, fecha, tasa)
+SELECT m.moneda, 'USD', CURRENT_DATE - d, m.usd_por_unidad * (1 + d / 1000.0 + (random() - 0.5) / 50)
+FROM unnest(%(monedas_fx)s::text[], %(usd_por_unidad_fx)s::numeric[]) AS m(moneda, usd_por_unidad)
+CROSS JOIN generate_series(1, %(dias)s) d;
+"""
+
+
+def _cantidades(transacciones: int) -> dict:
+    """Filas de cada tabla base para un tamaño (al menos 10 préstamos para tener a quién pagar)."""
+    cantidades = {"transacciones": transacciones}
+    for tabla, divisor in PROPORCIONES.items():
+        cantidades[tabla] = max(10, transacciones // divisor)
+    cantidades["personas"] = max(5, min(5000, transacciones // 20))
+    return cantidades
+
+
+def dsn_benchmark(base: str = BASE_POR_DEFECTO) -> str:
+    """DSN de la base del benchmark en el servidor de FINANZAS_DSN. Nunca es la base de la app."""
+    dsn = os.environ.get("FINANZAS_DSN", "dbname=finanzas user=postgres password=postgres host=db port=5432")
+    if psycopg2.extensions.parse_dsn(dsn).get("dbname") == base:
+        raise ValueError(f"La base del benchmark ({base}) no puede ser la de FINANZAS_DSN: se borra entera")
+    conexion = psycopg2.connect(dsn)
+    conexion.autocommit = True
+    try:
+        cur = conexion.cursor()
+        cur.execute("SELECT 1 FROM pg_database WHERE datname = %s;", (base,))
+        if cur.fetchone() is None:
+            cur.execute(f'CREATE DATABASE "{base}";')
+    finally:
+        conexion.close()
+    return psycopg2.extensions.make_dsn(dsn, dbname=base)
+
+
+def sembrar(dsn: str, transacciones: int, semilla: int, esquema: str) -> dict:
+    """
+    Recrea el esquema y lo llena con un libro sintético reproducible (misma semilla, mismos
+    datos). Los rollups (saldo_diario, transacciones_mensual, exposición) los arma init.sql
+    a partir de las tablas base, igual que al migrar una base existente.
+    """
+    cantidades = _cantidades(transacciones)
+    sql_esquema = pathlib.Path(esquema).read_text(encoding="utf-8")
+    conexion = psycopg2.connect(dsn)
+    try:
+        cur = conexion.cursor()
+        cur.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public;")
+        cur.execute(sql_esquema)
+        cur.execute(SIEMBRA, {
+            **cantidades,
+            "semilla": (semilla % 2001 - 1000) / 1000,
+            "dias": DIAS_HISTORIA,
+            "descripciones": list(DESCRIPCIONES),
+            "n_descripciones": len(DESCRIPCIONES),
+            "monedas": list(MONEDAS),
+            "n_monedas": len(MONEDAS),
+            "usd_por_unidad": [1 / TASAS_FX[m] for m in MONEDAS],
+            "monedas_fx": [m for m in TASAS_FX if m != "USD"],
+            "usd_por_unidad_fx": [1 / t for m, t in TASAS_FX.items() if m != "USD"],
+        })
+        # Segunda pasada: con las tablas base llenas, init.sql calcula los rollups vacíos
+        cur.execute(sql_esquema)
+        conexion.commit()
+        conexion.autocommit = True
+        cur.execute("ANALYZE;")
+        filas = {}
+        for tabla in ("transacciones", "prestamos", "saldo_actual", "historial_saldo", "pagos_prestamo",
+                      "tasas_cambio_historial", "saldo_diario", "transacciones_mensual", "contrapartes",
+                      "exposicion_contraparte"):
+            cur.execute(f"SELECT COUNT(*) FROM {tabla};")
+            filas[tabla] = cur.fetchone()[0]
+        cur.execute("SELECT id FROM prestamos WHERE estado = 'activo' ORDER BY id;")
+        activos = [f[0] for f in cur.fetchall()]
+        cur.execute("SELECT DISTINCT persona FROM prestamos ORDER BY persona;")
+        deudores = [f[0] for f in cur.fetchall()]
+    finally:
+        conexion.close()
+    # Lo cacheado antes de la siembra ya no vale
+    cache.invalidar_todo()
+    return {"filas": filas, "prestamos_activos": activos, "deudores": deudores,
+            "personas": cantidades["personas"], "prestamos": cantidades["prestamos"]}
+
+
+class _RespuestaFx:
+    """Respuesta del proveedor simulado con el formato de exchangerate-api.com."""
+
+    status_code = 200
+
+    def json(self):
+        return {"base": "USD", "rates": dict(TASAS_FX)}
+
+
+@contextlib.contextmanager
+def proveedor_fx_local():
+    """Reemplaza las llamadas HTTP al proveedor de cotizaciones por TASAS_FX (sin red)."""
+    original = requests.get
+    requests.get = lambda url, *args, **kwargs: _RespuestaFx()
+    try:
+        yield
+    finally:
+        requests.get = original
+
+
+def _escenarios(datos: dict, semilla: int) -> dict:
+    """Argumentos de cada llamada por herramienta: función (número de llamada) -> kwargs."""
+    rng = random.Random(semilla)
+    hoy = datetime.date.today()
+    activos = list(datos["prestamos_activos"])
+    rng.shuffle(activos)
+    # finish_loan y add_loan_payment no comparten préstamos (uno finaliza, el otro paga)
+    a_finalizar, a_pagar = activos[::2], activos[1::2] or activos
+
+    def persona():
+        return f"Persona {rng.randint(1, datos['personas'])}"
+
+    def fecha():
+        return (hoy - datetime.timedelta(days=rng.randrange(DIAS_HISTORIA))).isoformat()
+
+    def deudor():
+        return rng.choice(datos["deudores"])
+
+    def prestamo():
+        return rng.randint(1, datos["prestamos"])
+
+    return {
+        "add_transaction": lambda i: {"tipo": rng.choice(("ingreso", "gasto")), "monto": round(rng.uniform(1, 5000), 2),
+                                      "fecha": fecha(), "descripcion": f"bench {i}", "contraparte": persona()},
+        "get_balance": lambda i: {},
+        "get_period_report": lambda i: {"por_contraparte": i % 3 == 1, "por_categoria": i % 3 == 2},
+        "list_transactions": lambda i: {"limit": 100, "compacto": i % 2 == 1},
+        "search_transactions": lambda i: {"consulta": rng.choice(DESCRIPCIONES + ("Persona 1",))},
+        "get_today_date": lambda i: {},
+        "update_exchange_rate": lambda i: {"moneda_origen": "BRL", "tasa": round(1 / TASAS_FX["BRL"], 6)},
+        "get_exchange_rate": lambda i: {"moneda_origen": rng.choice(("ARS", "EUR", "BOB"))},
+        "convert_to_usd": lambda i: {"monto": 1000, "moneda": rng.choice(("ARS", "EUR"))},
+        "get_current_exchange_rate_from_api": lambda i: {"moneda": rng.choice(("EUR", "BRL", "ARS"))},
+        "save_exchange_rate_from_api": lambda i: {"moneda": "EUR"},
+        "add_loan": lambda i: {"monto_total": 1000, "moneda": rng.choice(MONEDAS), "persona": persona(),
+                               "fecha_prestamo": hoy.isoformat(), "porcentaje_interes": 10,
+                               "tiene_intermediario": i % 2 == 1, "porcentaje_intermediario": 5 if i % 2 else 0},
+        "list_loans": lambda i: {"estado": "activo", "compacto": i % 2 == 1},
+        "finish_loan": lambda i: {"loan_id": a_finalizar.pop() if a_finalizar else prestamo()},
+        "add_loan_payment": lambda i: {"loan_id": rng.choice(a_pagar), "monto": 1},
+        "list_loan_payments": lambda i: {"loan_id": prestamo()},
+        "get_fx_pnl_report": lambda i: {"agrupar_por": rng.choice(("prestamo", "moneda", "persona"))},
+        "get_counterparty_exposure": lambda i: {"persona": deudor() if i % 2 else None},
+        "get_counterparty_history": lambda i: {"persona": deudor()},
+        "get_current_balance": lambda i: {},
+        "add_to_current_balance": lambda i: {"monto": 100, "moneda": "USD", "descripcion": f"bench {i}",
+                                             "tipo_operacion": "dinero_añadido"},
+        "subtract_from_current_balance": lambda i: {"monto": 1, "moneda": "USD", "descripcion": f"bench {i}"},
+        "add_expense": lambda i: {"monto": 1, "moneda": "USD", "descripcion": f"bench {i}",
+                                  "categoria": rng.choice(DESCRIPCIONES)},
+        "add_monthly_money": lambda i: {"monto": 100, "moneda": "ARS"},
+        "add_money_to_balance": lambda i: {"monto": 100, "moneda": "USD"},
+        "batch_operations": lambda i: {"operaciones": [
+            {"tipo": "ingreso", "monto": 100, "moneda": "USD"},
+            {"tipo": "gasto", "monto": 10, "moneda": "USD", "descripcion": f"bench {i}"},
+            {"tipo": "gasto", "monto": 5, "moneda": "ARS", "descripcion": f"bench {i}"},
+        ]},
+        "set_category_budget": lambda i: {"categoria": rng.choice(DESCRIPCIONES), "limite": 500},
+        "get_category_stats": lambda i: {"categoria": rng.choice(DESCRIPCIONES) if i % 2 else None},
+        # Vence hoy: mide también la generación inmediata del primer movimiento
+        "add_recurring_rule": lambda i: {"tipo": rng.choice(("ingreso", "gasto")), "monto": 10, "moneda": "USD",
+                                         "descripcion": f"bench {i}", "frecuencia": rng.choice(("mensual", "semanal"))},
+        "list_recurring_rules": lambda i: {"incluir_inactivas": i % 2 == 1},
+        # Cancela las reglas que creó add_recurring_rule (ids 1, 2, ...)
+        "cancel_recurring_rule": lambda i: {"rule_id": i + 1},
+        "get_spending_by_category": lambda i: {"por_mes": i % 2 == 1},
+        "add_category_rule": lambda i: {"palabras": f"bench regla {i}", "categoria": rng.choice(DESCRIPCIONES)},
+        "list_category_rules": lambda i: {},
+        # Elimina las reglas que creó add_category_rule (ids 1, 2, ...)
+        "delete_category_rule": lambda i: {"rule_id": i + 1},
+        # La primera categoriza todo el libro sembrado; las siguientes solo revisan
+        "recategorize_ledger": lambda i: {"todas": i % 2 == 1},
+        # Alterna la verificación rápida (solo bloques_control) y la completa (recalcula las sumas)
+        "reconcile_ledger": lambda i: {"completa": i % 2 == 1},
+        "get_total_money": lambda i: {"compacto": i % 2 == 1},
+        "get_balance_history": lambda i: {"limit": 50},
+        "get_net_worth_history": lambda i: {"dias": 730, "intervalo": rng.choice(("dia", "semana", "mes"))},
+        "rebuild_daily_balances": lambda i: {},
+        # Semilla distinta en cada llamada: si no, todas salvo la primera salen de la caché
+        "simulate_fx_scenarios": lambda i: {"semilla": semilla + i},
+        "get_query_stats": lambda i: {},
+    }
+
+
+def _consultas_de(herramienta: str) -> int:
+    """Consultas registradas hasta ahora a nombre de la herramienta."""
+    return sum(c["herramientas"].get(herramienta, 0) for c in estadisticas.resumen("llamadas", 10 ** 9))
+
+
+class _ContadorConexiones:
+    """Cuenta las conexiones que pide el repositorio (una por transacción de nivel superior)."""
+
+    def __init__(self, repositorio):
+        self.total = 0
+        self._bloqueo = threading.Lock()
+        abrir = repositorio._abrir
+
+        def abrir_contando():
+            with self._bloqueo:
+                self.total += 1
+            return abrir()
+        repositorio._abrir = abrir_contando
+
+
+def _percentiles(tiempos_ms: list) -> dict:
+    valores = np.asarray(tiempos_ms)
+    p50, p95, p99 = np.percentile(valores, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3),
+            "media_ms": round(float(valores.mean()), 3), "max_ms": round(float(valores.max()), 3)}
+
+
+def medir_herramientas(herramientas: list, repositorio, datos: dict, repeticiones: int, calentamiento: int,
+                       semilla: int) -> dict:
+    """Llama cada herramienta como lo hace el agente (instrumentada y con plazo) y resume sus tiempos."""
+    escenarios = _escenarios(datos, semilla)
+    conexiones = _ContadorConexiones(repositorio)
+    resultados = {}
+    for herramienta in herramientas:
+        nombre = herramienta.__name__
+        if nombre not in escenarios:
+            resultados[nombre] = {"omitida": "sin escenario en benchmark._escenarios"}
+            continue
+        argumentos = escenarios[nombre]
+        veces = min(repeticiones, REPETICIONES_MAXIMAS.get(nombre, repeticiones))
+        for i in range(min(calentamiento, veces)):
+            herramienta(**argumentos(-1 - i))
+        consultas, conexiones_antes = _consultas_de(nombre), conexiones.total
+        tiempos, errores = [], {}
+        for i in range(veces):
+            kwargs = argumentos(i)
+            inicio = time.perf_counter()
+            resultado = herramienta(**kwargs)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+            if isinstance(resultado, dict) and resultado.get("status") == "error":
+                clave = resultado.get("error_type") or str(resultado.get("error_message"))[:80]
+                errores[clave] = errores.get(clave, 0) + 1
+        # Lo que la herramienta dejó en el escritor de historial no se cuenta en la siguiente
+        if repositorio.escritor_historial is not None:
+            repositorio.escritor_historial.vaciar()
+        resultados[nombre] = {
+            "llamadas": veces,
+            **_percentiles(tiempos),
+            "consultas_por_llamada": round((_consultas_de(nombre) - consultas) / veces, 2),
+            "conexiones_por_llamada": round((conexiones.total - conexiones_antes) / veces, 2),
+            "errores": errores,
+        }
+    return resultados
+
+
+def _version() -> dict:
+    """Commit del código medido (para comparar informes entre versiones)."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=pathlib.Path(__file__).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version()}
+
+
+def comparar(anterior: dict, actual: dict) -> list:
+    """Cambio de p50/p95 por herramienta y tamaño entre dos informes (razón > 1 = más lento)."""
+    previos = {(t["transacciones"], nombre): datos
+               for t in anterior["tamanos"] for nombre, datos in t["herramientas"].items()}
+    filas = []
+    for tamano in actual["tamanos"]:
+        for nombre, datos in tamano["herramientas"].items():
+            previo = previos.get((tamano["transacciones"], nombre))
+            if not previo or "p50_ms" not in previo or "p50_ms" not in datos:
+                continue
+            filas.append({
+                "transacciones": tamano["transacciones"],
+                "herramienta": nombre,
+                **{f"{p}_razon": round(datos[f"{p}_ms"] / previo[f"{p}_ms"], 3) if previo[f"{p}_ms"] else None
+                   for p in ("p50", "p95")},
+                "consultas_por_llamada": [previo["consultas_por_llamada"], datos["consultas_por_llamada"]],
+            })
+    filas.sort(key=lambda f: f["p95_razon"] or 0, reverse=True)
+    return filas
+
+
+def ejecutar(tamanos, repeticiones: int = 20, calentamiento: int = 2, semilla: int = 42,
+             herramientas: list = None, base: str = BASE_POR_DEFECTO, esquema=ESQUEMA_POR_DEFECTO) -> dict:
+    """Siembra cada tamaño, mide todas las herramientas (o las pedidas) y arma el informe."""
+    # El agente se importa acá: sus herramientas usan el repositorio activo del proceso
+    from .agent import root_agent
+
+    dsn = dsn_benchmark(base)
+    os.environ["FINANZAS_DSN"] = dsn
+    # Sin programador de recurrentes: sus pasadas en segundo plano ensuciarían las mediciones
+    os.environ["FINANZAS_RECURRENTES"] = "0"
+    repositorio = crear_repositorio("postgres")
+    usar_repositorio(repositorio)
+    seleccion = [t for t in root_agent.tools if not herramientas or t.__name__ in herramientas]
+    informe = {
+        **_version(),
+        "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+        "configuracion": {
+            "backend": repositorio.nombre,
+            "cache": os.environ.get("FINANZAS_CACHE", "1") != "0",
+            "historial_asincrono": repositorio.escritor_historial is not None,
+            "replica_lectura": bool(os.environ.get("FINANZAS_DSN_LECTURA")),
+            "repeticiones": repeticiones,
+            "calentamiento": calentamiento,
+            "semilla": semilla,
+        },
+        "tamanos": [],
+    }
+    with proveedor_fx_local():
+        for transacciones in tamanos:
+            inicio = time.perf_counter()
+            datos = sembrar(dsn, transacciones, semilla, esquema)
+            siembra_s = round(time.perf_counter() - inicio, 2)
+            print(f"[benchmark] {transacciones} transacciones sembradas en {siembra_s} s", file=sys.stderr)
+            # Sumas de control del libro sembrado, como al migrar una base existente
+            sellado_s = conciliacion.sellar(repositorio)["segundos"]
+            informe["tamanos"].append({
+                "transacciones": transacciones,
+                "siembra_s": siembra_s,
+                "sellado_s": sellado_s,
+                "filas": datos["filas"],
+                "herramientas": medir_herramientas(seleccion, repositorio, datos, repeticiones,
+                                                   calentamiento, semilla),
+            })
+    return informe
+
+
+if __name__ == "__main__":
+    # python -m Asistente_Financiero.benchmark --tamanos 1000 10000 --salida bench.json [--comparar base.json]
+    parser = argparse.ArgumentParser(description="Benchmark de las herramientas del asistente financiero")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=list(TAMANOS_POR_DEFECTO),
+                        help="cantidad de transacciones de cada libro sintético")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--calentamiento", type=int, default=2)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--herramientas", help="solo estas herramientas, separadas por coma")
+    parser.add_argument("--base", default=BASE_POR_DEFECTO, help="base dedicada (se borra en cada tamaño)")
+    parser.add_argument("--esquema", default=str(ESQUEMA_POR_DEFECTO))
+    parser.add_argument("--salida", help="archivo JSON del informe (por defecto, stdout)")
+    parser.add_argument("--comparar", help="informe anterior contra el que comparar p50/p95")
+    args = parser.parse_args()
+
+    informe = ejecutar(args.tamanos, args.repeticiones, args.calentamiento, args.semilla,
+                       args.herramientas.split(",") if args.herramientas else None, args.base, args.esquema)
+    if args.comparar:
+        informe["comparacion"] = comparar(json.loads(pathlib.Path(args.comparar).read_text(encoding="utf-8")),
+                                          informe)
+    texto = json.dumps(informe, indent=2, ensure_ascii=False, default=str)
+    if args.salida:
+        pathlib.Path(args.salida).write_text(texto, encoding="utf-8")
+    else:
+        print(texto)
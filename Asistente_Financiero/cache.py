@@ -0,0 +1,92 @@
+# Registro de cachés en proceso, invalidadas por tabla (localmente y desde otras réplicas)
+import collections
+import threading
+
+_bloqueo_registro = threading.Lock()
+# nombre -> (tablas de las que depende, función que la vacía, función de estadísticas)
+_registro = {}
+
+
+def registrar(nombre: str, tablas: tuple, limpiar, estadisticas=None) -> None:
+    """Registra una caché: se vacía cada vez que cambia alguna de sus tablas."""
+    with _bloqueo_registro:
+        _registro[nombre] = (frozenset(tablas), limpiar, estadisticas)
+
+
+def invalidar(tablas) -> list:
+    """Vacía las cachés que dependen de alguna de las tablas. Devuelve sus nombres."""
+    tablas = set(tablas)
+    with _bloqueo_registro:
+        afectadas = [(nombre, limpiar) for nombre, (dependencias, limpiar, _) in _registro.items()
+                     if dependencias & tablas]
+    for _, limpiar in afectadas:
+        limpiar()
+    return [nombre for nombre, _ in afectadas]
+
+
+def invalidar_todo() -> None:
+    """Vacía todas las cachés (al arrancar o perder la escucha de cambios)."""
+    with _bloqueo_registro:
+        funciones = [limpiar for _, limpiar, _ in _registro.values()]
+    for limpiar in funciones:
+        limpiar()
+
+
+def estadisticas() -> dict:
+    """Estadísticas de cada caché registrada (las que las informan) y sus tablas."""
+    with _bloqueo_registro:
+        registradas = list(_registro.items())
+    return {
+        nombre: {"tablas": sorted(tablas), **(datos() if datos else {})}
+        for nombre, (tablas, _, datos) in registradas
+    }
+
+
+class CacheTablas:
+    """
+    Caché LRU de resultados que dependen de un conjunto de tablas. Cada invalidación sube
+    una generación: un cálculo que empezó antes de la invalidación no guarda su resultado
+    (evita dejar en caché un valor leído justo antes de un cambio).
+    """
+
+    def __init__(self, nombre: str, tablas: tuple, maximo: int = 256):
+        self.nombre = nombre
+        self.maximo = maximo
+        self._valores = collections.OrderedDict()
+        self._bloqueo = threading.Lock()
+        self._generacion = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+        registrar(nombre, tablas, self.limpiar, self.estadisticas)
+
+    def obtener(self, clave, calcular):
+        with self._bloqueo:
+            if clave in self._valores:
+                self._valores.move_to_end(clave)
+                self.aciertos += 1
+                return self._valores[clave]
+            self.fallos += 1
+            generacion = self._generacion
+        valor = calcular()
+        with self._bloqueo:
+            if generacion == self._generacion:
+                self._valores[clave] = valor
+                if len(self._valores) > self.maximo:
+                    self._valores.popitem(last=False)
+        return valor
+
+    def limpiar(self) -> None:
+        with self._bloqueo:
+            self._valores.clear()
+            self._generacion += 1
+            self.invalidaciones += 1
+
+    def estadisticas(self) -> dict:
+        with self._bloqueo:
+            return {
+                "entradas": len(self._valores),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "invalidaciones": self.invalidaciones
+            }
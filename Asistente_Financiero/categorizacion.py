@@ -0,0 +1,236 @@
+# Categorización automática de descripciones con un autómata Aho-Corasick de palabras clave
+import collections
+import re
+import time
+import unicodedata
+from typing import Optional
+
+from . import cache
+from .estadisticas_gasto import CATEGORIA_POR_DEFECTO, normalizar_categoria
+
+# Diccionario base: categoría -> palabras o frases clave (sin tildes, en minúscula). Las reglas
+# del usuario (tabla reglas_categoria) se compilan en el mismo autómata y tienen prioridad.
+DICCIONARIO = {
+    "supermercado": ("supermercado", "super", "coto", "carrefour", "jumbo", "disco", "vea", "changomas",
+                     "almacen", "verduleria", "carniceria", "chino", "dietetica"),
+    "comida": ("restaurante", "restaurant", "comida", "almuerzo", "cena", "desayuno", "delivery", "pedidosya",
+               "rappi", "pizza", "hamburguesa", "cafe", "panaderia", "helado"),
+    "transporte": ("transporte", "uber", "cabify", "didi", "taxi", "remis", "colectivo", "subte", "tren",
+                   "sube", "nafta", "combustible", "ypf", "shell", "peaje", "estacionamiento"),
+    "alquiler": ("alquiler", "expensas", "inmobiliaria"),
+    "servicios": ("servicios", "luz", "gas", "agua", "internet", "telefono", "celular", "edesur", "edenor",
+                  "metrogas", "aysa", "fibertel", "movistar", "abl"),
+    "salud": ("salud", "farmacia", "medico", "medicamentos", "remedios", "prepaga", "osde", "swiss medical",
+              "dentista", "odontologo", "psicologo", "analisis"),
+    "suscripciones": ("suscripcion", "netflix", "spotify", "disney", "hbo", "youtube premium", "amazon prime",
+                      "icloud", "chatgpt"),
+    "salidas": ("salida", "salidas", "cine", "teatro", "bar", "boliche", "recital", "entradas"),
+    "ropa": ("ropa", "zapatillas", "zapatos", "remera", "pantalon", "campera"),
+    "educacion": ("educacion", "curso", "colegio", "escuela", "universidad", "facultad", "libro", "libros",
+                  "cuota colegio"),
+    "hogar": ("hogar", "ferreteria", "muebles", "electrodomestico", "limpieza", "pintura", "plomero",
+              "electricista"),
+    "viajes": ("viaje", "vacaciones", "hotel", "pasaje", "pasajes", "vuelo", "airbnb"),
+    "mascotas": ("mascota", "veterinaria", "veterinario", "alimento perro", "alimento gato"),
+    "regalos": ("regalo", "regalos", "cumpleanos"),
+    "impuestos": ("impuesto", "impuestos", "afip", "monotributo", "arba", "patente"),
+    "sueldo": ("sueldo", "salario", "aguinaldo", "honorarios", "freelance", "factura cobrada"),
+    "prestamos": ("prestamo", "prestamos", "pago de prestamo", "prestamo finalizado"),
+}
+
+# Sin palabra clave: la categoría sale del tipo de operación o de transacción
+CATEGORIA_POR_TIPO = {
+    "gasto": CATEGORIA_POR_DEFECTO,
+    "ingreso": "ingresos",
+    "dinero_añadido": "ingresos",
+    "dinero_nuevo_mes": "ingresos",
+    "prestamo": "prestamos",
+    "prestamo_finalizado": "prestamos",
+    "pago_prestamo": "prestamos",
+}
+
+# Tablas del libro que tienen columna categoria
+TABLAS_CATEGORIZADAS = ("transacciones", "saldo_actual")
+
+_NO_ALFANUMERICO = re.compile(r"[^a-z0-9]+")
+# Caracteres que pueden quedar en un texto normalizado (el alfabeto del autómata)
+ALFABETO = " abcdefghijklmnopqrstuvwxyz0123456789"
+
+
+def normalizar_texto(texto: Optional[str]) -> str:
+    """Minúsculas sin tildes, y todo lo que no es letra o número como un espacio, entre espacios."""
+    texto = (texto or "").lower()
+    if not texto.isascii():
+        # NFKD separa la tilde de la letra; al pasar a ASCII queda solo la letra (ñ -> n)
+        texto = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii")
+    return f" {_NO_ALFANUMERICO.sub(' ', texto).strip()} "
+
+
+class Automata:
+    """
+    Autómata de Aho-Corasick: encuentra todas las palabras clave de un texto en una sola
+    pasada, sin importar cuántas sean. Las claves se guardan entre espacios, como el texto
+    normalizado, así que solo coinciden palabras o frases completas ('super' no coincide en 'superior').
+    Los enlaces de falla se resuelven al compilar (autómata determinista sobre ALFABETO):
+    cada carácter del texto es una sola búsqueda en un dict.
+    """
+
+    def __init__(self, claves: dict):
+        # claves: texto normalizado -> (categoria, prioridad)
+        self.claves = list(claves.items())
+        self._siguiente = [{}]
+        self._falla = [0]
+        self._salidas = [()]
+        for indice, (clave, _) in enumerate(self.claves):
+            estado = 0
+            for caracter in clave:
+                if caracter not in self._siguiente[estado]:
+                    self._siguiente.append({})
+                    self._falla.append(0)
+                    self._salidas.append(())
+                    self._siguiente[estado][caracter] = len(self._siguiente) - 1
+                estado = self._siguiente[estado][caracter]
+            self._salidas[estado] += (indice,)
+
+        # Enlaces de falla por niveles (BFS); cada estado hereda las salidas de su enlace
+        cola = collections.deque(self._siguiente[0].values())
+        orden = [0, *cola]
+        while cola:
+            estado = cola.popleft()
+            for caracter, hijo in self._siguiente[estado].items():
+                falla = self._falla[estado]
+                while falla and caracter not in self._siguiente[falla]:
+                    falla = self._falla[falla]
+                destino = self._siguiente[falla].get(caracter, 0)
+                self._falla[hijo] = destino if destino != hijo else 0
+                self._salidas[hijo] += self._salidas[self._falla[hijo]]
+                cola.append(hijo)
+                orden.append(hijo)
+
+        # Transiciones completas: lo que un estado no tiene lo resuelve su enlace de falla,
+        # ya completo porque está más cerca de la raíz (orden por niveles)
+        self._transiciones = [None] * len(self._siguiente)
+        for estado in orden:
+            falla = self._transiciones[self._falla[estado]] if estado else None
+            self._transiciones[estado] = {
+                c: self._siguiente[estado].get(c, falla[c] if falla else 0) for c in ALFABETO
+            }
+
+    def buscar(self, texto: str):
+        """Genera (posición final, índice de la clave) por cada coincidencia en el texto normalizado."""
+        estado = 0
+        transiciones, salidas = self._transiciones, self._salidas
+        for posicion, caracter in enumerate(texto):
+            estado = transiciones[estado][caracter]
+            for indice in salidas[estado]:
+                yield posicion, indice
+
+    def categoria(self, texto: str) -> Optional[str]:
+        """
+        Categoría de la mejor coincidencia: primero las reglas del usuario, después la
+        clave más larga (más específica) y, a igualdad, la que aparece primero.
+        """
+        mejor, mejor_orden = None, None
+        estado = 0
+        transiciones, salidas = self._transiciones, self._salidas
+        for posicion, caracter in enumerate(texto):
+            estado = transiciones[estado][caracter]
+            for indice in salidas[estado]:
+                clave, (categoria, prioridad) = self.claves[indice]
+                orden = (-prioridad, -len(clave), posicion - len(clave))
+                if mejor_orden is None or orden < mejor_orden:
+                    mejor, mejor_orden = categoria, orden
+        return mejor
+
+
+def compilar(reglas: list = ()) -> Automata:
+    """Compila el diccionario base y las reglas del usuario ({patron, categoria}) en un autómata."""
+    claves = {}
+    for categoria, palabras in DICCIONARIO.items():
+        for palabra in palabras:
+            claves[normalizar_texto(palabra)] = (categoria, 0)
+    for regla in reglas:
+        clave = normalizar_texto(regla["patron"])
+        if clave.strip():
+            claves[clave] = (normalizar_categoria(regla["categoria"]), 1)
+    return Automata(claves)
+
+
+# Autómatas compilados, uno por repositorio; se recompilan cuando cambian las reglas del
+# usuario, también si las cambia otra réplica (ver cache.py)
+_automatas = cache.CacheTablas("categorizacion.automata", ("reglas_categoria",), maximo=16)
+
+
+class Categorizador:
+    """Clasifica descripciones con el autómata de las reglas del repositorio."""
+
+    def __init__(self, repositorio):
+        self.repositorio = repositorio
+
+    def automata(self) -> Automata:
+        """Autómata de las reglas actuales; sin caché coherente (usar_cache) se compila en cada uso."""
+        if not self.repositorio.usar_cache:
+            return compilar(self.repositorio.listar_reglas_categoria())
+        return _automatas.obtener(id(self.repositorio),
+                                  lambda: compilar(self.repositorio.listar_reglas_categoria()))
+
+    def categorizar(self, descripcion: Optional[str], tipo: Optional[str] = None,
+                    automata: Optional[Automata] = None) -> str:
+        """Categoría de una descripción; sin palabra clave, la del tipo de operación ('general' si no hay)."""
+        categoria = (automata or self.automata()).categoria(normalizar_texto(descripcion))
+        return categoria or CATEGORIA_POR_TIPO.get(tipo, CATEGORIA_POR_DEFECTO)
+
+
+def rellenar(repositorio, todas: bool = False, lote: int = 5000, tablas=TABLAS_CATEGORIZADAS) -> dict:
+    """
+    Categoriza las filas del libro sin categoría (o todas, para aplicar reglas nuevas) en una
+    sola pasada por clave primaria: cada lote lee `lote` filas a partir del último id, las
+    clasifica con el autómata (lineal en el largo de las descripciones) y escribe un UPDATE
+    por categoría, solo con las filas cuya categoría cambia (cada fila escrita también
+    actualiza los índices de texto de la tabla). Cada lote es su propia transacción, así que
+    se puede cortar y retomar.
+    """
+    automata = repositorio.categorizador.automata()
+    resultado = {}
+    for tabla in tablas:
+        inicio = time.perf_counter()
+        ultimo_id, filas_tabla, actualizadas, por_categoria_tabla = 0, 0, 0, collections.Counter()
+        while True:
+            with repositorio.transaccion():
+                filas = repositorio.filas_a_categorizar(tabla, ultimo_id, lote, todas)
+                if not filas:
+                    break
+                por_categoria = collections.defaultdict(list)
+                for fila in filas:
+                    categoria = repositorio.categorizador.categorizar(fila["descripcion"], fila["tipo"], automata)
+                    por_categoria_tabla[categoria] += 1
+                    if categoria != fila["categoria"]:
+                        por_categoria[categoria].append(fila["id"])
+                actualizadas += repositorio.asignar_categorias(tabla, por_categoria)
+            ultimo_id = filas[-1]["id"]
+            filas_tabla += len(filas)
+        segundos = time.perf_counter() - inicio
+        resultado[tabla] = {
+            "filas": filas_tabla,
+            "actualizadas": actualizadas,
+            "por_categoria": dict(por_categoria_tabla.most_common()),
+            "segundos": round(segundos, 3),
+            "filas_por_segundo": round(filas_tabla / segundos) if segundos > 0 else None
+        }
+    return resultado
+
+
+if __name__ == "__main__":
+    # python -m Asistente_Financiero.categorizacion [--todas] [--lote N]
+    import argparse
+    import json
+    import os
+
+    from .repositorio import crear_repositorio
+
+    parser = argparse.ArgumentParser(description="Categoriza las descripciones del libro (transacciones y saldo_actual).")
+    parser.add_argument("--todas", action="store_true", help="recategoriza también las filas que ya tienen categoría")
+    parser.add_argument("--lote", type=int, default=5000, help="filas por lote (default: 5000)")
+    args = parser.parse_args()
+    os.environ.setdefault("FINANZAS_RECURRENTES", "0")
+    print(json.dumps(rellenar(crear_repositorio(), args.todas, args.lote), indent=2, ensure_ascii=False))
@@ -0,0 +1,166 @@
+# Sumas de control por bloques del libro y conciliación de saldo_actual con historial_saldo
+import collections
+import re
+import time
+
+# Filas por bloque: el bloque de una fila es su id (saldo_id en historial_saldo) dividido por
+# TAMANO_BLOQUE. Cambiarlo obliga a volver a sellar (--sellar).
+TAMANO_BLOQUE = 1000
+
+# Tabla -> (columna que define el bloque, columnas del digesto del contenido, columna del movimiento).
+# La categoría no entra en el digesto: se recalcula al recategorizar (categorizacion.py).
+TABLAS_CONTROLADAS = {
+    "saldo_actual": ("id", ("id", "monto", "moneda", "descripcion", "updated_at"), "id"),
+    "historial_saldo": ("saldo_id", ("id", "saldo_id", "tipo_operacion", "monto_operacion", "saldo_anterior",
+                                     "saldo_nuevo", "descripcion", "fecha_operacion"), "saldo_id"),
+    "transacciones": ("id", ("id", "tipo", "monto", "fecha", "descripcion", "contraparte", "created_at"), None),
+}
+
+# Diferencias que se devuelven con detalle como máximo (el total se informa igual)
+LIMITE_DIFERENCIAS = 100
+
+# Descripción de historial_saldo: "<descripción del movimiento> (<monto> <moneda>)"
+_DESCRIPCION_HISTORIAL = re.compile(r"^(.*) \((\S+) (\S+)\)$", re.DOTALL)
+
+
+def _rango(bloque: int) -> dict:
+    if bloque < 0:
+        return {"bloque": bloque, "sin_vinculo": True}
+    return {"bloque": bloque, "desde_id": bloque * TAMANO_BLOQUE, "hasta_id": (bloque + 1) * TAMANO_BLOQUE - 1}
+
+
+def _coinciden(saldo: dict, historial: dict) -> bool:
+    """La fila de historial describe el movimiento: misma descripción, moneda y monto (sin signo)."""
+    partes = _DESCRIPCION_HISTORIAL.match(historial.get("descripcion") or "")
+    if partes is None:
+        return False
+    descripcion, monto, moneda = partes.groups()
+    try:
+        monto = float(monto)
+    except ValueError:
+        return False
+    return (descripcion == f"{saldo['descripcion']}" and moneda == saldo["moneda"]
+            and abs(monto - abs(float(saldo["monto"]))) <= 0.005)
+
+
+def revisar_bloque(repositorio, bloque: int) -> list:
+    """
+    Compara fila por fila un bloque de saldo_actual con las filas de historial_saldo que
+    registran sus movimientos. Devuelve las diferencias encontradas.
+    """
+    saldo = repositorio.filas_bloque("saldo_actual", bloque) if bloque >= 0 else []
+    por_movimiento = collections.defaultdict(list)
+    for fila in repositorio.filas_bloque("historial_saldo", bloque):
+        por_movimiento[fila["saldo_id"]].append(fila)
+
+    diferencias = []
+    for movimiento in saldo:
+        registros = por_movimiento.pop(movimiento["id"], [])
+        if not registros:
+            diferencias.append({"tipo": "sin_historial", "saldo_id": movimiento["id"],
+                                "descripcion": movimiento["descripcion"]})
+        elif len(registros) > 1:
+            diferencias.append({"tipo": "historial_duplicado", "saldo_id": movimiento["id"],
+                                "historial_ids": [r["id"] for r in registros]})
+        elif not _coinciden(movimiento, registros[0]):
+            diferencias.append({"tipo": "no_coincide", "saldo_id": movimiento["id"], "historial_id": registros[0]["id"],
+                                "saldo": f"{movimiento['descripcion']} ({movimiento['monto']} {movimiento['moneda']})",
+                                "historial": registros[0]["descripcion"]})
+    for saldo_id, registros in por_movimiento.items():
+        for registro in registros:
+            diferencias.append({"tipo": "historial_sin_vinculo" if saldo_id is None else "historial_huerfano",
+                                "historial_id": registro["id"], "saldo_id": saldo_id,
+                                "descripcion": registro["descripcion"]})
+    return diferencias
+
+
+def conciliar(repositorio, completa: bool = False, limite: int = LIMITE_DIFERENCIAS) -> dict:
+    """
+    Verifica el libro comparando sumas de control por bloques y revisa fila por fila solo
+    los bloques que difieren:
+      - saldo_actual contra historial_saldo: compara las sumas guardadas de ambas tablas
+        (lee bloques_control, no las tablas), así que cuesta lo mismo con cualquier tamaño.
+      - completa=True: además recalcula en la base las sumas de cada tabla del libro y las
+        compara con las selladas al insertar, lo que detecta filas editadas, borradas o
+        insertadas por fuera del asistente.
+    """
+    inicio = time.perf_counter()
+    a_revisar = {}
+    for fila in repositorio.diferencias_vinculo():
+        a_revisar.setdefault(fila["bloque"], set()).add("vinculo")
+
+    alterados = []
+    if completa:
+        for tabla in TABLAS_CONTROLADAS:
+            for fila in repositorio.diferencias_bloques(tabla):
+                filas = int(fila["filas"])
+                alterados.append({
+                    "tabla": tabla, **_rango(fila["bloque"]),
+                    "filas_de_mas": max(filas, 0), "filas_de_menos": max(-filas, 0),
+                    "contenido_distinto": bool(fila["digesto"])
+                })
+                if tabla != "transacciones":
+                    a_revisar.setdefault(fila["bloque"], set()).add(tabla)
+
+    diferencias = []
+    for bloque in sorted(a_revisar):
+        diferencias += [{**d, "bloque": bloque} for d in revisar_bloque(repositorio, bloque)]
+
+    return {
+        "consistente": not diferencias and not alterados,
+        "cobertura": repositorio.resumen_bloques(),
+        "bloques_revisados": len(a_revisar),
+        "bloques_alterados": alterados[:limite],
+        "total_bloques_alterados": len(alterados),
+        "diferencias": diferencias[:limite],
+        "total_diferencias": len(diferencias),
+        "segundos": round(time.perf_counter() - inicio, 3)
+    }
+
+
+def sellar(repositorio) -> dict:
+    """
+    Acepta el estado actual del libro: vincula el historial anterior al vínculo con sus
+    movimientos y vuelve a sellar los bloques que difieren. Es el paso inicial sobre una
+    base existente; después solo hace falta si se corrigieron filas a mano.
+    El historial sin vínculo se empareja por orden con los movimientos sin historial (cada
+    movimiento y su historial se insertaban juntos), solo si hay la misma cantidad de cada uno.
+    """
+    inicio = time.perf_counter()
+    with repositorio.transaccion():
+        historial = repositorio.historial_sin_vinculo()
+        saldo = repositorio.saldo_sin_historial()
+        vinculadas = 0
+        if historial and len(historial) == len(saldo):
+            vinculadas = repositorio.vincular_historial(list(zip(historial, saldo)))
+        sellados = {
+            tabla: repositorio.resellar_bloques(tabla, [f["bloque"] for f in repositorio.diferencias_bloques(tabla)])
+            for tabla in TABLAS_CONTROLADAS
+        }
+    return {
+        "historial_vinculado": vinculadas,
+        "historial_sin_vinculo": len(historial) - vinculadas,
+        "bloques_sellados": sellados,
+        "segundos": round(time.perf_counter() - inicio, 3)
+    }
+
+
+if __name__ == "__main__":
+    # python -m Asistente_Financiero.conciliacion [--completa] [--sellar]
+    import argparse
+    import json
+    import os
+
+    from .repositorio import crear_repositorio
+
+    parser = argparse.ArgumentParser(description="Concilia saldo_actual con historial_saldo por bloques.")
+    parser.add_argument("--completa", action="store_true",
+                        help="recalcula también las sumas de control de cada tabla (detecta filas editadas)")
+    parser.add_argument("--sellar", action="store_true",
+                        help="acepta el estado actual: vincula el historial existente y sella los bloques")
+    args = parser.parse_args()
+    os.environ.setdefault("FINANZAS_RECURRENTES", "0")
+    repositorio = crear_repositorio()
+    resultado = {"sellado": sellar(repositorio)} if args.sellar else {}
+    resultado["conciliacion"] = conciliar(repositorio, args.completa or args.sellar)
+    print(json.dumps(resultado, indent=2, ensure_ascii=False, default=str))
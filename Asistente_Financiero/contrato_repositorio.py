@@ -0,0 +1,270 @@
+# Verificación del contrato del repositorio: todos los backends deben comportarse igual
+import datetime
+
+from .categorizacion import compilar
+from .conciliacion import TABLAS_CONTROLADAS, TAMANO_BLOQUE, revisar_bloque
+from .repositorio import RepositorioFinanzas, crear_repositorio
+
+# Moneda de prueba (código ISO 4217 reservado para pruebas) y datos que no chocan con los reales
+MONEDA = "XTS"
+PERSONA = "Contrato Prueba"
+FECHA = "2999-12-30"
+MES = datetime.date(2999, 12, 1)
+
+
+def _cerca(a, b, tolerancia: float = 0.005) -> bool:
+    return a is not None and b is not None and abs(float(a) - float(b)) <= tolerancia
+
+
+def verificar_contrato(repo: RepositorioFinanzas) -> dict:
+    """
+    Ejercita cada operación del repositorio y compara los resultados con lo esperado.
+    Todo corre en una transacción que se deshace al final, así que puede ejecutarse sobre
+    una base con datos: las comprobaciones miden diferencias, no valores absolutos.
+    """
+    verificaciones = []
+
+    def comprobar(nombre: str, condicion: bool, detalle=None):
+        verificaciones.append({"verificacion": nombre, "ok": bool(condicion), "detalle": detalle})
+
+    try:
+        with repo.transaccion(revertir=True):
+            # Tasas de cambio: alta, actualización (mismo id) y lectura
+            rate_id = repo.guardar_tasa(MONEDA, "USD", 0.5)
+            comprobar("tasa_guardada", repo.obtener_tasa(MONEDA, "USD")["tasa"] == 0.5)
+            comprobar("tasa_actualizada_mismo_id", repo.guardar_tasa(MONEDA, "USD", 0.25) == rate_id)
+            tasa = repo.obtener_tasa(MONEDA, "USD")
+            comprobar("tasa_vigente", tasa["tasa"] == 0.25 and isinstance(tasa["fecha_actualizacion"], str), tasa)
+            comprobar("tasa_inexistente", repo.obtener_tasa("XXX", "USD") is None)
+
+            # Transacciones y rollup mensual
+            balance_inicial = repo.balance_transacciones()
+            repo.agregar_transaccion("ingreso", 100, FECHA, "zzcontrato sueldo", PERSONA)
+            repo.agregar_transaccion("gasto", 30.1, FECHA, "zzcontrato comida")
+            comprobar("balance_transacciones", _cerca(repo.balance_transacciones() - balance_inicial, 69.9))
+            ultimas = repo.listar_transacciones(2)
+            comprobar("listar_transacciones_orden",
+                      [t["descripcion"] for t in ultimas] == ["zzcontrato comida", "zzcontrato sueldo"]
+                      and ultimas[0]["fecha"] == FECHA, ultimas)
+            reporte = repo.reporte_mensual(MES, MES)
+            comprobar("reporte_mensual",
+                      len(reporte) == 1 and reporte[0]["mes"].startswith("2999-12")
+                      and _cerca(reporte[0]["ingresos"], 100) and _cerca(reporte[0]["gastos"], 30.1)
+                      and reporte[0]["prestamos"] is None and _cerca(reporte[0]["balance"], 69.9)
+                      and reporte[0]["cantidad"] == 2, reporte)
+            por_contraparte = repo.reporte_mensual(MES, MES, por_contraparte=True)
+            comprobar("reporte_mensual_por_contraparte",
+                      sorted(f["contraparte"] for f in por_contraparte) == ["", PERSONA], por_contraparte)
+
+            # Búsqueda
+            resultados, total = repo.buscar("zzcontrato", ["transacciones"], 1, 0)
+            comprobar("buscar_paginado", total >= 2 and len(resultados) == 1
+                      and resultados[0]["origen"] == "transacciones", resultados)
+
+            # Saldo disponible, rollup diario e historial
+            def saldo_moneda():
+                return next((s["monto"] for s in repo.saldos_por_moneda() if s["moneda"] == MONEDA), 0)
+
+            hoy = datetime.date.today()
+            serie_inicial = repo.serie_patrimonio(hoy - datetime.timedelta(days=2), "dia")
+            patrimonio_inicial = serie_inicial[-1][1] if serie_inicial else 0
+            saldo_inicial = saldo_moneda()
+            saldo_nuevo = repo.registrar_movimiento_saldo(100, MONEDA, "zzcontrato deposito", "prueba", 25, 10)
+            comprobar("movimiento_saldo_ingreso", saldo_nuevo == 35)
+            saldo_nuevo = repo.registrar_movimiento_saldo(-40.5, MONEDA, "zzcontrato retiro", "prueba", 10.13, 35)
+            comprobar("movimiento_saldo_egreso", _cerca(saldo_nuevo, 24.87))
+            comprobar("saldos_por_moneda", _cerca(saldo_moneda() - saldo_inicial, 59.5))
+            historial = repo.historial_saldo(2)
+            comprobar("historial_saldo_orden",
+                      historial[0]["tipo_operacion"] == "prueba" and _cerca(historial[0]["saldo_nuevo"], 24.87)
+                      and historial[0]["descripcion"] == f"zzcontrato retiro (40.5 {MONEDA})", historial)
+            comprobar("posiciones_por_moneda", _cerca(repo.posiciones_por_moneda().get(MONEDA, 0) - saldo_inicial, 59.5))
+            serie = repo.serie_patrimonio(hoy - datetime.timedelta(days=2), "dia")
+            comprobar("serie_patrimonio",
+                      [f[0] for f in serie] == [(hoy - datetime.timedelta(days=d)).isoformat() for d in (2, 1, 0)]
+                      and _cerca(serie[-1][1] - (patrimonio_inicial or 0), 59.5 * 0.25), serie)
+            repo.registrar_movimientos_saldo([
+                {"monto": 10, "moneda": MONEDA, "descripcion": "zzcontrato lote a", "tipo_operacion": "lote",
+                 "monto_usd": 2.5, "saldo_anterior_usd": 0, "saldo_nuevo_usd": 2.5},
+                {"monto": -4, "moneda": MONEDA, "descripcion": "zzcontrato lote b", "tipo_operacion": "lote",
+                 "monto_usd": 1, "saldo_anterior_usd": 2.5, "saldo_nuevo_usd": 1.5}
+            ])
+            historial = repo.historial_saldo(2)
+            comprobar("movimientos_por_lote",
+                      _cerca(saldo_moneda() - saldo_inicial, 65.5)
+                      and [h["descripcion"] for h in historial]
+                      == [f"zzcontrato lote b (4 {MONEDA})", f"zzcontrato lote a (10 {MONEDA})"], historial)
+            comprobar("reconstruir_saldo_diario", repo.reconstruir_saldo_diario() >= 1)
+            comprobar("saldo_tras_reconstruir", _cerca(saldo_moneda() - saldo_inicial, 65.5))
+
+            # Préstamos, pagos y exposición por persona
+            loan_id = repo.crear_prestamo(1000, MONEDA, PERSONA, 10, False, 0, 0, 100, FECHA, 0.5,
+                                          "zzcontrato prestamo", 1100)
+            repo.registrar_exposicion(PERSONA, MONEDA, 1, 1000, 100, 100, nuevo=True)
+            prestamo = repo.obtener_prestamo(loan_id, solo_activo=True, bloquear=True)
+            comprobar("obtener_prestamo",
+                      prestamo is not None and prestamo["estado"] == "activo"
+                      and prestamo["tiene_intermediario"] is False and prestamo["fecha_prestamo"] == FECHA
+                      and _cerca(prestamo["saldo_pendiente"], 1100) and prestamo["ganancia_cobrada"] == 0, prestamo)
+            comprobar("listar_prestamos_activos", loan_id in [p["id"] for p in repo.listar_prestamos("activo")])
+            comprobar("monedas_prestamos_activos", MONEDA in repo.monedas_prestamos_activos())
+
+            payment_id = repo.registrar_pago_prestamo(loan_id, 550, "2999-12-31", 50, "zzcontrato pago", 550, False)
+            pagos = repo.listar_pagos_prestamo(loan_id)
+            comprobar("listar_pagos_prestamo",
+                      [p["id"] for p in pagos] == [payment_id] and _cerca(pagos[0]["monto"], 550)
+                      and pagos[0]["fecha_pago"] == "2999-12-31", pagos)
+            prestamo = repo.obtener_prestamo(loan_id)
+            comprobar("pago_actualiza_prestamo",
+                      prestamo["estado"] == "activo" and _cerca(prestamo["saldo_pendiente"], 550)
+                      and _cerca(prestamo["ganancia_cobrada"], 50) and _cerca(prestamo["monto_cobrado"], 550), prestamo)
+            repo.registrar_exposicion(PERSONA, MONEDA, 0, -500, -50, -50)
+            exposicion = repo.exposicion_contrapartes(f"  {PERSONA.upper()} ")
+            comprobar("exposicion_contraparte",
+                      len(exposicion) == 1 and exposicion[0]["nombre"] == PERSONA
+                      and exposicion[0]["prestamos_activos"] == 1 and _cerca(exposicion[0]["monto_activo"], 500)
+                      and _cerca(exposicion[0]["intereses_pendientes"], 50)
+                      and exposicion[0]["prestamos_totales"] == 1 and _cerca(exposicion[0]["monto_historico"], 1000),
+                      exposicion)
+            comprobar("exposicion_todas", PERSONA in [e["nombre"] for e in repo.exposicion_contrapartes()])
+
+            pnl, _ = repo.pnl_cambiario(["id", "persona", "moneda", "estado"], "activo", {MONEDA: 0.4})
+            fila = next((f for f in pnl if f[0] == loan_id), None)
+            comprobar("pnl_no_realizado",
+                      fila is not None and fila[4] == 1 and _cerca(fila[5], 500) and _cerca(fila[6], 400)
+                      and _cerca(fila[7], 0) and _cerca(fila[8], -100) and _cerca(fila[9], 40), fila)
+
+            repo.finalizar_prestamo(loan_id, 0.3)
+            comprobar("finalizar_prestamo", repo.obtener_prestamo(loan_id, solo_activo=True) is None)
+            prestamo = repo.obtener_prestamo(loan_id)
+            comprobar("prestamo_finalizado",
+                      prestamo["estado"] == "finalizado" and prestamo["fecha_finalizacion"] == hoy.isoformat()
+                      and _cerca(prestamo["saldo_pendiente"], 0) and _cerca(prestamo["ganancia_cobrada"], 100)
+                      and _cerca(prestamo["cotizacion_finalizacion"], 0.3), prestamo)
+            pnl, _ = repo.pnl_cambiario(["moneda"], "finalizado", {})
+            fila = next((f for f in pnl if f[0] == MONEDA), None)
+            comprobar("pnl_realizado", fila is not None and _cerca(fila[4], -200) and _cerca(fila[5], 0), fila)
+
+            prestamos, transacciones = repo.historial_contraparte(PERSONA.lower(), 10)
+            comprobar("historial_contraparte",
+                      [p["id"] for p in prestamos] == [loan_id] and len(transacciones) == 1
+                      and _cerca(transacciones[0]["monto"], 100), (prestamos, transacciones))
+
+            # Reglas recurrentes: vencimiento, avance y baja
+            regla_id = repo.crear_regla_recurrente("gasto", 12.5, MONEDA, "zzcontrato alquiler", "mensual", 31, FECHA)
+            vencidas = [r for r in repo.reglas_vencidas(datetime.date(2999, 12, 31)) if r["id"] == regla_id]
+            comprobar("reglas_vencidas",
+                      len(vencidas) == 1 and vencidas[0]["proxima_fecha"] == FECHA and vencidas[0]["dia"] == 31
+                      and _cerca(vencidas[0]["monto"], 12.5) and vencidas[0]["activa"] is True, vencidas)
+            comprobar("reglas_no_vencidas",
+                      regla_id not in [r["id"] for r in repo.reglas_vencidas(datetime.date(2999, 12, 29))])
+            repo.avanzar_regla_recurrente(regla_id, "3000-01-31", FECHA, 1)
+            regla = next((r for r in repo.listar_reglas_recurrentes() if r["id"] == regla_id), None)
+            comprobar("avanzar_regla_recurrente",
+                      regla is not None and regla["proxima_fecha"] == "3000-01-31"
+                      and regla["ultima_aplicacion"] == FECHA and regla["aplicaciones"] == 1, regla)
+            comprobar("desactivar_regla_recurrente",
+                      repo.desactivar_regla_recurrente(regla_id) and not repo.desactivar_regla_recurrente(regla_id)
+                      and regla_id not in [r["id"] for r in repo.listar_reglas_recurrentes()]
+                      and regla_id in [r["id"] for r in repo.listar_reglas_recurrentes(incluir_inactivas=True)])
+
+            # Estadísticas de gasto por categoría y presupuestos
+            categoria = "zzcontrato"
+            previa = repo.bloquear_estadistica_categoria(categoria)
+            comprobar("estadistica_categoria_nueva", previa["cantidad"] == 0 and previa["media_usd"] == 0, previa)
+            repo.guardar_estadistica_categoria(categoria, 2, 15.0, 50.0, 20)
+            repo.sumar_gasto_categoria(categoria, datetime.date(2999, 12, 30), 10)
+            repo.sumar_gasto_categoria(categoria, datetime.date(2999, 12, 31), 20)
+            repo.sumar_gasto_categoria(categoria, datetime.date(2999, 12, 31), 0.5)
+            estadistica = repo.bloquear_estadistica_categoria(categoria)
+            comprobar("guardar_estadistica_categoria",
+                      estadistica["cantidad"] == 2 and estadistica["media_usd"] == 15.0
+                      and estadistica["m2_usd"] == 50.0 and _cerca(estadistica["maximo_usd"], 20), estadistica)
+            por_dia = repo.gasto_categoria_por_dia(categoria, datetime.date(2999, 12, 31))
+            comprobar("gasto_categoria_por_dia",
+                      len(por_dia) == 1 and por_dia[0]["fecha"] == "2999-12-31" and por_dia[0]["cantidad"] == 2
+                      and _cerca(por_dia[0]["total_usd"], 20.5), por_dia)
+            repo.fijar_presupuesto(categoria, 100, "mensual")
+            repo.fijar_presupuesto(categoria, 50, "semanal")
+            presupuesto = repo.obtener_presupuesto(categoria)
+            fila = next((f for f in repo.listar_estadisticas_categorias() if f["categoria"] == categoria), None)
+            comprobar("presupuesto_categoria",
+                      _cerca(presupuesto["limite_usd"], 50) and presupuesto["periodo"] == "semanal"
+                      and fila is not None and fila["cantidad"] == 2 and _cerca(fila["limite_usd"], 50), fila)
+            comprobar("eliminar_presupuesto",
+                      repo.eliminar_presupuesto(categoria) and repo.obtener_presupuesto(categoria) is None
+                      and not repo.eliminar_presupuesto(categoria))
+
+            # Categorización: al insertar, reglas del usuario y relleno por lotes
+            transaccion_id = repo.agregar_transaccion("gasto", 5, FECHA, "zzcontrato Supermercado Coto")
+            ultima = repo.listar_transacciones(1)[0]
+            comprobar("categoria_al_insertar", ultima["id"] == transaccion_id and ultima["categoria"] == "supermercado",
+                      ultima)
+            reporte = {r["categoria"]: r for r in repo.reporte_categorias_transacciones(MES, MES)}
+            comprobar("reporte_categorias_transacciones",
+                      _cerca(reporte.get("supermercado", {}).get("gastos"), 5)
+                      and _cerca(reporte.get("sueldo", {}).get("ingresos"), 100), reporte)
+            regla_categoria = repo.crear_regla_categoria("  ZZContrato  Coto ", "zzcontrato")
+            comprobar("regla_categoria_reemplaza",
+                      repo.crear_regla_categoria("zzcontrato coto", "zzotra") == regla_categoria
+                      and [(r["patron"], r["categoria"]) for r in repo.listar_reglas_categoria()
+                           if r["id"] == regla_categoria] == [("zzcontrato coto", "zzotra")])
+            repo.crear_regla_categoria("zzcontrato coto", "zzcontrato")
+            # El autómata en caché se recompila al confirmar; dentro de la transacción se compila a mano
+            automata = compilar(repo.listar_reglas_categoria())
+            repo.asignar_categorias("transacciones", {automata.categoria(" super zzcontrato coto "): [transaccion_id]})
+            comprobar("asignar_categorias", repo.listar_transacciones(1)[0]["categoria"] == "zzcontrato")
+            comprobar("eliminar_regla_categoria",
+                      repo.eliminar_regla_categoria(regla_categoria)
+                      and regla_categoria not in [r["id"] for r in repo.listar_reglas_categoria()]
+                      and compilar(repo.listar_reglas_categoria()).categoria(" super zzcontrato coto ") == "supermercado")
+
+            # Sumas de control por bloques: se mantienen al insertar y detectan cambios por fuera.
+            # Se comparan diferencias antes y después (la base puede tener bloques sin sellar).
+            def diferencias(tabla):
+                return {f["bloque"]: (int(f["filas"]), int(f["digesto"]), int(f["vinculo"]))
+                        for f in repo.diferencias_bloques(tabla)}
+
+            previas = {tabla: diferencias(tabla) for tabla in TABLAS_CONTROLADAS}
+            vinculo_previo = repo.diferencias_vinculo()
+            transaccion_id = repo.agregar_transaccion("gasto", 7, FECHA, "zzcontrato control")
+            repo.registrar_movimiento_saldo(-3, MONEDA, "zzcontrato control", "prueba", 0.75, 10)
+            comprobar("bloques_al_insertar",
+                      all(diferencias(tabla) == previas[tabla] for tabla in TABLAS_CONTROLADAS)
+                      and repo.diferencias_vinculo() == vinculo_previo)
+            # Las ediciones "por fuera" van por SQL directo, como las haría otra herramienta
+            movimiento = repo._fila("SELECT id FROM saldo_actual ORDER BY id DESC LIMIT 1;")
+            registros = [f for f in repo.filas_bloque("historial_saldo", movimiento["id"] // TAMANO_BLOQUE)
+                         if f["saldo_id"] == movimiento["id"]]
+            comprobar("historial_vinculado",
+                      len(registros) == 1 and registros[0]["descripcion"] == f"zzcontrato control (3 {MONEDA})",
+                      registros)
+            repo._ejecutar("UPDATE transacciones SET monto = 8 WHERE id = %s;", (transaccion_id,))
+            bloque = transaccion_id // TAMANO_BLOQUE
+            alterado = diferencias("transacciones").get(bloque)
+            comprobar("bloque_editado", alterado is not None
+                      and alterado[0] == previas["transacciones"].get(bloque, (0, 0, 0))[0]
+                      and alterado != previas["transacciones"].get(bloque), alterado)
+            repo._ejecutar("DELETE FROM historial_saldo WHERE id = %s;", (registros[0]["id"],))
+            faltantes = [d for d in revisar_bloque(repo, movimiento["id"] // TAMANO_BLOQUE)
+                         if d.get("saldo_id") == movimiento["id"]]
+            comprobar("historial_faltante", [d["tipo"] for d in faltantes] == ["sin_historial"], faltantes)
+    except Exception as e:
+        comprobar("ejecucion", False, f"{type(e).__name__}: {e}")
+
+    fallidas = [v for v in verificaciones if not v["ok"]]
+    return {
+        "status": "success" if not fallidas else "error",
+        "backend": repo.nombre,
+        "verificaciones": len(verificaciones),
+        "fallidas": fallidas
+    }
+
+
+if __name__ == "__main__":
+    # python -m Asistente_Financiero.contrato_repositorio [postgres|sqlite|memoria]
+    import json
+    import sys
+
+    print(json.dumps(verificar_contrato(crear_repositorio(sys.argv[1] if len(sys.argv) > 1 else None)),
+                     indent=2, ensure_ascii=False, default=str))
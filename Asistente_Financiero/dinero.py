@@ -0,0 +1,194 @@
+# Representación de dinero en unidades mínimas enteras (centavos) por moneda
+import decimal
+from dataclasses import dataclass
+from fractions import Fraction
+
+import numpy as np
+
+# Decimales de cada moneda; las que no figuran usan ESCALA_POR_DEFECTO
+ESCALAS = {"USD": 2, "ARS": 2, "BOB": 2, "EUR": 2, "BRL": 2, "CLP": 0, "JPY": 0, "PYG": 0}
+ESCALA_POR_DEFECTO = 2
+
+# Límite para operar en int64 sin desbordar (con margen para el redondeo)
+_INT64_SEGURO = 2 ** 62
+
+
+def escala(moneda: str) -> int:
+    """Cantidad de decimales de la moneda."""
+    return ESCALAS.get(moneda.upper(), ESCALA_POR_DEFECTO)
+
+
+def a_minimo(monto, moneda: str) -> int:
+    """
+    Convierte un monto (float, Decimal, int o str) a unidades mínimas enteras de la
+    moneda, redondeando al centavo más cercano (mitades hacia afuera).
+    """
+    if isinstance(monto, float):
+        # repr del float evita arrastrar el error binario (0.1 -> '0.1')
+        monto = repr(monto)
+    valor = decimal.Decimal(monto).scaleb(escala(moneda))
+    return int(valor.quantize(decimal.Decimal(1), rounding=decimal.ROUND_HALF_UP))
+
+
+def desde_minimo(unidades: int, moneda: str) -> float:
+    """Convierte unidades mínimas a float para respuestas JSON."""
+    return float(decimal.Decimal(int(unidades)).scaleb(-escala(moneda)))
+
+
+def _dividir_redondeando(numerador: int, denominador: int) -> int:
+    """División entera con redondeo al más cercano (mitades hacia afuera)."""
+    q = (2 * abs(numerador) + denominador) // (2 * denominador)
+    return q if numerador >= 0 else -q
+
+
+def como_fraccion(valor) -> Fraction:
+    """Convierte una tasa o porcentaje (float, Decimal, str, Fraction) en fracción exacta."""
+    if isinstance(valor, Fraction):
+        return valor
+    if isinstance(valor, float):
+        valor = repr(valor)
+    return Fraction(decimal.Decimal(valor))
+
+
+def convertir_minimo(unidades: int, moneda_origen: str, tasa, moneda_destino: str) -> int:
+    """
+    Convierte unidades mínimas de una moneda a otra con una tasa (cuántas unidades de
+    destino vale 1 unidad de origen). La tasa puede ser una Fraction para tasas
+    inversas exactas (ej: Fraction(1) / Fraction('1362.33')).
+    """
+    tasa = como_fraccion(tasa)
+    numerador = unidades * tasa.numerator * 10 ** escala(moneda_destino)
+    denominador = tasa.denominator * 10 ** escala(moneda_origen)
+    return _dividir_redondeando(numerador, denominador)
+
+
+def aplicar_porcentaje(unidades: int, porcentaje) -> int:
+    """Calcula el porcentaje de un monto en unidades mínimas (redondeado al centavo)."""
+    fraccion = como_fraccion(porcentaje) / 100
+    return _dividir_redondeando(unidades * fraccion.numerator, fraccion.denominator)
+
+
+def a_minimo_array(montos, moneda: str) -> np.ndarray:
+    """Convierte una secuencia de montos a un arreglo int64 de unidades mínimas."""
+    return np.fromiter((a_minimo(m, moneda) for m in montos), dtype=np.int64)
+
+
+def sumar_array(unidades: np.ndarray) -> int:
+    """Suma exacta de un arreglo de unidades mínimas."""
+    if unidades.size and int(np.abs(unidades).max()) * unidades.size >= _INT64_SEGURO:
+        return sum(int(u) for u in unidades)
+    return int(unidades.sum())
+
+
+def convertir_array(unidades: np.ndarray, moneda_origen: str, tasa, moneda_destino: str) -> np.ndarray:
+    """
+    Convierte un arreglo de unidades mínimas con aritmética entera vectorizada.
+    Si los productos intermedios no entran en int64 se usa aritmética de Python (exacta).
+    """
+    tasa = como_fraccion(tasa)
+    factor = tasa.numerator * 10 ** escala(moneda_destino)
+    denominador = tasa.denominator * 10 ** escala(moneda_origen)
+    maximo = int(np.abs(unidades).max()) if unidades.size else 0
+    if maximo * factor * 2 + denominador >= _INT64_SEGURO or denominador * 2 >= _INT64_SEGURO:
+        return np.array([_dividir_redondeando(int(u) * factor, denominador) for u in unidades], dtype=object)
+    numerador = unidades * factor
+    q = (2 * np.abs(numerador) + denominador) // (2 * denominador)
+    return np.where(numerador >= 0, q, -q)
+
+
+def convertir_por_moneda(unidades: np.ndarray, monedas: np.ndarray, tasas: dict, moneda_destino: str) -> np.ndarray:
+    """
+    Convierte un arreglo de montos en distintas monedas a moneda_destino, un grupo
+    vectorizado por moneda. tasas indica cuántas unidades de destino vale 1 unidad de
+    cada moneda; los montos de monedas sin tasa quedan en 0.
+    """
+    resultado = np.zeros(unidades.shape, dtype=object)
+    for moneda, tasa in tasas.items():
+        mascara = monedas == moneda
+        if mascara.any():
+            resultado[mascara] = convertir_array(unidades[mascara], moneda, tasa, moneda_destino)
+    return resultado
+
+
+@dataclass(frozen=True, slots=True)
+class Dinero:
+    """Monto exacto en unidades mínimas de una moneda."""
+    unidades: int
+    moneda: str
+
+    @classmethod
+    def de(cls, monto, moneda: str) -> "Dinero":
+        moneda = moneda.upper()
+        return cls(a_minimo(monto, moneda), moneda)
+
+    def __add__(self, otro: "Dinero") -> "Dinero":
+        if otro.moneda != self.moneda:
+            raise ValueError(f"No se pueden sumar {self.moneda} y {otro.moneda}")
+        return Dinero(self.unidades + otro.unidades, self.moneda)
+
+    def __sub__(self, otro: "Dinero") -> "Dinero":
+        if otro.moneda != self.moneda:
+            raise ValueError(f"No se pueden restar {self.moneda} y {otro.moneda}")
+        return Dinero(self.unidades - otro.unidades, self.moneda)
+
+    def __neg__(self) -> "Dinero":
+        return Dinero(-self.unidades, self.moneda)
+
+    def porcentaje(self, porcentaje) -> "Dinero":
+        return Dinero(aplicar_porcentaje(self.unidades, porcentaje), self.moneda)
+
+    def convertir(self, tasa, moneda_destino: str) -> "Dinero":
+        moneda_destino = moneda_destino.upper()
+        return Dinero(convertir_minimo(self.unidades, self.moneda, tasa, moneda_destino), moneda_destino)
+
+    def a_float(self) -> float:
+        return desde_minimo(self.unidades, self.moneda)
+
+    def a_decimal(self) -> decimal.Decimal:
+        return decimal.Decimal(self.unidades).scaleb(-escala(self.moneda))
+
+
+def _benchmark(n: int = 1_000_000) -> dict:
+    """
+    Compara sumas y conversiones de n montos ARS con float, Decimal y enteros (numpy).
+    Ejecutar con: python -m Asistente_Financiero.dinero [n]
+    """
+    import random
+    import time
+
+    rng = random.Random(42)
+    montos = [decimal.Decimal(rng.randrange(1, 10 ** 11)).scaleb(-2) for _ in range(n)]
+    flotantes = [float(m) for m in montos]
+    unidades = a_minimo_array(montos, "ARS")
+    tasa = Fraction(1) / Fraction(decimal.Decimal("1362.33"))
+    tasa_float = 1 / 1362.33
+
+    resultados = {}
+
+    def medir(nombre, funcion):
+        inicio = time.perf_counter()
+        valor = funcion()
+        resultados[nombre] = {"ms": round((time.perf_counter() - inicio) * 1000, 2), "resultado": valor}
+
+    medir("suma_float", lambda: round(sum(flotantes), 2))
+    medir("suma_decimal", lambda: sum(montos))
+    medir("suma_enteros", lambda: desde_minimo(sumar_array(unidades), "ARS"))
+    medir("conversion_float", lambda: round(sum(round(f * tasa_float, 2) for f in flotantes), 2))
+    medir("conversion_decimal", lambda: sum(
+        (m / decimal.Decimal("1362.33")).quantize(decimal.Decimal("0.01"), rounding=decimal.ROUND_HALF_UP)
+        for m in montos
+    ))
+    medir("conversion_enteros", lambda: desde_minimo(sumar_array(convertir_array(unidades, "ARS", tasa, "USD")), "USD"))
+
+    resultados["suma_exacta"] = str(resultados["suma_decimal"]["resultado"]) == \
+        f"{resultados['suma_enteros']['resultado']:.2f}"
+    for clave in ("suma_decimal", "conversion_decimal"):
+        resultados[clave]["resultado"] = float(resultados[clave]["resultado"])
+    return resultados
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    print(json.dumps(_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000), indent=2))
@@ -0,0 +1,127 @@
+# Escritor en segundo plano de historial_saldo: saca la auditoría del camino crítico
+import atexit
+import collections
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class EscritorHistorial:
+    """
+    Cola en memoria de filas de historial_saldo que un hilo de fondo inserta por lotes
+    (un INSERT de varias filas por lote, en su propia transacción).
+
+    Garantías:
+      - Solo se encolan filas de transacciones confirmadas (el repositorio las entrega
+        al hacer commit; si la transacción se deshace, se descartan).
+      - El orden de inserción respeta el orden de encolado.
+      - Si un lote falla, se reintenta en el siguiente ciclo (no se pierde).
+      - vaciar() bloquea hasta que todo lo encolado esté escrito; se llama antes de leer
+        el historial y al cerrar el proceso (atexit).
+    """
+
+    def __init__(self, repositorio, tamano_lote: int = 200, intervalo: float = 0.2):
+        self.repositorio = repositorio
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        self._pendientes = collections.deque()
+        self._en_escritura = 0
+        self._condicion = threading.Condition()
+        self._cerrado = False
+        self._esperando = 0
+        self._hilo = None
+        self.ultimo_error = None
+        self.lotes_escritos = 0
+        self.filas_escritas = 0
+        atexit.register(self.cerrar)
+
+    def encolar(self, filas: list) -> None:
+        """Agrega filas (tuplas en el orden de las columnas de historial_saldo) a la cola."""
+        if not filas:
+            return
+        with self._condicion:
+            if self._cerrado:
+                # Después de cerrar no hay hilo: se escriben en el momento
+                self.repositorio._insertar_historial(filas)
+                return
+            self._pendientes.extend(filas)
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._ciclo, name="escritor-historial", daemon=True)
+                self._hilo.start()
+            self._condicion.notify_all()
+
+    def pendientes(self) -> int:
+        """Filas encoladas o en escritura que todavía no están en la base."""
+        with self._condicion:
+            return len(self._pendientes) + self._en_escritura
+
+    def vaciar(self, timeout: float = 10.0) -> bool:
+        """Espera a que se escriba todo lo encolado. Devuelve False si venció el tiempo."""
+        limite = time.monotonic() + timeout
+        with self._condicion:
+            # Mientras alguien espera, el hilo escribe sin juntar más filas
+            self._esperando += 1
+            self._condicion.notify_all()
+            try:
+                while self._pendientes or self._en_escritura:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        return False
+                    self._condicion.wait(restante)
+            finally:
+                self._esperando -= 1
+        return True
+
+    def cerrar(self, timeout: float = 10.0) -> bool:
+        """Escribe lo pendiente y detiene el hilo (se registra con atexit)."""
+        vaciado = self.vaciar(timeout)
+        with self._condicion:
+            self._cerrado = True
+            self._condicion.notify_all()
+            hilo = self._hilo
+        if hilo is not None:
+            hilo.join(timeout)
+        return vaciado
+
+    def _ciclo(self) -> None:
+        while True:
+            with self._condicion:
+                # Espera filas (o un cierre) y junta hasta llenar el lote o cumplir el intervalo
+                while not self._pendientes and not self._cerrado:
+                    self._condicion.wait()
+                if not self._pendientes and self._cerrado:
+                    return
+                limite = time.monotonic() + self.intervalo
+                while len(self._pendientes) < self.tamano_lote and not self._cerrado and not self._esperando:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._condicion.wait(restante)
+                lote = [self._pendientes.popleft()
+                        for _ in range(min(self.tamano_lote, len(self._pendientes)))]
+                self._en_escritura = len(lote)
+
+            try:
+                with self.repositorio.transaccion():
+                    self.repositorio._insertar_historial(lote)
+                error = None
+            except Exception as e:
+                error = e
+
+            with self._condicion:
+                self._en_escritura = 0
+                if error is None:
+                    self.lotes_escritos += 1
+                    self.filas_escritas += len(lote)
+                else:
+                    # Vuelve al frente de la cola, en el mismo orden, y reintenta más tarde
+                    self.ultimo_error = f"{type(error).__name__}: {error}"
+                    self._pendientes.extendleft(reversed(lote))
+                    log.error("Error escribiendo %d fila(s) de historial: %s", len(lote), self.ultimo_error)
+                self._condicion.notify_all()
+                if error is not None:
+                    if self._cerrado:
+                        return
+                    self._condicion.wait(min(5.0, self.intervalo * 10))
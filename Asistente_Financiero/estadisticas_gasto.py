@@ -0,0 +1,162 @@
+# Estadísticas de gasto por categoría: se actualizan en cada gasto y detectan gastos inusuales
+import datetime
+import math
+import os
+from typing import Optional
+
+CATEGORIA_POR_DEFECTO = "general"
+PERIODOS_PRESUPUESTO = ("mensual", "semanal")
+
+# Un gasto es inusual si supera la media en UMBRAL_Z desvíos o en UMBRAL_VECES_MEDIA veces,
+# una vez que la categoría tiene MUESTRAS_MINIMAS gastos (antes la media no dice mucho)
+MUESTRAS_MINIMAS = int(os.environ.get("FINANZAS_ANOMALIA_MUESTRAS_MINIMAS", "5"))
+UMBRAL_Z = float(os.environ.get("FINANZAS_ANOMALIA_Z", "3"))
+UMBRAL_VECES_MEDIA = float(os.environ.get("FINANZAS_ANOMALIA_VECES_MEDIA", "5"))
+# Fracción del presupuesto a partir de la cual se avisa (al pasar el 100% se avisa como excedido)
+AVISO_PRESUPUESTO = float(os.environ.get("FINANZAS_AVISO_PRESUPUESTO", "0.8"))
+
+
+def normalizar_categoria(categoria: Optional[str]) -> str:
+    categoria = (categoria or "").strip().lower()
+    return categoria[:50] if categoria else CATEGORIA_POR_DEFECTO
+
+
+def welford(cantidad: int, media: float, m2: float, valor: float) -> tuple:
+    """Suma un valor a (cantidad, media, m2) sin recorrer los anteriores (método de Welford)."""
+    cantidad += 1
+    delta = valor - media
+    media += delta / cantidad
+    m2 += delta * (valor - media)
+    return cantidad, media, m2
+
+
+def desvio(cantidad: int, m2: float) -> float:
+    """Desvío estándar muestral a partir de m2."""
+    return math.sqrt(m2 / (cantidad - 1)) if cantidad > 1 else 0.0
+
+
+def inicio_periodo(periodo: str, hoy: datetime.date) -> datetime.date:
+    if periodo == "semanal":
+        return hoy - datetime.timedelta(days=hoy.weekday())
+    return hoy.replace(day=1)
+
+
+def ventanas(por_dia: list, hoy: datetime.date) -> dict:
+    """Gasto de los últimos 7 y 30 días (incluido hoy), de la semana y del mes en curso."""
+    limites = {
+        "ultimos_7_dias": hoy - datetime.timedelta(days=6),
+        "ultimos_30_dias": hoy - datetime.timedelta(days=29),
+        "semana": inicio_periodo("semanal", hoy),
+        "mes": inicio_periodo("mensual", hoy),
+    }
+    return {
+        nombre: round(sum(float(d["total_usd"]) for d in por_dia if str(d["fecha"])[:10] >= desde.isoformat()), 2)
+        for nombre, desde in limites.items()
+    }
+
+
+def _anomalia(cantidad: int, media: float, m2: float, monto_usd: float) -> Optional[dict]:
+    """Compara el gasto con las estadísticas previas de su categoría."""
+    if cantidad < MUESTRAS_MINIMAS or media <= 0:
+        return None
+    sigma = desvio(cantidad, m2)
+    z = (monto_usd - media) / sigma if sigma > 0 else None
+    veces = monto_usd / media
+    if (z is not None and z >= UMBRAL_Z) or veces >= UMBRAL_VECES_MEDIA:
+        return {
+            "tipo": "anomalia",
+            "mensaje": f"Gasto inusual: ${monto_usd:.2f} USD es {veces:.1f} veces el gasto habitual "
+                       f"(${media:.2f} USD de media en {cantidad} gastos)",
+            "veces_media": round(veces, 2),
+            "z": round(z, 2) if z is not None else None
+        }
+    return None
+
+
+def _estado_presupuesto(presupuesto: Optional[dict], gastado: dict) -> Optional[dict]:
+    if presupuesto is None:
+        return None
+    limite = float(presupuesto["limite_usd"])
+    usado = gastado["semana" if presupuesto["periodo"] == "semanal" else "mes"]
+    return {
+        "periodo": presupuesto["periodo"],
+        "limite_usd": limite,
+        "gastado_usd": usado,
+        "disponible_usd": round(limite - usado, 2),
+        "porcentaje": round(usado / limite * 100, 1) if limite > 0 else None
+    }
+
+
+def _alerta_presupuesto(categoria: str, estado: Optional[dict], monto_usd: float) -> Optional[dict]:
+    """Avisa si el presupuesto está excedido o si este gasto cruzó el umbral de aviso."""
+    if estado is None or estado["porcentaje"] is None:
+        return None
+    aviso = estado["limite_usd"] * AVISO_PRESUPUESTO
+    if estado["gastado_usd"] > estado["limite_usd"]:
+        return {"tipo": "presupuesto_excedido",
+                "mensaje": f"Presupuesto {estado['periodo']} de '{categoria}' excedido: "
+                           f"${estado['gastado_usd']:.2f} de ${estado['limite_usd']:.2f} USD "
+                           f"({estado['porcentaje']}%)"}
+    if estado["gastado_usd"] - monto_usd < aviso <= estado["gastado_usd"]:
+        return {"tipo": "presupuesto",
+                "mensaje": f"Ya usaste el {estado['porcentaje']}% del presupuesto {estado['periodo']} "
+                           f"de '{categoria}' (quedan ${estado['disponible_usd']:.2f} USD)"}
+    return None
+
+
+def registrar_gastos(repositorio, gastos: list, hoy: Optional[datetime.date] = None) -> list:
+    """
+    Suma cada gasto ({categoria, monto_usd} y opcionalmente su fecha) a las estadísticas de su categoría y lo evalúa
+    contra las previas y el presupuesto. Cada gasto cuesta las mismas pocas sentencias sin
+    importar el tamaño del historial: la fila de estadísticas, el total del día y a lo sumo
+    31 totales diarios para las ventanas. Devuelve, por gasto, su categoría y alertas.
+    """
+    hoy = hoy or datetime.date.today()
+    desde = min(hoy - datetime.timedelta(days=29), inicio_periodo("mensual", hoy))
+    evaluaciones = []
+    with repositorio.transaccion():
+        for gasto in gastos:
+            categoria = normalizar_categoria(gasto.get("categoria"))
+            monto_usd = float(gasto["monto_usd"])
+            previa = repositorio.bloquear_estadistica_categoria(categoria)
+            cantidad, media, m2 = int(previa["cantidad"]), float(previa["media_usd"]), float(previa["m2_usd"])
+
+            anomalia = _anomalia(cantidad, media, m2, monto_usd)
+            cantidad, media, m2 = welford(cantidad, media, m2, monto_usd)
+            repositorio.guardar_estadistica_categoria(categoria, cantidad, media, m2,
+                                                      max(float(previa["maximo_usd"]), monto_usd))
+            repositorio.sumar_gasto_categoria(categoria, gasto.get("fecha") or hoy, monto_usd)
+
+            gastado = ventanas(repositorio.gasto_categoria_por_dia(categoria, desde), hoy)
+            presupuesto = _estado_presupuesto(repositorio.obtener_presupuesto(categoria), gastado)
+            alertas = [a for a in (anomalia, _alerta_presupuesto(categoria, presupuesto, monto_usd)) if a]
+            evaluaciones.append({
+                "categoria": categoria,
+                "alertas": alertas,
+                "estadisticas": {
+                    "gastos": cantidad,
+                    "media_usd": round(media, 2),
+                    "desvio_usd": round(desvio(cantidad, m2), 2),
+                    **gastado,
+                    "presupuesto": presupuesto
+                }
+            })
+    return evaluaciones
+
+
+def resumen_categoria(fila: dict, por_dia: list, hoy: datetime.date) -> dict:
+    """Estadísticas de una categoría para mostrar (fila de listar_estadisticas_categorias)."""
+    gastado = ventanas(por_dia, hoy)
+    presupuesto = None
+    if fila.get("limite_usd") is not None:
+        presupuesto = _estado_presupuesto({"limite_usd": fila["limite_usd"], "periodo": fila["periodo"]}, gastado)
+    return {
+        "categoria": fila["categoria"],
+        "gastos": fila["cantidad"],
+        "media_usd": round(float(fila["media_usd"]), 2),
+        "desvio_usd": round(desvio(fila["cantidad"], float(fila["m2_usd"])), 2),
+        "maximo_usd": float(fila["maximo_usd"]),
+        "ultimo_gasto": fila["ultimo_gasto"],
+        **gastado,
+        "presupuesto": presupuesto
+    }
@@ -0,0 +1,173 @@
+# Instrumentación de consultas: tiempos, filas, herramienta que llamó, log de consultas lentas
+import contextvars
+import datetime
+import functools
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+# Consultas más lentas que esto (ms) van al log de consultas lentas, con su plan de ejecución
+UMBRAL_LENTA_MS = float(os.environ.get("FINANZAS_UMBRAL_CONSULTA_LENTA_MS", "200"))
+# FINANZAS_EXPLAIN_LENTAS=0 desactiva la captura del plan (EXPLAIN re-ejecuta la consulta)
+CAPTURAR_PLAN = os.environ.get("FINANZAS_EXPLAIN_LENTAS", "1") != "0"
+# Tope de consultas distintas en las estadísticas (las demás se agrupan en "(otras)")
+MAX_CONSULTAS = 500
+
+# Log estructurado (una línea JSON por consulta lenta); FINANZAS_LOG_CONSULTAS_LENTAS lo manda a un archivo
+log_consultas_lentas = logging.getLogger("Asistente_Financiero.consultas_lentas")
+if os.environ.get("FINANZAS_LOG_CONSULTAS_LENTAS"):
+    _manejador = logging.FileHandler(os.environ["FINANZAS_LOG_CONSULTAS_LENTAS"], encoding="utf-8")
+    _manejador.setFormatter(logging.Formatter("%(message)s"))
+    log_consultas_lentas.addHandler(_manejador)
+    log_consultas_lentas.setLevel(logging.WARNING)
+
+# Herramienta del agente en curso (la que invocó el modelo; las llamadas internas no la pisan)
+herramienta_actual = contextvars.ContextVar("herramienta_actual", default=None)
+
+_ESPACIOS = re.compile(r"\s+")
+# Listas de VALUES de largo variable (INSERT por lotes) cuentan como una sola consulta
+_VALORES_REPETIDOS = re.compile(r"(\([^()]*\))(?:\s*,\s*\([^()]*\))+")
+
+
+def normalizar_consulta(sql: str) -> str:
+    """Texto de la consulta sin espacios de más y con las listas de VALUES colapsadas."""
+    return _VALORES_REPETIDOS.sub(r"\1, ...", _ESPACIOS.sub(" ", sql).strip())
+
+
+def instrumentar_herramienta(funcion):
+    """Marca las consultas hechas durante la herramienta con su nombre (si no hay otra en curso)."""
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        if herramienta_actual.get() is not None:
+            return funcion(*args, **kwargs)
+        token = herramienta_actual.set(funcion.__name__)
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            herramienta_actual.reset(token)
+    return envoltura
+
+
+class EstadisticasConsultas:
+    """Agregados por consulta normalizada: llamadas, tiempos, filas y herramientas que la usan."""
+
+    def __init__(self):
+        self._bloqueo = threading.Lock()
+        self._consultas = {}
+
+    def registrar(self, consulta: str, duracion_ms: float, filas: int, herramienta: Optional[str],
+                  lenta: bool) -> None:
+        with self._bloqueo:
+            if consulta not in self._consultas and len(self._consultas) >= MAX_CONSULTAS:
+                consulta = "(otras)"
+            datos = self._consultas.setdefault(consulta, {
+                "llamadas": 0, "total_ms": 0.0, "max_ms": 0.0, "filas": 0, "lentas": 0, "herramientas": {}
+            })
+            datos["llamadas"] += 1
+            datos["total_ms"] += duracion_ms
+            datos["max_ms"] = max(datos["max_ms"], duracion_ms)
+            datos["filas"] += max(filas, 0)
+            datos["lentas"] += lenta
+            clave = herramienta or "(interna)"
+            datos["herramientas"][clave] = datos["herramientas"].get(clave, 0) + 1
+
+    def resumen(self, orden: str = "total_ms", limite: int = 20) -> list:
+        """Consultas ordenadas por total_ms, max_ms, promedio_ms, llamadas o lentas (descendente)."""
+        with self._bloqueo:
+            filas = [
+                {
+                    "consulta": consulta,
+                    "llamadas": d["llamadas"],
+                    "total_ms": round(d["total_ms"], 2),
+                    "promedio_ms": round(d["total_ms"] / d["llamadas"], 3),
+                    "max_ms": round(d["max_ms"], 2),
+                    "filas": d["filas"],
+                    "lentas": d["lentas"],
+                    "herramientas": dict(d["herramientas"])
+                }
+                for consulta, d in self._consultas.items()
+            ]
+        filas.sort(key=lambda f: f[orden], reverse=True)
+        return filas[:limite]
+
+    def reiniciar(self) -> None:
+        with self._bloqueo:
+            self._consultas.clear()
+
+
+estadisticas = EstadisticasConsultas()
+
+
+class CursorInstrumentado:
+    """
+    Envuelve el cursor del driver: mide cada execute (hasta el fetch), cuenta filas y
+    registra la consulta en las estadísticas. Si supera el umbral, la escribe en el log
+    de consultas lentas junto con el plan que devuelve el repositorio (_plan_consulta).
+    """
+
+    def __init__(self, cursor, repositorio, conexion):
+        self._cursor = cursor
+        self._repositorio = repositorio
+        self._conexion = conexion
+        self._pendiente = None
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+    def execute(self, sql: str, params=None):
+        self._registrar()
+        inicio = time.perf_counter()
+        resultado = self._cursor.execute(sql, params) if params is not None else self._cursor.execute(sql)
+        self._pendiente = (sql, params, inicio)
+        return resultado
+
+    def fetchall(self):
+        filas = self._cursor.fetchall()
+        self._registrar(len(filas))
+        return filas
+
+    def fetchone(self):
+        fila = self._cursor.fetchone()
+        self._registrar(1 if fila is not None else 0)
+        return fila
+
+    def close(self):
+        self._registrar()
+        return self._cursor.close()
+
+    def _registrar(self, filas: Optional[int] = None) -> None:
+        if self._pendiente is None:
+            return
+        sql, params, inicio = self._pendiente
+        self._pendiente = None
+        duracion_ms = (time.perf_counter() - inicio) * 1000
+        if filas is None:
+            filas = self._cursor.rowcount
+        lenta = duracion_ms >= UMBRAL_LENTA_MS
+        herramienta = herramienta_actual.get()
+        consulta = normalizar_consulta(sql)
+        estadisticas.registrar(consulta, duracion_ms, filas, herramienta, lenta)
+        if lenta:
+            self._registrar_lenta(sql, params, consulta, duracion_ms, filas, herramienta)
+
+    def _registrar_lenta(self, sql, params, consulta, duracion_ms, filas, herramienta) -> None:
+        plan = None
+        if CAPTURAR_PLAN:
+            try:
+                plan = self._repositorio._plan_consulta(self._conexion, sql, params, duracion_ms)
+            except Exception as e:
+                plan = f"No se pudo obtener el plan: {type(e).__name__}: {e}"
+        log_consultas_lentas.warning(json.dumps({
+            "fecha": datetime.datetime.now().isoformat(timespec="milliseconds"),
+            "backend": self._repositorio.nombre,
+            "herramienta": herramienta,
+            "duracion_ms": round(duracion_ms, 2),
+            "filas": filas,
+            "consulta": consulta,
+            "parametros": str(params)[:500] if params is not None else None,
+            "plan": plan
+        }, ensure_ascii=False, default=str))
@@ -0,0 +1,224 @@
+# Ejecución sin modelo ni servidor de llamadas a herramientas leídas de un JSONL
+import json
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable, Optional
+
+# Las escrituras sin "cuenta" van todas a este carril: se ejecutan de a una, en el orden de entrada
+CUENTA_POR_DEFECTO = "libro"
+
+
+def leer_registros(lineas: Iterable[str]):
+    """
+    Registros del JSONL: {"tool": ..., "args": {...}, "id"?: ..., "cuenta"?: ...}. Las líneas
+    vacías se saltean; las inválidas se devuelven con su error para que salgan en el resultado.
+    """
+    for numero, linea in enumerate(lineas, 1):
+        if not linea.strip():
+            continue
+        try:
+            registro = json.loads(linea)
+            if not isinstance(registro, dict) or not isinstance(registro.get("tool"), str):
+                raise ValueError("Se esperaba un objeto con 'tool'")
+            if not isinstance(registro.get("args", {}), dict):
+                raise ValueError("'args' debe ser un objeto")
+        except ValueError as e:
+            registro = {"error_message": f"Línea inválida: {e}"}
+        registro["linea"] = numero
+        yield registro
+
+
+def _percentil(valores: list, p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))] if ordenados else 0.0
+
+
+class Progreso:
+    """Llamadas terminadas, errores y milisegundos por herramienta."""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.terminadas = 0
+        self.errores = 0
+        self.por_herramienta = {}
+
+    def registrar(self, herramienta: str, milisegundos: float, error: bool):
+        self.terminadas += 1
+        self.errores += error
+        datos = self.por_herramienta.setdefault(herramienta, {"ms": [], "errores": 0})
+        datos["ms"].append(milisegundos)
+        datos["errores"] += error
+
+    def resumen(self) -> dict:
+        segundos = time.perf_counter() - self.inicio
+        return {
+            "llamadas": self.terminadas,
+            "errores": self.errores,
+            "segundos": round(segundos, 3),
+            "llamadas_por_s": round(self.terminadas / segundos, 1) if segundos else 0.0,
+            "por_herramienta": {
+                nombre: {
+                    "llamadas": len(datos["ms"]),
+                    "errores": datos["errores"],
+                    "ms_p50": round(_percentil(datos["ms"], 0.50), 2),
+                    "ms_p95": round(_percentil(datos["ms"], 0.95), 2),
+                    # Llamadas por segundo de un hilo dedicado a esta herramienta
+                    "llamadas_por_s": round(len(datos["ms"]) * 1000 / sum(datos["ms"]), 1) if sum(datos["ms"]) else 0.0,
+                }
+                for nombre, datos in sorted(self.por_herramienta.items())
+            },
+        }
+
+
+def ejecutar(registros: Iterable[dict], herramientas: dict, solo_lectura: set, escribir: Callable[[dict], None],
+             hilos: int = 4, en_vuelo: Optional[int] = None, cada_s: float = 5.0,
+             avisar: Callable[[dict], None] = lambda resumen: None) -> dict:
+    """
+    Ejecuta los registros de leer_registros con hasta `hilos` llamadas a la vez y entrega cada
+    resultado a `escribir` en el orden de entrada.
+
+    Cada lectura espera a las escrituras anteriores y cada escritura a las lecturas anteriores,
+    así que el resultado es el de ejecutar el archivo en orden: solo corren en paralelo las
+    lecturas consecutivas. Las escrituras se encolan por cuenta (campo "cuenta" del registro,
+    CUENTA_POR_DEFECTO si falta): dentro de una cuenta, en el orden de entrada; cuentas
+    distintas pueden avanzar a la vez (el saldo es uno solo: las herramientas que lo verifican
+    antes de descontar lo bloquean en la base con bloquear_saldo).
+    Como mucho hay `en_vuelo` registros leídos sin escribir (4 por hilo por defecto), así que
+    la memoria no depende del tamaño de la entrada. Cada `cada_s` segundos pasa el resumen
+    parcial a `avisar`.
+    """
+    en_vuelo = en_vuelo or 4 * hilos
+    progreso = Progreso()
+    terminados = queue.Queue()
+    carriles = {}
+    lecturas = set()
+    bloqueo = threading.Lock()
+    pendientes = {}
+    siguiente = 0
+    leidos = 0
+    ultimo_aviso = time.perf_counter()
+
+    def llamar(indice: int, registro: dict):
+        inicio = time.perf_counter()
+        try:
+            resultado = herramientas[registro["tool"]](**registro.get("args", {}))
+        except Exception as e:
+            resultado = {"status": "error", "error_message": str(e)}
+        milisegundos = (time.perf_counter() - inicio) * 1000
+        terminados.put((indice, registro, resultado, milisegundos))
+
+    def programar(pool, indice: int, registro: dict, lectura: bool):
+        """
+        Lanza la llamada cuando terminan las que tiene que esperar: una lectura, las escrituras
+        en curso (la última de cada cuenta); una escritura, la anterior de su cuenta y las
+        lecturas en curso.
+        """
+        cuenta = str(registro.get("cuenta", CUENTA_POR_DEFECTO))
+        propia = Future()
+        with bloqueo:
+            if lectura:
+                previas = list(carriles.values())
+                lecturas.add(propia)
+            else:
+                previas = list(lecturas) + ([carriles[cuenta]] if cuenta in carriles else [])
+                carriles[cuenta] = propia
+            faltan = [len(previas)]
+
+        def correr():
+            try:
+                llamar(indice, registro)
+            finally:
+                with bloqueo:
+                    lecturas.discard(propia)
+                    if not lectura and carriles.get(cuenta) is propia:
+                        del carriles[cuenta]
+                propia.set_result(None)
+
+        def terminada(_):
+            with bloqueo:
+                faltan[0] -= 1
+                lista = faltan[0] == 0
+            if lista:
+                pool.submit(correr)
+
+        if not previas:
+            pool.submit(correr)
+        for previa in previas:
+            previa.add_done_callback(terminada)
+
+    def entregar(bloquear: bool):
+        """Toma un resultado terminado y escribe los que ya tienen su turno."""
+        nonlocal siguiente, ultimo_aviso
+        try:
+            indice, registro, resultado, milisegundos = terminados.get(block=bloquear)
+        except queue.Empty:
+            return
+        error = not isinstance(resultado, dict) or resultado.get("status") == "error"
+        progreso.registrar(registro.get("tool", "(inválida)"), milisegundos, error)
+        pendientes[indice] = {
+            "linea": registro["linea"],
+            **({"id": registro["id"]} if "id" in registro else {}),
+            "tool": registro.get("tool"),
+            "ms": round(milisegundos, 2),
+            "resultado": resultado,
+        }
+        while siguiente in pendientes:
+            escribir(pendientes.pop(siguiente))
+            siguiente += 1
+        if cada_s and time.perf_counter() - ultimo_aviso >= cada_s:
+            ultimo_aviso = time.perf_counter()
+            avisar(progreso.resumen())
+
+    with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="lotes") as pool:
+        for registro in registros:
+            while leidos - siguiente >= en_vuelo:
+                entregar(bloquear=True)
+            if "error_message" in registro:
+                terminados.put((leidos, registro, {"status": "error", "error_message": registro["error_message"]}, 0.0))
+            elif registro["tool"] not in herramientas:
+                error = {"status": "error", "error_message": f"Herramienta desconocida: {registro['tool']}"}
+                terminados.put((leidos, registro, error, 0.0))
+            else:
+                programar(pool, leidos, registro, registro["tool"] in solo_lectura)
+            leidos += 1
+            entregar(bloquear=False)
+        while siguiente < leidos:
+            entregar(bloquear=True)
+    return progreso.resumen()
+
+
+if __name__ == "__main__":
+    # python -m Asistente_Financiero.lotes entrada.jsonl [--salida resultados.jsonl] [--hilos N]
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(
+        description="Ejecuta llamadas a herramientas desde un JSONL ({\"tool\", \"args\"} por línea) y escribe los resultados como JSONL."
+    )
+    parser.add_argument("entrada", help="archivo JSONL ('-' para la entrada estándar)")
+    parser.add_argument("--salida", help="archivo de resultados (default: salida estándar)")
+    parser.add_argument("--hilos", type=int, default=4, help="llamadas simultáneas (default: 4)")
+    parser.add_argument("--en-vuelo", type=int, help="registros leídos sin escribir como máximo (default: 4 por hilo)")
+    parser.add_argument("--progreso", type=float, default=5.0, help="segundos entre avisos de progreso; 0 los apaga (default: 5)")
+    args = parser.parse_args()
+    os.environ.setdefault("FINANZAS_RECURRENTES", "0")
+
+    from .agent import READ_ONLY_TOOLS, root_agent
+
+    entrada = sys.stdin if args.entrada == "-" else open(args.entrada, encoding="utf-8")
+    salida = open(args.salida, "w", encoding="utf-8") if args.salida else sys.stdout
+
+    def escribir(resultado: dict):
+        salida.write(json.dumps(resultado, ensure_ascii=False, default=str) + "\n")
+
+    def avisar(resumen: dict):
+        print(f"[lotes] {resumen['llamadas']} llamadas, {resumen['errores']} errores, "
+              f"{resumen['llamadas_por_s']}/s", file=sys.stderr, flush=True)
+
+    with entrada, salida:
+        resumen = ejecutar(leer_registros(entrada), {tool.__name__: tool for tool in root_agent.tools},
+                           READ_ONLY_TOOLS, escribir, args.hilos, args.en_vuelo, args.progreso, avisar)
+    print(json.dumps(resumen, indent=2, ensure_ascii=False), file=sys.stderr)
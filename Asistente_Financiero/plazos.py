@@ -0,0 +1,101 @@
+# Plazos por invocación de herramienta: acotan consultas, bloqueos y llamadas HTTP
+import contextvars
+import functools
+import os
+import time
+from typing import Optional
+
+# Presupuesto por defecto de cada herramienta (segundos); FINANZAS_PLAZO_HERRAMIENTA_S lo cambia
+PLAZO_POR_DEFECTO_S = float(os.environ.get("FINANZAS_PLAZO_HERRAMIENTA_S", "15"))
+
+
+class PlazoVencido(Exception):
+    """La herramienta agotó su presupuesto de tiempo; el trabajo pendiente se cancela."""
+
+
+class Plazo:
+    """Presupuesto de una invocación: límite absoluto (reloj monotónico) y si llegó a vencer."""
+
+    def __init__(self, segundos: float):
+        self.segundos = segundos
+        self.inicio = time.monotonic()
+        self.limite = self.inicio + segundos
+        self.vencido = False
+
+    def restante(self) -> float:
+        return self.limite - time.monotonic()
+
+
+# Plazo de la herramienta en curso (las llamadas internas usan el de la externa)
+plazo_actual = contextvars.ContextVar("plazo_actual", default=None)
+
+
+def restante() -> Optional[float]:
+    """Segundos que le quedan a la herramienta en curso (None si no hay plazo)."""
+    plazo = plazo_actual.get()
+    return plazo.restante() if plazo is not None else None
+
+
+def verificar() -> None:
+    """Punto de cancelación: lanza PlazoVencido si ya no queda tiempo."""
+    plazo = plazo_actual.get()
+    if plazo is not None and plazo.restante() <= 0:
+        vencer()
+
+
+def vencer(causa: Optional[BaseException] = None):
+    """Marca el plazo en curso como vencido y lanza PlazoVencido (encadenando la causa)."""
+    plazo = plazo_actual.get()
+    if plazo is not None:
+        plazo.vencido = True
+    segundos = plazo.segundos if plazo is not None else 0
+    raise PlazoVencido(f"Se superó el tiempo límite de {segundos:g} s") from causa
+
+
+def limitar(segundos: float) -> float:
+    """Timeout a usar en una espera: el menor entre `segundos` y lo que le queda al plazo."""
+    verificar()
+    disponible = restante()
+    return segundos if disponible is None else max(0.001, min(segundos, disponible))
+
+
+def restante_ms() -> Optional[int]:
+    """Lo que queda del plazo en milisegundos enteros (para statement_timeout/lock_timeout)."""
+    disponible = restante()
+    return None if disponible is None else max(1, int(disponible * 1000))
+
+
+def con_plazo(funcion, segundos: Optional[float] = None):
+    """
+    Ejecuta la herramienta con un plazo (si no hay uno en curso). Si el plazo vence (vencer()
+    lo marca), la consulta en curso se cancela, su transacción se deshace aunque la
+    herramienta atrape el error, y se devuelve un resultado de timeout estructurado en lugar
+    del error propio de la herramienta. Los demás errores se devuelven tal cual.
+    """
+    segundos = segundos or PLAZO_POR_DEFECTO_S
+
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        if plazo_actual.get() is not None:
+            return funcion(*args, **kwargs)
+        plazo = Plazo(segundos)
+        token = plazo_actual.set(plazo)
+        try:
+            try:
+                resultado = funcion(*args, **kwargs)
+            except PlazoVencido:
+                resultado = None
+            if plazo.vencido:
+                return {
+                    "status": "error",
+                    "error_type": "timeout",
+                    "error_message": f"{funcion.__name__} superó el tiempo límite de {segundos:g} s "
+                                     "y se canceló (la transacción en curso se deshizo)",
+                    "herramienta": funcion.__name__,
+                    "plazo_s": segundos,
+                    "transcurrido_ms": round((time.monotonic() - plazo.inicio) * 1000, 1)
+                }
+            return resultado
+        finally:
+            plazo_actual.reset(token)
+    return envoltura
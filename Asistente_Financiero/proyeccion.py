@@ -0,0 +1,57 @@
+# Respuestas compactas: proyección de campos y filas en formato columnar
+from typing import Optional
+
+
+def parsear_campos(campos: Optional[str]) -> Optional[list]:
+    """Convierte 'id, persona,monto' en ['id', 'persona', 'monto'] (None si no se pidió proyección)."""
+    if not campos:
+        return None
+    lista = [c.strip() for c in campos.split(",") if c.strip()]
+    return lista or None
+
+
+def validar_campos(filas: list, campos: list) -> None:
+    """Lanza ValueError si algún campo pedido no aparece en ninguna fila."""
+    if not filas:
+        return
+    disponibles = dict.fromkeys(c for fila in filas for c in fila)
+    desconocidos = [c for c in campos if c not in disponibles]
+    if desconocidos:
+        raise ValueError(
+            f"Campo(s) desconocido(s): {', '.join(desconocidos)}. "
+            f"Disponibles: {', '.join(disponibles)}"
+        )
+
+
+def proyectar(filas: list, campos: Optional[list]) -> list:
+    """Deja en cada fila solo los campos pedidos (en ese orden; None si a la fila le falta)."""
+    if not campos:
+        return filas
+    validar_campos(filas, campos)
+    return [{c: fila.get(c) for c in campos} for fila in filas]
+
+
+def a_columnas(filas: list, campos: list) -> dict:
+    """
+    Formato columnar: los nombres de campo una sola vez y cada fila como lista de valores.
+    Es el mismo formato que usan get_period_report y get_fx_pnl_report.
+    """
+    validar_campos(filas, campos)
+    return {
+        "columnas": list(campos),
+        "filas": [[fila.get(c) for c in campos] for fila in filas]
+    }
+
+
+def formatear_filas(filas: list, clave: str, campos: Optional[str] = None, compacto: bool = False,
+                    campos_compactos: Optional[list] = None) -> dict:
+    """
+    Parte de la respuesta de una herramienta de listado:
+      - normal: {clave: filas} con todos los campos (o solo los de `campos`)
+      - compacto: {"columnas": [...], "filas": [[...]]} con `campos` o, si no se indicaron,
+        los campos_compactos de la herramienta
+    """
+    lista = parsear_campos(campos)
+    if compacto:
+        return a_columnas(filas, lista or campos_compactos or list(filas[0].keys() if filas else []))
+    return {clave: proyectar(filas, lista)}
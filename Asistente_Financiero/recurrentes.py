@@ -0,0 +1,188 @@
+# Movimientos recurrentes: reglas de ingresos y gastos y el programador que genera los vencidos
+import calendar
+import datetime
+import heapq
+import logging
+import os
+import threading
+from typing import Optional
+
+from . import estadisticas_gasto
+from .categorizacion import normalizar_texto
+from .dinero import Dinero
+
+log = logging.getLogger(__name__)
+
+FRECUENCIAS = ("mensual", "semanal", "anual")
+
+# Tipo de regla -> (signo, tipo_operacion del historial); los mismos que usa batch_operations
+TIPOS = {
+    "ingreso": (1, "dinero_añadido"),
+    "dinero_nuevo_mes": (1, "dinero_nuevo_mes"),
+    "gasto": (-1, "gasto"),
+}
+
+# Cada cuánto busca reglas vencidas el programador (segundos)
+INTERVALO_POR_DEFECTO_S = float(os.environ.get("FINANZAS_INTERVALO_RECURRENTES_S", "3600"))
+
+
+def _en_mes(anio: int, mes: int, dia: int) -> datetime.date:
+    """Fecha del mes con el día pedido o, si el mes es más corto, su último día."""
+    return datetime.date(anio, mes, min(dia, calendar.monthrange(anio, mes)[1]))
+
+
+def _sumar_meses(fecha: datetime.date, meses: int, dia: int) -> datetime.date:
+    indice = fecha.year * 12 + fecha.month - 1 + meses
+    return _en_mes(indice // 12, indice % 12 + 1, dia)
+
+
+def primera_fecha(frecuencia: str, dia: int, desde: datetime.date) -> datetime.date:
+    """
+    Primera fecha desde `desde` (inclusive) en que vence la regla. `dia` es el día del mes
+    (mensual, anual) o de la semana, 0 = lunes (semanal); la anual vence en el mes de `desde`.
+    """
+    if frecuencia == "semanal":
+        return desde + datetime.timedelta(days=(dia - desde.weekday()) % 7)
+    meses = 12 if frecuencia == "anual" else 1
+    fecha = _en_mes(desde.year, desde.month, dia)
+    return fecha if fecha >= desde else _sumar_meses(fecha, meses, dia)
+
+
+def siguiente_fecha(fecha: datetime.date, frecuencia: str, dia: int) -> datetime.date:
+    """Vencimiento siguiente a `fecha`. El día se toma de la regla: un 31 vuelve a 31 después de febrero."""
+    if frecuencia == "semanal":
+        return fecha + datetime.timedelta(days=7)
+    return _sumar_meses(fecha, 12 if frecuencia == "anual" else 1, dia)
+
+
+def aplicar_vencidas(repositorio, hoy: Optional[datetime.date] = None) -> dict:
+    """
+    Genera en una sola transacción los movimientos de todas las reglas vencidas hasta hoy
+    (incluidos los períodos atrasados, en orden de fecha) y avanza cada regla. Igual que batch_operations:
+    una lectura del saldo, un INSERT por tabla para todos los movimientos. Un gasto sin
+    saldo o sin cotización queda pendiente y la regla no avanza (se reintenta después).
+    """
+    hoy = hoy or datetime.date.today()
+    aplicados, pendientes, movimientos, gastos = [], [], [], []
+    with repositorio.transaccion():
+        reglas = repositorio.reglas_vencidas(hoy)
+        if not reglas:
+            return {"aplicados": aplicados, "pendientes": pendientes}
+        saldo_usd = repositorio.saldo_moneda("USD")
+        tasas = {"USD": 1.0}
+        automata = repositorio.categorizador.automata()
+
+        # Vencimientos de todas las reglas en orden de fecha: el saldo evoluciona como en el calendario
+        pendientes_por_fecha = []
+        for regla in reglas:
+            moneda = regla["moneda"]
+            if moneda not in tasas:
+                tasa = repositorio.obtener_tasa(moneda, "USD")
+                tasas[moneda] = float(tasa["tasa"]) if tasa else None
+            fecha = datetime.date.fromisoformat(str(regla["proxima_fecha"])[:10])
+            heapq.heappush(pendientes_por_fecha, (fecha, regla["id"]))
+        por_id = {regla["id"]: regla for regla in reglas}
+        avances = {}
+
+        while pendientes_por_fecha:
+            fecha, regla_id = heapq.heappop(pendientes_por_fecha)
+            regla = por_id[regla_id]
+            signo, tipo_operacion = TIPOS[regla["tipo"]]
+            moneda = regla["moneda"]
+            monto_usd = (Dinero.de(regla["monto"], moneda).convertir(tasas[moneda], "USD").a_float()
+                         if tasas[moneda] is not None else 0)
+            error = None
+            if signo < 0 and tasas[moneda] is None:
+                error = f"No se encontró tasa para {moneda}/USD"
+            elif signo < 0 and saldo_usd < monto_usd:
+                error = (f"Saldo insuficiente. Saldo actual: ${saldo_usd:.2f} USD, "
+                         f"Gasto recurrente: {regla['monto']} {moneda} (${monto_usd:.2f} USD)")
+            if error is not None:
+                # La regla queda en este vencimiento y se reintenta en la próxima pasada
+                pendientes.append({"regla_id": regla_id, "fecha": fecha.isoformat(),
+                                   "descripcion": regla["descripcion"], "error_message": error})
+                continue
+
+            saldo_nuevo_usd = saldo_usd + signo * monto_usd
+            # Categoría por palabras clave; sin ellas, un gasto usa la descripción de la regla
+            # (ej. 'gimnasio') y un ingreso la de su tipo
+            if "categoria" not in regla:
+                regla["categoria"] = (
+                    repositorio.categorizador.categorizar(regla["descripcion"], tipo_operacion, automata) if signo > 0
+                    else automata.categoria(normalizar_texto(regla["descripcion"]))
+                    or estadisticas_gasto.normalizar_categoria(regla["descripcion"])
+                )
+            movimientos.append({
+                "monto": signo * regla["monto"], "moneda": moneda,
+                "descripcion": f"{regla['descripcion']} (recurrente, {fecha.isoformat()})",
+                "tipo_operacion": tipo_operacion, "monto_usd": monto_usd,
+                "saldo_anterior_usd": saldo_usd, "saldo_nuevo_usd": saldo_nuevo_usd,
+                "categoria": regla["categoria"]
+            })
+            aplicados.append({"regla_id": regla_id, "fecha": fecha.isoformat(), "tipo": regla["tipo"],
+                              "monto": regla["monto"], "moneda": moneda, "descripcion": regla["descripcion"]})
+            # Los gastos suman a las estadísticas de su categoría
+            if signo < 0:
+                gastos.append((aplicados[-1], {"categoria": regla["categoria"], "monto_usd": monto_usd,
+                                                     "fecha": fecha}))
+            # El saldo en USD solo cambia con movimientos en USD (como en batch_operations)
+            if moneda == "USD":
+                saldo_usd = saldo_nuevo_usd
+            siguiente = siguiente_fecha(fecha, regla["frecuencia"], regla["dia"])
+            cantidad = avances[regla_id][1] if regla_id in avances else 0
+            avances[regla_id] = (fecha, cantidad + 1, siguiente)
+            if siguiente <= hoy:
+                heapq.heappush(pendientes_por_fecha, (siguiente, regla_id))
+
+        for regla_id, (ultima, cantidad, siguiente) in avances.items():
+            repositorio.avanzar_regla_recurrente(regla_id, siguiente.isoformat(), ultima.isoformat(), cantidad)
+        repositorio.registrar_movimientos_saldo(movimientos)
+        evaluaciones = estadisticas_gasto.registrar_gastos(repositorio, [gasto for _, gasto in gastos])
+        for (aplicado, _), evaluacion in zip(gastos, evaluaciones):
+            aplicado["categoria"], aplicado["alertas"] = evaluacion["categoria"], evaluacion["alertas"]
+    return {"aplicados": aplicados, "pendientes": pendientes}
+
+
+class ProgramadorRecurrentes:
+    """
+    Hilo de fondo que aplica las reglas vencidas al arrancar y después cada `intervalo`
+    segundos. Varios procesos pueden correrlo a la vez: reglas_vencidas bloquea las filas
+    y cada regla avanza en la misma transacción en que se generan sus movimientos.
+    """
+
+    def __init__(self, repositorio, intervalo: Optional[float] = None):
+        self.repositorio = repositorio
+        self.intervalo = intervalo or INTERVALO_POR_DEFECTO_S
+        self._fin = threading.Event()
+        self._hilo = None
+        self.ultima_ejecucion = None
+        self.ultimo_resultado = None
+        self.ultimo_error = None
+
+    def iniciar(self) -> None:
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._ciclo, name="programador-recurrentes", daemon=True)
+            self._hilo.start()
+
+    def detener(self, timeout: float = 5.0) -> None:
+        self._fin.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+            self._hilo = None
+
+    def ejecutar(self) -> dict:
+        """Aplica lo vencido ahora (además de lo que hace el ciclo)."""
+        resultado = aplicar_vencidas(self.repositorio)
+        self.ultima_ejecucion = datetime.datetime.now().isoformat(timespec="seconds")
+        self.ultimo_resultado = {"aplicados": len(resultado["aplicados"]), "pendientes": len(resultado["pendientes"])}
+        self.ultimo_error = None
+        return resultado
+
+    def _ciclo(self) -> None:
+        while not self._fin.is_set():
+            try:
+                self.ejecutar()
+            except Exception as e:
+                self.ultimo_error = f"{type(e).__name__}: {e}"
+                log.error("Error aplicando movimientos recurrentes: %s", self.ultimo_error)
+            self._fin.wait(self.intervalo)
@@ -0,0 +1,1340 @@
+# Capa de repositorio: libro de transacciones, saldo, préstamos, tasas e historial
+import bisect
+import contextlib
+import contextvars
+import datetime
+import decimal
+import functools
+import os
+import re
+import threading
+import uuid
+from typing import Optional
+
+from . import cache, plazos
+from .categorizacion import TABLAS_CATEGORIZADAS, Categorizador, normalizar_texto
+from .conciliacion import TABLAS_CONTROLADAS, TAMANO_BLOQUE
+from .instrumentacion import CursorInstrumentado
+
+# Orígenes que abarca la búsqueda por texto
+ORIGENES_BUSQUEDA = ("transacciones", "saldo_actual", "prestamos", "historial_saldo")
+
+# Paso entre puntos de la serie de patrimonio
+INTERVALOS_PATRIMONIO = ("dia", "semana", "mes")
+
+# Columnas comunes de la búsqueda portable por origen: (tabla, fecha, monto, moneda, contraparte)
+_FUENTES_BUSQUEDA = {
+    "transacciones": ("transacciones", "fecha", "monto", "NULL", "contraparte"),
+    "saldo_actual": ("saldo_actual", "updated_at", "monto", "moneda", "NULL"),
+    "prestamos": ("prestamos", "fecha_prestamo", "monto_total", "moneda", "persona"),
+    "historial_saldo": ("historial_saldo", "fecha_operacion", "monto_operacion", "'USD'", "NULL"),
+}
+
+# Columnas que algunos backends guardan como 0/1 y se exponen como bool
+_COLUMNAS_BOOLEANAS = ("tiene_intermediario", "activa")
+
+# Tabla que modifica una sentencia (para invalidar cachés y avisar a otras réplicas)
+_TABLA_ESCRITA = re.compile(r"^\s*(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+(\w+)", re.IGNORECASE)
+
+
+def _normalizar(fila: dict) -> dict:
+    """Convierte una fila a tipos aptos para JSON: Decimal -> float, fechas -> ISO."""
+    for k, v in fila.items():
+        if isinstance(v, decimal.Decimal):
+            fila[k] = float(v)
+        elif isinstance(v, (datetime.date, datetime.datetime)):
+            fila[k] = v.isoformat()
+        elif k in _COLUMNAS_BOOLEANAS and v is not None:
+            fila[k] = bool(v)
+    return fila
+
+
+def _copiar(valor):
+    """Copia un resultado cacheado para que quien lo reciba pueda modificarlo."""
+    if isinstance(valor, list):
+        return [dict(v) if isinstance(v, dict) else v for v in valor]
+    if isinstance(valor, dict):
+        return dict(valor)
+    return valor
+
+
+def _cacheado(*tablas):
+    """
+    Cachea una lectura del repositorio hasta que cambie alguna de sus tablas. Solo se usa
+    fuera de transacciones (dentro se lee siempre de la base) y si el backend puede
+    mantener la caché coherente (usar_cache).
+    """
+    def decorador(metodo):
+        cache_metodo = cache.CacheTablas(f"repositorio.{metodo.__name__}", tablas)
+
+        @functools.wraps(metodo)
+        def envoltura(self, *args, **kwargs):
+            if not self.usar_cache or getattr(self._local, "conexion", None) is not None:
+                return metodo(self, *args, **kwargs)
+            clave = (id(self), args, tuple(sorted(kwargs.items())))
+            return _copiar(cache_metodo.obtener(clave, lambda: metodo(self, *args, **kwargs)))
+        return envoltura
+    return decorador
+
+
+# Herramienta en curso que solo lee: sus transacciones pueden ir a la réplica de lectura
+lectura_replica = contextvars.ContextVar("lectura_replica", default=False)
+
+
+def solo_lectura(funcion):
+    """Marca una herramienta que no escribe: el backend puede resolverla en la réplica de lectura."""
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        token = lectura_replica.set(True)
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            lectura_replica.reset(token)
+    return envoltura
+
+
+def _sumar_meses(fecha: datetime.date, meses: int) -> datetime.date:
+    """Suma meses a una fecha ajustando el día al último del mes si hace falta."""
+    indice = fecha.year * 12 + fecha.month - 1 + meses
+    anio, mes = divmod(indice, 12)
+    siguiente = datetime.date(anio + (mes + 1) // 12, (mes + 1) % 12 + 1, 1)
+    ultimo_dia = (siguiente - datetime.timedelta(days=1)).day
+    return datetime.date(anio, mes + 1, min(fecha.day, ultimo_dia))
+
+
+class RepositorioFinanzas:
+    """
+    Acceso a datos de las herramientas financieras. La lógica SQL común vive acá y cada
+    backend define la conexión y las diferencias de dialecto (o reemplaza consultas
+    puntuales por versiones propias más eficientes).
+
+    Cada método corre en su propia transacción, salvo que se llame dentro de
+    `with repo.transaccion():`, en cuyo caso todo se confirma (o se deshace) junto.
+    Los resultados se devuelven listos para JSON: montos como float y fechas en ISO.
+    """
+
+    nombre = "base"
+
+    # Dialecto SQL (los backends lo redefinen)
+    AHORA = "NOW()"
+    HOY = "CURRENT_DATE"
+    PARA_ACTUALIZAR = " FOR UPDATE"
+    # True si todas las transacciones comparten una conexión (un hilo no puede esperar a otro
+    # mientras tiene una transacción abierta)
+    CONEXION_UNICA = False
+
+    def __init__(self):
+        self._local = threading.local()
+        self.escritor_historial = None
+        self.programador_recurrentes = None
+        # Las lecturas se cachean solo si el backend garantiza que la caché se invalida
+        # ante cualquier escritura (incluidas las de otras réplicas)
+        self.usar_cache = False
+        self.id_replica = uuid.uuid4().hex[:12]
+        # Autómata de palabras clave que categoriza cada descripción al insertarla
+        self.categorizador = Categorizador(self)
+
+    def activar_escritor_historial(self, tamano_lote: int = 200, intervalo: float = 0.2):
+        """Escribe historial_saldo en segundo plano y por lotes (ver escritor_historial.py)."""
+        from .escritor_historial import EscritorHistorial
+        if self.escritor_historial is None:
+            self.escritor_historial = EscritorHistorial(self, tamano_lote, intervalo)
+        return self.escritor_historial
+
+    def activar_programador_recurrentes(self, intervalo: Optional[float] = None):
+        """Genera en segundo plano los movimientos recurrentes vencidos (ver recurrentes.py)."""
+        from .recurrentes import ProgramadorRecurrentes
+        if self.programador_recurrentes is None:
+            self.programador_recurrentes = ProgramadorRecurrentes(self, intervalo)
+            self.programador_recurrentes.iniciar()
+        return self.programador_recurrentes
+
+    # ---------------- Conexión y transacciones ---------------- #
+
+    def _abrir(self):
+        """Abre (o toma) una conexión e inicia una transacción."""
+        raise NotImplementedError
+
+    def _cerrar(self, conexion, confirmar: bool) -> None:
+        """Confirma o deshace la transacción y libera la conexión."""
+        raise NotImplementedError
+
+    def _nuevo_cursor(self, conexion):
+        """Cursor cuyas filas se pueden convertir a dict."""
+        raise NotImplementedError
+
+    def _sql(self, sql: str) -> str:
+        """Adapta los placeholders (%s) al driver."""
+        return sql
+
+    def _parametros(self, params):
+        return params
+
+    def _inicio_mes(self, expr: str) -> str:
+        """Expresión SQL del primer día del mes de una fecha."""
+        raise NotImplementedError
+
+    def _fecha_de(self, expr: str) -> str:
+        """Expresión SQL de la fecha (sin hora) de un timestamp."""
+        raise NotImplementedError
+
+    def _digesto(self, expr: str) -> str:
+        """Expresión SQL de un digesto entero de 48 bits de un texto (sumas de control del libro)."""
+        raise NotImplementedError
+
+    def _bloquear_tabla(self, tabla: str) -> None:
+        """Bloquea una tabla frente a escrituras concurrentes (si el backend lo necesita)."""
+
+    def _publicar_cambios(self, tablas: set) -> None:
+        """Avisa a otras réplicas qué tablas cambió la transacción (antes del commit)."""
+
+    def iniciar_escucha(self) -> None:
+        """Empieza a escuchar los cambios de otras réplicas (si el backend lo soporta)."""
+
+    def estadisticas_lectura(self) -> Optional[dict]:
+        """Cuántas transacciones de lectura fueron a la réplica y cuántas al primario (None sin réplica)."""
+        return None
+
+    def _es_timeout(self, error: Exception) -> bool:
+        """True si el error es una cancelación por tiempo (statement/lock timeout o interrupción)."""
+        return False
+
+    def _plan_consulta(self, conexion, sql: str, params, duracion_ms: float):
+        """Plan de ejecución de una consulta lenta para el log (None si el backend no lo ofrece)."""
+        return None
+
+    def _cursor(self):
+        """Cursor instrumentado sobre la conexión de la transacción en curso."""
+        conexion = self._local.conexion
+        return CursorInstrumentado(self._nuevo_cursor(conexion), self, conexion)
+
+    @contextlib.contextmanager
+    def transaccion(self, revertir: bool = False):
+        """
+        Agrupa las operaciones del bloque en una sola transacción. Si ya hay una abierta
+        en el hilo, el bloque se suma a ella (la externa decide el commit). Si una excepción
+        sale de un bloque anidado, la externa se deshace aunque quien llamó la haya atrapado.
+        revertir=True deshace todo al salir (útil para verificaciones).
+        """
+        if getattr(self._local, "conexion", None) is not None:
+            try:
+                yield self
+            except BaseException:
+                self._local.solo_revertir = True
+                raise
+            return
+        conexion = self._abrir()
+        self._local.conexion = conexion
+        self._local.historial = []
+        self._local.historial_insertado = False
+        self._local.tablas_modificadas = set()
+        self._local.solo_revertir = False
+        confirmar = False
+        try:
+            yield self
+            revertir = revertir or self._local.solo_revertir
+            if not revertir and self._local.tablas_modificadas:
+                # Dentro de la transacción: el aviso sale recién con el commit
+                self._publicar_cambios(self._local.tablas_modificadas)
+            confirmar = not revertir
+        finally:
+            self._local.conexion = None
+            historial, self._local.historial = self._local.historial, []
+            tablas, self._local.tablas_modificadas = self._local.tablas_modificadas, set()
+            self._cerrar(conexion, confirmar)
+        if confirmar and tablas:
+            cache.invalidar(tablas)
+        # El historial de la transacción se entrega al escritor solo si hubo commit
+        if confirmar and historial:
+            self.escritor_historial.encolar(historial)
+
+    def _ejecutar_sql(self, sql: str, params, leer: bool):
+        with self.transaccion():
+            # No se empieza una consulta si la herramienta ya agotó su plazo
+            plazos.verificar()
+            escrita = _TABLA_ESCRITA.match(sql)
+            if escrita:
+                self._local.tablas_modificadas.add(escrita.group(1).lower())
+            cur = self._cursor()
+            try:
+                cur.execute(self._sql(sql), self._parametros(params))
+                if leer:
+                    return [_normalizar(dict(fila)) for fila in cur.fetchall()]
+                return cur.rowcount
+            except Exception as e:
+                if self._es_timeout(e):
+                    plazos.vencer(e)
+                raise
+            finally:
+                cur.close()
+
+    def _filas(self, sql: str, params=None) -> list:
+        return self._ejecutar_sql(sql, params, leer=True)
+
+    def _fila(self, sql: str, params=None) -> Optional[dict]:
+        filas = self._ejecutar_sql(sql, params, leer=True)
+        return filas[0] if filas else None
+
+    def _ejecutar(self, sql: str, params=None) -> int:
+        return self._ejecutar_sql(sql, params, leer=False)
+
+    # ---------------- Transacciones ---------------- #
+
+    def agregar_transaccion(self, tipo: str, monto: float, fecha: str, descripcion: str,
+                            contraparte: Optional[str] = None, categoria: Optional[str] = None) -> int:
+        """
+        Inserta una transacción (categorizada por su descripción si no se indica categoría),
+        actualiza el rollup mensual y registra la contraparte.
+        """
+        with self.transaccion():
+            fila = self._fila(
+                """
+                INSERT INTO transacciones (tipo, monto, fecha, descripcion, contraparte, categoria)
+                VALUES (%s, %s, %s, %s, %s, %s) RETURNING id;
+                """,
+                (tipo, monto, fecha, descripcion, contraparte,
+                 categoria or self.categorizador.categorizar(descripcion, tipo))
+            )
+            self._sumar_a_bloques("transacciones", [fila["id"]])
+            self._ejecutar(
+                f"""
+                INSERT INTO transacciones_mensual (mes, tipo, contraparte, cantidad, total)
+                VALUES ({self._inicio_mes("%s")}, %s, %s, 1, %s)
+                ON CONFLICT (mes, tipo, contraparte)
+                DO UPDATE SET cantidad = transacciones_mensual.cantidad + 1,
+                              total = ROUND(transacciones_mensual.total + EXCLUDED.total, 2);
+                """,
+                (fecha, tipo, contraparte or "", monto)
+            )
+            if contraparte and contraparte.strip():
+                self._registrar_contraparte(contraparte)
+        return fila["id"]
+
+    @_cacheado("transacciones_mensual")
+    def balance_transacciones(self) -> float:
+        """Ingresos - gastos - préstamos, leído del rollup mensual."""
+        fila = self._fila(
+            """
+            SELECT
+                SUM(CASE WHEN tipo = 'ingreso' THEN total ELSE 0 END) -
+                SUM(CASE WHEN tipo IN ('gasto','prestamo') THEN total ELSE 0 END) AS balance
+            FROM transacciones_mensual;
+            """
+        )
+        return round(fila["balance"] or 0, 2)
+
+    def reporte_mensual(self, desde_mes: datetime.date, hasta_mes: datetime.date,
+                        por_contraparte: bool = False) -> list:
+        """
+        Totales por mes (y contraparte) entre dos meses inclusive. Cada fila trae mes
+        (YYYY-MM-DD), contraparte si corresponde, ingresos, gastos, prestamos, balance y cantidad.
+        """
+        columnas_grupo = "mes, contraparte" if por_contraparte else "mes"
+        return self._filas(
+            f"""
+            SELECT {columnas_grupo},
+                   SUM(CASE WHEN tipo = 'ingreso' THEN total END) AS ingresos,
+                   SUM(CASE WHEN tipo = 'gasto' THEN total END) AS gastos,
+                   SUM(CASE WHEN tipo = 'prestamo' THEN total END) AS prestamos,
+                   SUM(CASE WHEN tipo = 'ingreso' THEN total
+                            WHEN tipo IN ('gasto','prestamo') THEN -total ELSE 0 END) AS balance,
+                   SUM(cantidad) AS cantidad
+            FROM transacciones_mensual
+            WHERE mes BETWEEN %s AND %s
+            GROUP BY {columnas_grupo}
+            ORDER BY {columnas_grupo};
+            """,
+            (desde_mes.isoformat(), hasta_mes.isoformat())
+        )
+
+    def listar_transacciones(self, limite: int) -> list:
+        return self._filas(
+            "SELECT * FROM transacciones ORDER BY fecha DESC, id DESC LIMIT %s;",
+            (limite,)
+        )
+
+    def buscar(self, consulta: str, origenes: list, limite: int, desplazamiento: int) -> tuple:
+        """
+        Búsqueda por texto en descripciones y contrapartes. Devuelve (filas, total).
+
+        Versión portable: coincidencia parcial (LIKE) de cada palabra; la relevancia es la
+        fracción de palabras encontradas. Los backends con índices de texto la reemplazan.
+        """
+        if "historial_saldo" in origenes:
+            self._sincronizar_historial()
+        palabras = consulta.lower().split()
+        resultados = []
+        for origen in origenes:
+            tabla, fecha, monto, moneda, contraparte = _FUENTES_BUSQUEDA[origen]
+            condiciones = " OR ".join(
+                f"lower(COALESCE(descripcion, '')) LIKE %s OR lower(COALESCE({contraparte}, '')) LIKE %s"
+                for _ in palabras
+            )
+            filas = self._filas(
+                f"""
+                SELECT '{origen}' AS origen, id, {fecha} AS fecha, {monto} AS monto,
+                       {moneda} AS moneda, descripcion, {contraparte} AS contraparte
+                FROM {tabla}
+                WHERE {condiciones};
+                """,
+                tuple(f"%{p}%" for p in palabras for _ in range(2))
+            )
+            for fila in filas:
+                texto = f"{fila['descripcion'] or ''} {fila['contraparte'] or ''}".lower()
+                fila["relevancia"] = sum(p in texto for p in palabras) / len(palabras)
+            resultados += filas
+        resultados.sort(key=lambda f: (f["relevancia"], f["fecha"] or ""), reverse=True)
+        return resultados[desplazamiento:desplazamiento + limite], len(resultados)
+
+    # ---------------- Tasas de cambio ---------------- #
+
+    def guardar_tasa(self, moneda_origen: str, moneda_destino: str, tasa: float) -> int:
+        """Guarda la tasa vigente y la cotización del día en el historial."""
+        with self.transaccion():
+            fila = self._fila(
+                f"""
+                INSERT INTO tasas_cambio (moneda_origen, moneda_destino, tasa, fecha_actualizacion)
+                VALUES (%s, %s, %s, {self.AHORA})
+                ON CONFLICT (moneda_origen, moneda_destino)
+                DO UPDATE SET tasa = EXCLUDED.tasa, fecha_actualizacion = {self.AHORA}
+                RETURNING id;
+                """,
+                (moneda_origen, moneda_destino, tasa)
+            )
+            self._ejecutar(
+                f"""
+                INSERT INTO tasas_cambio_historial (moneda_origen, moneda_destino, fecha, tasa)
+                VALUES (%s, %s, {self.HOY}, %s)
+                ON CONFLICT (moneda_origen, moneda_destino, fecha)
+                DO UPDATE SET tasa = EXCLUDED.tasa;
+                """,
+                (moneda_origen, moneda_destino, tasa)
+            )
+        return fila["id"]
+
+    @_cacheado("tasas_cambio")
+    def obtener_tasa(self, moneda_origen: str, moneda_destino: str) -> Optional[dict]:
+        """Tasa vigente y fecha de actualización, o None."""
+        return self._fila(
+            """
+            SELECT tasa, fecha_actualizacion
+            FROM tasas_cambio
+            WHERE moneda_origen = %s AND moneda_destino = %s;
+            """,
+            (moneda_origen, moneda_destino)
+        )
+
+    # ---------------- Contrapartes ---------------- #
+
+    def _registrar_contraparte(self, nombre: str) -> None:
+        self._ejecutar(
+            """
+            INSERT INTO contrapartes (clave, nombre)
+            VALUES (lower(trim(%s)), trim(%s))
+            ON CONFLICT (clave) DO NOTHING;
+            """,
+            (nombre, nombre)
+        )
+
+    def registrar_exposicion(self, persona: str, moneda: str, prestamos_activos: int,
+                             monto: float, intereses: float, ganancia: float,
+                             nuevo: bool = False) -> None:
+        """
+        Suma la variación de un préstamo a la exposición por persona y moneda.
+        nuevo=True suma además al histórico de la persona.
+        """
+        with self.transaccion():
+            self._registrar_contraparte(persona)
+            self._ejecutar(
+                """
+                INSERT INTO exposicion_contraparte (clave, moneda, prestamos_activos, monto_activo,
+                                                    intereses_pendientes, ganancia_pendiente,
+                                                    prestamos_totales, monto_historico)
+                VALUES (lower(trim(%s)), %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (clave, moneda) DO UPDATE SET
+                    prestamos_activos = exposicion_contraparte.prestamos_activos + EXCLUDED.prestamos_activos,
+                    monto_activo = ROUND(exposicion_contraparte.monto_activo + EXCLUDED.monto_activo, 2),
+                    intereses_pendientes = ROUND(exposicion_contraparte.intereses_pendientes + EXCLUDED.intereses_pendientes, 2),
+                    ganancia_pendiente = ROUND(exposicion_contraparte.ganancia_pendiente + EXCLUDED.ganancia_pendiente, 2),
+                    prestamos_totales = exposicion_contraparte.prestamos_totales + EXCLUDED.prestamos_totales,
+                    monto_historico = ROUND(exposicion_contraparte.monto_historico + EXCLUDED.monto_historico, 2);
+                """,
+                (persona, moneda, prestamos_activos, monto, intereses, ganancia,
+                 1 if nuevo else 0, monto if nuevo else 0)
+            )
+
+    @_cacheado("exposicion_contraparte", "contrapartes")
+    def exposicion_contrapartes(self, persona: Optional[str] = None) -> list:
+        """Exposición por persona y moneda (todas las personas con préstamos activos si se omite)."""
+        if persona:
+            return self._filas(
+                """
+                SELECT c.nombre, e.*
+                FROM exposicion_contraparte e
+                JOIN contrapartes c ON c.clave = e.clave
+                WHERE e.clave = lower(trim(%s))
+                ORDER BY e.moneda;
+                """,
+                (persona,)
+            )
+        return self._filas(
+            """
+            SELECT c.nombre, e.*
+            FROM exposicion_contraparte e
+            JOIN contrapartes c ON c.clave = e.clave
+            WHERE e.prestamos_activos > 0
+            ORDER BY c.nombre, e.moneda;
+            """
+        )
+
+    def historial_contraparte(self, persona: str, limite: int) -> tuple:
+        """Préstamos y transacciones de una persona, más recientes primero."""
+        with self.transaccion():
+            prestamos = self._filas(
+                """
+                SELECT id, monto_total, moneda, porcentaje_interes, monto_en_mano, estado,
+                       fecha_prestamo, fecha_finalizacion, descripcion
+                FROM prestamos
+                WHERE lower(trim(persona)) = lower(trim(%s))
+                ORDER BY fecha_prestamo DESC
+                LIMIT %s;
+                """,
+                (persona, limite)
+            )
+            transacciones = self._filas(
+                """
+                SELECT id, tipo, monto, fecha, descripcion
+                FROM transacciones
+                WHERE lower(trim(contraparte)) = lower(trim(%s))
+                ORDER BY fecha DESC
+                LIMIT %s;
+                """,
+                (persona, limite)
+            )
+        return prestamos, transacciones
+
+    # ---------------- Préstamos ---------------- #
+
+    def crear_prestamo(self, monto_total: float, moneda: str, persona: str, porcentaje_interes: float,
+                       tiene_intermediario: bool, porcentaje_intermediario: float,
+                       monto_intermediario: float, monto_en_mano: float, fecha_prestamo: str,
+                       cotizacion_momento: Optional[float], descripcion: Optional[str],
+                       saldo_pendiente: float) -> int:
+        fila = self._fila(
+            """
+            INSERT INTO prestamos (monto_total, moneda, persona, porcentaje_interes,
+                                 tiene_intermediario, porcentaje_intermediario,
+                                 monto_intermediario, monto_en_mano, fecha_prestamo,
+                                 cotizacion_momento, descripcion, saldo_pendiente)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id;
+            """,
+            (monto_total, moneda, persona, porcentaje_interes, tiene_intermediario,
+             porcentaje_intermediario, monto_intermediario, monto_en_mano, fecha_prestamo,
+             cotizacion_momento, descripcion, saldo_pendiente)
+        )
+        return fila["id"]
+
+    @_cacheado("prestamos")
+    def listar_prestamos(self, estado: str = "todos") -> list:
+        if estado == "todos":
+            return self._filas("SELECT * FROM prestamos ORDER BY fecha_prestamo DESC, id DESC;")
+        return self._filas(
+            "SELECT * FROM prestamos WHERE estado = %s ORDER BY fecha_prestamo DESC, id DESC;",
+            (estado,)
+        )
+
+    def obtener_prestamo(self, loan_id: int, solo_activo: bool = False, bloquear: bool = False) -> Optional[dict]:
+        """
+        Devuelve un préstamo o None. bloquear=True bloquea la fila hasta el fin de la
+        transacción (usar dentro de `transaccion()`).
+        """
+        return self._fila(
+            "SELECT * FROM prestamos WHERE id = %s"
+            + (" AND estado = 'activo'" if solo_activo else "")
+            + (self.PARA_ACTUALIZAR if bloquear else "") + ";",
+            (loan_id,)
+        )
+
+    def finalizar_prestamo(self, loan_id: int, cotizacion_finalizacion: Optional[float]) -> None:
+        self._ejecutar(
+            f"""
+            UPDATE prestamos
+            SET estado = 'finalizado', fecha_finalizacion = {self.HOY}, cotizacion_finalizacion = %s,
+                saldo_pendiente = 0, ganancia_cobrada = monto_en_mano
+            WHERE id = %s;
+            """,
+            (cotizacion_finalizacion, loan_id)
+        )
+
+    def registrar_pago_prestamo(self, loan_id: int, monto: float, fecha_pago: str, ganancia: float,
+                                descripcion: Optional[str], saldo_pendiente: float, liquidado: bool,
+                                cotizacion_finalizacion: Optional[float] = None) -> int:
+        """Guarda el pago y actualiza saldo, cobros y estado del préstamo. Devuelve el id del pago."""
+        with self.transaccion():
+            fila = self._fila(
+                """
+                INSERT INTO pagos_prestamo (prestamo_id, monto, fecha_pago, ganancia, descripcion)
+                VALUES (%s, %s, %s, %s, %s) RETURNING id;
+                """,
+                (loan_id, monto, fecha_pago, ganancia, descripcion)
+            )
+            self._ejecutar(
+                f"""
+                UPDATE prestamos
+                SET saldo_pendiente = %s,
+                    ganancia_cobrada = ROUND(ganancia_cobrada + %s, 2),
+                    monto_cobrado = ROUND(monto_cobrado + %s, 2),
+                    estado = CASE WHEN %s THEN 'finalizado' ELSE estado END,
+                    fecha_finalizacion = CASE WHEN %s THEN {self.HOY} ELSE fecha_finalizacion END,
+                    cotizacion_finalizacion = CASE WHEN %s THEN %s ELSE cotizacion_finalizacion END
+                WHERE id = %s;
+                """,
+                (saldo_pendiente, ganancia, monto, liquidado, liquidado, liquidado,
+                 cotizacion_finalizacion, loan_id)
+            )
+        return fila["id"]
+
+    def listar_pagos_prestamo(self, loan_id: int) -> list:
+        return self._filas(
+            """
+            SELECT id, monto, fecha_pago, ganancia, descripcion
+            FROM pagos_prestamo
+            WHERE prestamo_id = %s
+            ORDER BY fecha_pago, id;
+            """,
+            (loan_id,)
+        )
+
+    @_cacheado("prestamos")
+    def monedas_prestamos_activos(self) -> list:
+        return [f["moneda"] for f in self._filas(
+            "SELECT DISTINCT moneda FROM prestamos WHERE estado = 'activo' ORDER BY moneda;"
+        )]
+
+    def pnl_cambiario(self, columnas_grupo: list, estado: str, tasas_hoy: dict) -> tuple:
+        """
+        P&L cambiario agrupado por columnas_grupo. Devuelve (filas, prestamos_sin_cotizacion);
+        cada fila trae los valores de agrupación, cantidad, prestado_usd_origen,
+        prestado_usd_cierre, pnl_realizado_usd, pnl_no_realizado_usd y ganancia_intereses_usd.
+        tasas_hoy: cotización actual (USD por unidad) de las monedas con préstamos activos.
+        """
+        grupos = {}
+        sin_cotizacion = 0
+        for p in self.listar_prestamos(estado):
+            tasa_origen = p["cotizacion_momento"]
+            tasa_cierre = p["cotizacion_finalizacion"] if p["estado"] == "finalizado" else tasas_hoy.get(p["moneda"])
+            if tasa_origen is None or tasa_cierre is None:
+                sin_cotizacion += 1
+                continue
+            acumulado = grupos.setdefault(tuple(p[c] for c in columnas_grupo), [0, 0.0, 0.0, 0.0, 0.0, 0.0])
+            diferencia = p["monto_total"] * (tasa_cierre - tasa_origen)
+            acumulado[0] += 1
+            acumulado[1] += p["monto_total"] * tasa_origen
+            acumulado[2] += p["monto_total"] * tasa_cierre
+            acumulado[3 if p["estado"] == "finalizado" else 4] += diferencia
+            acumulado[5] += p["monto_en_mano"] * tasa_cierre
+        filas = [
+            list(clave) + [valores[0]] + [round(v, 2) for v in valores[1:]]
+            for clave, valores in sorted(grupos.items())
+        ]
+        return filas, sin_cotizacion
+
+    # ---------------- Saldo actual e historial ---------------- #
+
+    @_cacheado("saldo_diario")
+    def saldo_moneda(self, moneda: str) -> float:
+        """Saldo disponible de una moneda, leído de la última fila del rollup diario (sin recorrer saldo_actual)."""
+        fila = self._fila(
+            "SELECT saldo_cierre FROM saldo_diario WHERE moneda = %s ORDER BY fecha DESC LIMIT 1;",
+            (moneda,)
+        )
+        return fila["saldo_cierre"] if fila else 0
+
+    def bloquear_saldo(self) -> None:
+        """
+        Bloquea el rollup diario hasta el fin de la transacción en curso: quien verifica que
+        alcanza el saldo antes de descontar no se cruza con otro descuento concurrente.
+        """
+        self._bloquear_tabla("saldo_diario")
+
+    @_cacheado("saldo_actual")
+    def saldos_por_moneda(self) -> list:
+        """Saldo disponible por moneda (solo monedas con saldo distinto de cero)."""
+        return self._filas(
+            """
+            SELECT moneda, ROUND(SUM(monto), 2) AS monto
+            FROM saldo_actual
+            GROUP BY moneda
+            HAVING ROUND(SUM(monto), 2) != 0
+            ORDER BY moneda;
+            """
+        )
+
+    def registrar_movimiento_saldo(self, monto: float, moneda: str, descripcion: str, tipo_operacion: str,
+                                   monto_usd: float, saldo_anterior_usd: float,
+                                   categoria: Optional[str] = None) -> float:
+        """
+        Inserta un movimiento en saldo_actual (monto con signo), actualiza el rollup diario
+        y lo registra en historial_saldo, en una sola transacción.
+        Devuelve el nuevo saldo en USD usado para el historial.
+        """
+        saldo_nuevo_usd = saldo_anterior_usd + monto_usd if monto >= 0 else saldo_anterior_usd - monto_usd
+        self.registrar_movimientos_saldo([{
+            "monto": monto, "moneda": moneda, "descripcion": descripcion, "tipo_operacion": tipo_operacion,
+            "monto_usd": monto_usd, "saldo_anterior_usd": saldo_anterior_usd, "saldo_nuevo_usd": saldo_nuevo_usd,
+            "categoria": categoria
+        }])
+        return saldo_nuevo_usd
+
+    def registrar_movimientos_saldo(self, movimientos: list) -> None:
+        """
+        Versión por lotes de registrar_movimiento_saldo: cada movimiento es un dict con monto
+        (con signo), moneda, descripcion, tipo_operacion, monto_usd, saldo_anterior_usd,
+        saldo_nuevo_usd y opcionalmente categoria (si falta, se deduce de la descripción).
+        Usa un INSERT de varias filas por tabla y un upsert del rollup diario por moneda (los
+        movimientos de una misma moneda se suman antes).
+        """
+        if not movimientos:
+            return
+        automata = self.categorizador.automata()
+        categorias = [m.get("categoria") or self.categorizador.categorizar(m["descripcion"], m["tipo_operacion"], automata)
+                      for m in movimientos]
+        # La fecha se toma ahora: con el escritor de fondo la fila se inserta más tarde
+        fecha_operacion = datetime.datetime.now()
+        por_moneda = {}
+        for m in movimientos:
+            por_moneda[m["moneda"]] = round(por_moneda.get(m["moneda"], 0) + m["monto"], 2)
+
+        fila_saldo = f"(%s, %s, %s, %s, {self.AHORA})"
+        fila_diario = f"""(%s, {self.HOY}, %s, %s + COALESCE((
+                    SELECT saldo_cierre FROM saldo_diario
+                    WHERE moneda = %s AND fecha < {self.HOY}
+                    ORDER BY fecha DESC LIMIT 1
+                ), 0))"""
+        with self.transaccion():
+            # Los ids se asignan en el orden de VALUES: ordenados, el i-ésimo es el del i-ésimo movimiento
+            saldo_ids = sorted(f["id"] for f in self._filas(
+                f"""
+                INSERT INTO saldo_actual (monto, moneda, descripcion, categoria, updated_at)
+                VALUES {", ".join([fila_saldo] * len(movimientos))}
+                RETURNING id;
+                """,
+                tuple(v for m, categoria in zip(movimientos, categorias)
+                      for v in (m["monto"], m["moneda"], m["descripcion"], categoria))
+            ))
+            self._sumar_a_bloques("saldo_actual", saldo_ids)
+            self._ejecutar(
+                f"""
+                INSERT INTO saldo_diario (moneda, fecha, movimiento, saldo_cierre)
+                VALUES {", ".join([fila_diario] * len(por_moneda))}
+                ON CONFLICT (moneda, fecha)
+                DO UPDATE SET movimiento = ROUND(saldo_diario.movimiento + EXCLUDED.movimiento, 2),
+                              saldo_cierre = ROUND(saldo_diario.saldo_cierre + EXCLUDED.movimiento, 2);
+                """,
+                tuple(v for moneda, monto in por_moneda.items() for v in (moneda, monto, monto, moneda))
+            )
+            historial = [
+                (m["tipo_operacion"], m["monto_usd"], m["saldo_anterior_usd"], m["saldo_nuevo_usd"],
+                 f"{m['descripcion']} ({abs(m['monto'])} {m['moneda']})", fecha_operacion, saldo_id)
+                for m, saldo_id in zip(movimientos, saldo_ids)
+            ]
+            if self.escritor_historial is None:
+                self._insertar_historial(historial)
+            else:
+                self._local.historial.extend(historial)
+
+    def _insertar_historial(self, filas: list) -> None:
+        """
+        INSERT de varias filas en historial_saldo (tuplas en el orden de las columnas) y suma
+        de las filas a los bloques de control, en la misma transacción.
+        """
+        with self.transaccion():
+            ids = [f["id"] for f in self._filas(
+                f"""
+                INSERT INTO historial_saldo (tipo_operacion, monto_operacion, saldo_anterior,
+                                           saldo_nuevo, descripcion, fecha_operacion, saldo_id)
+                VALUES {", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(filas))}
+                RETURNING id;
+                """,
+                tuple(v for fila in filas for v in fila)
+            )]
+            self._sumar_a_bloques("historial_saldo", ids)
+
+    def _sincronizar_historial(self) -> None:
+        """
+        Antes de leer historial_saldo: espera al escritor de fondo y escribe las filas
+        pendientes de la transacción en curso. Se espera antes de escribir lo propio: al
+        insertar, la transacción toma la fila de bloques_control que el escritor también
+        actualiza, y esperarlo después lo dejaría bloqueado hasta el commit. Por eso tampoco
+        se espera si la transacción ya escribió historial, ni con conexión única (el escritor
+        necesita la conexión).
+        """
+        if self.escritor_historial is None:
+            return
+        if getattr(self._local, "conexion", None) is None:
+            self.escritor_historial.vaciar(plazos.limitar(10.0))
+            return
+        if not (self.CONEXION_UNICA or self._local.historial_insertado):
+            self.escritor_historial.vaciar(plazos.limitar(10.0))
+        if self._local.historial:
+            pendientes, self._local.historial = self._local.historial, []
+            self._insertar_historial(pendientes)
+            self._local.historial_insertado = True
+
+    def historial_saldo(self, limite: int) -> list:
+        self._sincronizar_historial()
+        return self._filas(
+            "SELECT * FROM historial_saldo ORDER BY fecha_operacion DESC, id DESC LIMIT %s;",
+            (limite,)
+        )
+
+    def posiciones_por_moneda(self) -> dict:
+        """Préstamos activos (monto prestado) + saldo disponible, por moneda."""
+        filas = self._filas(
+            """
+            SELECT moneda, ROUND(SUM(monto), 2) AS monto FROM (
+                SELECT moneda, monto_total AS monto FROM prestamos WHERE estado = 'activo'
+                UNION ALL
+                SELECT moneda, monto FROM saldo_actual
+            ) posiciones
+            GROUP BY moneda
+            ORDER BY moneda;
+            """
+        )
+        return {f["moneda"]: f["monto"] for f in filas if f["monto"]}
+
+    def serie_patrimonio(self, desde: datetime.date, intervalo: str) -> list:
+        """
+        Saldo disponible valuado en USD con la cotización histórica de cada fecha, desde
+        `desde` hasta hoy cada `intervalo` ('dia', 'semana' o 'mes'). Cada fila es
+        [fecha, patrimonio_usd, patrimonio_ars, variacion_usd, monedas_sin_tasa].
+        """
+        hoy = datetime.date.today()
+        puntos = []
+        fecha = desde
+        while fecha <= hoy:
+            puntos.append(fecha)
+            if intervalo == "mes":
+                fecha = _sumar_meses(fecha, 1)
+            else:
+                fecha += datetime.timedelta(days=7 if intervalo == "semana" else 1)
+        if not puntos or puntos[-1] != hoy:
+            puntos.append(hoy)
+
+        with self.transaccion():
+            saldos = self._filas("SELECT moneda, fecha, saldo_cierre FROM saldo_diario ORDER BY moneda, fecha;")
+            historial = self._filas(
+                """
+                SELECT moneda_origen AS moneda, fecha, tasa FROM tasas_cambio_historial
+                WHERE moneda_destino = 'USD' ORDER BY moneda_origen, fecha;
+                """
+            )
+            actuales = {f["moneda_origen"]: f["tasa"] for f in self._filas(
+                "SELECT moneda_origen, tasa FROM tasas_cambio WHERE moneda_destino = 'USD';"
+            )}
+
+        def por_moneda(filas, campo):
+            series = {}
+            for f in filas:
+                fechas, valores = series.setdefault(f["moneda"], ([], []))
+                fechas.append(f["fecha"])
+                valores.append(f[campo])
+            return series
+
+        def ultimo(serie, fecha):
+            if serie is None:
+                return None
+            i = bisect.bisect_right(serie[0], fecha)
+            return serie[1][i - 1] if i else None
+
+        saldos_series = por_moneda(saldos, "saldo_cierre")
+        tasas_series = por_moneda(historial, "tasa")
+        if not saldos_series:
+            return []
+
+        filas = []
+        anterior = None
+        for punto in puntos:
+            fecha = punto.isoformat()
+            patrimonio_usd = None
+            ars_por_usd = None
+            sin_tasa = 0
+            for moneda, serie in saldos_series.items():
+                saldo = ultimo(serie, fecha) or 0
+                tasa = 1 if moneda == "USD" else ultimo(tasas_series.get(moneda), fecha)
+                if tasa is None:
+                    tasa = actuales.get(moneda)
+                if tasa is None:
+                    sin_tasa += saldo != 0
+                    continue
+                patrimonio_usd = (patrimonio_usd or 0) + saldo * tasa
+                if moneda == "ARS" and tasa:
+                    ars_por_usd = 1 / tasa
+            filas.append([
+                fecha,
+                patrimonio_usd,
+                patrimonio_usd * ars_por_usd if patrimonio_usd is not None and ars_por_usd else None,
+                patrimonio_usd - anterior if patrimonio_usd is not None and anterior is not None else None,
+                sin_tasa
+            ])
+            anterior = patrimonio_usd
+        return filas
+
+    def reconstruir_saldo_diario(self) -> int:
+        """Regenera saldo_diario desde saldo_actual. Devuelve la cantidad de filas generadas."""
+        with self.transaccion():
+            self._bloquear_tabla("saldo_diario")
+            self._ejecutar("DELETE FROM saldo_diario;")
+            return self._ejecutar(
+                f"""
+                INSERT INTO saldo_diario (moneda, fecha, movimiento, saldo_cierre)
+                SELECT moneda, fecha, movimiento,
+                       ROUND(SUM(movimiento) OVER (PARTITION BY moneda ORDER BY fecha), 2)
+                FROM (
+                    SELECT moneda, {self._fecha_de("updated_at")} AS fecha, ROUND(SUM(monto), 2) AS movimiento
+                    FROM saldo_actual
+                    GROUP BY moneda, {self._fecha_de("updated_at")}
+                ) diario;
+                """
+            )
+
+    # ---------------- Movimientos recurrentes ---------------- #
+
+    def crear_regla_recurrente(self, tipo: str, monto: float, moneda: str, descripcion: str,
+                               frecuencia: str, dia: int, proxima_fecha: str) -> int:
+        fila = self._fila(
+            """
+            INSERT INTO reglas_recurrentes (tipo, monto, moneda, descripcion, frecuencia, dia, proxima_fecha)
+            VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id;
+            """,
+            (tipo, monto, moneda, descripcion, frecuencia, dia, proxima_fecha)
+        )
+        return fila["id"]
+
+    def listar_reglas_recurrentes(self, incluir_inactivas: bool = False) -> list:
+        return self._filas(
+            "SELECT * FROM reglas_recurrentes"
+            + ("" if incluir_inactivas else " WHERE activa")
+            + " ORDER BY proxima_fecha, id;"
+        )
+
+    def desactivar_regla_recurrente(self, regla_id: int) -> bool:
+        """Da de baja una regla activa. False si no existe o ya estaba inactiva."""
+        return self._ejecutar(
+            "UPDATE reglas_recurrentes SET activa = FALSE WHERE id = %s AND activa;",
+            (regla_id,)
+        ) > 0
+
+    def reglas_vencidas(self, hasta: datetime.date) -> list:
+        """
+        Reglas activas con una fecha pendiente hasta `hasta`, bloqueadas hasta el fin de la
+        transacción: otro proceso que las busque espera y, al seguir, ya las ve avanzadas.
+        """
+        return self._filas(
+            "SELECT * FROM reglas_recurrentes WHERE activa AND proxima_fecha <= %s ORDER BY proxima_fecha, id"
+            + self.PARA_ACTUALIZAR + ";",
+            (hasta.isoformat(),)
+        )
+
+    def avanzar_regla_recurrente(self, regla_id: int, proxima_fecha: str, ultima_aplicacion: str,
+                                 aplicaciones: int) -> None:
+        self._ejecutar(
+            """
+            UPDATE reglas_recurrentes
+            SET proxima_fecha = %s, ultima_aplicacion = %s, aplicaciones = aplicaciones + %s
+            WHERE id = %s;
+            """,
+            (proxima_fecha, ultima_aplicacion, aplicaciones, regla_id)
+        )
+
+    # ---------------- Estadísticas de gasto por categoría ---------------- #
+
+    def bloquear_estadistica_categoria(self, categoria: str) -> dict:
+        """
+        Estadísticas acumuladas de la categoría (la crea vacía si no existe), bloqueadas hasta
+        el fin de la transacción: dos gastos simultáneos de la misma categoría no se pisan.
+        """
+        self._ejecutar(
+            "INSERT INTO estadisticas_categoria (categoria) VALUES (%s) ON CONFLICT (categoria) DO NOTHING;",
+            (categoria,)
+        )
+        return self._fila(
+            "SELECT * FROM estadisticas_categoria WHERE categoria = %s" + self.PARA_ACTUALIZAR + ";",
+            (categoria,)
+        )
+
+    def guardar_estadistica_categoria(self, categoria: str, cantidad: int, media_usd: float, m2_usd: float,
+                                      maximo_usd: float) -> None:
+        self._ejecutar(
+            f"""
+            UPDATE estadisticas_categoria
+            SET cantidad = %s, media_usd = %s, m2_usd = %s, maximo_usd = %s, ultimo_gasto = {self.AHORA}
+            WHERE categoria = %s;
+            """,
+            (cantidad, media_usd, m2_usd, maximo_usd, categoria)
+        )
+
+    def sumar_gasto_categoria(self, categoria: str, fecha: datetime.date, monto_usd: float) -> None:
+        """Suma el gasto al total diario de la categoría (base de las ventanas móviles)."""
+        self._ejecutar(
+            """
+            INSERT INTO gasto_categoria_diario (categoria, fecha, cantidad, total_usd)
+            VALUES (%s, %s, 1, %s)
+            ON CONFLICT (categoria, fecha)
+            DO UPDATE SET cantidad = gasto_categoria_diario.cantidad + 1,
+                          total_usd = ROUND(gasto_categoria_diario.total_usd + EXCLUDED.total_usd, 2);
+            """,
+            (categoria, fecha.isoformat(), monto_usd)
+        )
+
+    def gasto_categoria_por_dia(self, categoria: str, desde: datetime.date) -> list:
+        """Totales diarios de la categoría desde `desde` (para ventanas de días, no recorre el historial)."""
+        return self._filas(
+            """
+            SELECT fecha, cantidad, total_usd
+            FROM gasto_categoria_diario
+            WHERE categoria = %s AND fecha >= %s
+            ORDER BY fecha;
+            """,
+            (categoria, desde.isoformat())
+        )
+
+    def listar_estadisticas_categorias(self) -> list:
+        """Estadísticas de todas las categorías con gastos o presupuesto, con su presupuesto si lo hay."""
+        return self._filas(
+            """
+            SELECT COALESCE(e.categoria, p.categoria) AS categoria, COALESCE(e.cantidad, 0) AS cantidad,
+                   COALESCE(e.media_usd, 0) AS media_usd, COALESCE(e.m2_usd, 0) AS m2_usd,
+                   COALESCE(e.maximo_usd, 0) AS maximo_usd, e.ultimo_gasto, p.limite_usd, p.periodo
+            FROM estadisticas_categoria e
+            LEFT JOIN presupuestos_categoria p ON p.categoria = e.categoria
+            UNION ALL
+            SELECT p.categoria, 0, 0, 0, 0, NULL, p.limite_usd, p.periodo
+            FROM presupuestos_categoria p
+            WHERE NOT EXISTS (SELECT 1 FROM estadisticas_categoria e WHERE e.categoria = p.categoria)
+            ORDER BY categoria;
+            """
+        )
+
+    def fijar_presupuesto(self, categoria: str, limite_usd: float, periodo: str) -> None:
+        self._ejecutar(
+            f"""
+            INSERT INTO presupuestos_categoria (categoria, limite_usd, periodo, updated_at)
+            VALUES (%s, %s, %s, {self.AHORA})
+            ON CONFLICT (categoria)
+            DO UPDATE SET limite_usd = EXCLUDED.limite_usd, periodo = EXCLUDED.periodo, updated_at = {self.AHORA};
+            """,
+            (categoria, limite_usd, periodo)
+        )
+
+    def eliminar_presupuesto(self, categoria: str) -> bool:
+        return self._ejecutar("DELETE FROM presupuestos_categoria WHERE categoria = %s;", (categoria,)) > 0
+
+    def obtener_presupuesto(self, categoria: str) -> Optional[dict]:
+        return self._fila("SELECT * FROM presupuestos_categoria WHERE categoria = %s;", (categoria,))
+
+    # ---------------- Categorización ---------------- #
+
+    def crear_regla_categoria(self, patron: str, categoria: str) -> int:
+        """Regla del usuario: palabra o frase -> categoría (si la palabra ya tenía regla, la reemplaza)."""
+        fila = self._fila(
+            """
+            INSERT INTO reglas_categoria (patron, categoria) VALUES (%s, %s)
+            ON CONFLICT (patron) DO UPDATE SET categoria = EXCLUDED.categoria
+            RETURNING id;
+            """,
+            (normalizar_texto(patron).strip(), categoria)
+        )
+        return fila["id"]
+
+    def listar_reglas_categoria(self) -> list:
+        return self._filas("SELECT * FROM reglas_categoria ORDER BY categoria, patron;")
+
+    def eliminar_regla_categoria(self, regla_id: int) -> bool:
+        return self._ejecutar("DELETE FROM reglas_categoria WHERE id = %s;", (regla_id,)) > 0
+
+    def filas_a_categorizar(self, tabla: str, desde_id: int, limite: int, todas: bool = False) -> list:
+        """
+        Siguiente lote (id, descripcion, tipo, categoria) de una tabla del libro, por clave primaria a
+        partir de `desde_id`: sin categoría, o todas las filas con todas=True.
+        """
+        if tabla not in TABLAS_CATEGORIZADAS:
+            raise ValueError(f"Tabla sin categoría: {tabla}")
+        tipo = "tipo" if tabla == "transacciones" else "CASE WHEN monto < 0 THEN 'gasto' ELSE 'ingreso' END"
+        sin_categoria = "" if todas else " AND categoria IS NULL"
+        return self._filas(
+            f"""
+            SELECT id, descripcion, {tipo} AS tipo, categoria
+            FROM {tabla}
+            WHERE id > %s{sin_categoria}
+            ORDER BY id
+            LIMIT %s;
+            """,
+            (desde_id, limite)
+        )
+
+    def asignar_categorias(self, tabla: str, por_categoria: dict) -> int:
+        """Guarda categorías con un UPDATE por categoría ({categoria: [ids]}). Devuelve las filas tocadas."""
+        if tabla not in TABLAS_CATEGORIZADAS:
+            raise ValueError(f"Tabla sin categoría: {tabla}")
+        return sum(
+            self._ejecutar(
+                f"UPDATE {tabla} SET categoria = %s WHERE id IN ({', '.join(['%s'] * len(ids))});",
+                (categoria, *ids)
+            )
+            for categoria, ids in por_categoria.items() if ids
+        )
+
+    def reporte_categorias_transacciones(self, desde_mes: datetime.date, hasta_mes: datetime.date) -> list:
+        """Como reporte_mensual, pero por mes y categoría (lee transacciones en el rango de fechas)."""
+        mes = self._inicio_mes("fecha")
+        return self._filas(
+            f"""
+            SELECT {mes} AS mes, COALESCE(categoria, 'sin_categorizar') AS categoria,
+                   SUM(CASE WHEN tipo = 'ingreso' THEN monto END) AS ingresos,
+                   SUM(CASE WHEN tipo = 'gasto' THEN monto END) AS gastos,
+                   SUM(CASE WHEN tipo = 'prestamo' THEN monto END) AS prestamos,
+                   SUM(CASE WHEN tipo = 'ingreso' THEN monto
+                            WHEN tipo IN ('gasto','prestamo') THEN -monto ELSE 0 END) AS balance,
+                   COUNT(*) AS cantidad
+            FROM transacciones
+            WHERE fecha >= %s AND fecha < %s
+            GROUP BY {mes}, COALESCE(categoria, 'sin_categorizar')
+            ORDER BY mes, categoria;
+            """,
+            (desde_mes.isoformat(), _sumar_meses(hasta_mes, 1).isoformat())
+        )
+
+    def reporte_categorias_saldo(self, desde: datetime.date, hasta: datetime.date, por_mes: bool = False) -> list:
+        """Gastos e ingresos de saldo_actual por categoría y moneda (y mes) entre dos fechas inclusive."""
+        mes = f"{self._inicio_mes('updated_at')} AS mes, " if por_mes else ""
+        columnas_grupo = "COALESCE(categoria, 'sin_categorizar'), moneda"
+        if por_mes:
+            columnas_grupo = f"{self._inicio_mes('updated_at')}, {columnas_grupo}"
+        return self._filas(
+            f"""
+            SELECT {mes}COALESCE(categoria, 'sin_categorizar') AS categoria, moneda,
+                   ROUND(SUM(CASE WHEN monto < 0 THEN -monto ELSE 0 END), 2) AS gastos,
+                   ROUND(SUM(CASE WHEN monto > 0 THEN monto ELSE 0 END), 2) AS ingresos,
+                   SUM(CASE WHEN monto < 0 THEN 1 ELSE 0 END) AS cantidad_gastos,
+                   COUNT(*) AS cantidad
+            FROM saldo_actual
+            WHERE updated_at >= %s AND updated_at < %s
+            GROUP BY {columnas_grupo}
+            ORDER BY {"mes, " if por_mes else ""}gastos DESC, categoria, moneda;
+            """,
+            (desde.isoformat(), (hasta + datetime.timedelta(days=1)).isoformat())
+        )
+
+    # ---------------- Control de integridad del libro ---------------- #
+
+    def _expresiones_control(self, tabla: str) -> tuple:
+        """(bloque, digesto del contenido, digesto del movimiento) de cada fila, como expresiones SQL."""
+        if tabla not in TABLAS_CONTROLADAS:
+            raise ValueError(f"Tabla sin control de integridad: {tabla}")
+        columna, columnas, vinculo = TABLAS_CONTROLADAS[tabla]
+        texto = " || '|' || ".join(f"COALESCE(CAST({c} AS TEXT), '')" for c in columnas)
+        # Sin movimiento vinculado (historial anterior al vínculo) el digesto del vínculo es 0
+        return (f"COALESCE({columna} / {TAMANO_BLOQUE}, -1)", self._digesto(texto),
+                f"COALESCE({self._digesto(f'CAST({vinculo} AS TEXT)')}, 0)" if vinculo else "0")
+
+    def _sumar_a_bloques(self, tabla: str, ids: list) -> None:
+        """Suma filas recién insertadas (por id) a las sumas de control de sus bloques."""
+        if not ids:
+            return
+        bloque, digesto, vinculo = self._expresiones_control(tabla)
+        self._ejecutar(
+            f"""
+            INSERT INTO bloques_control (tabla, bloque, filas, digesto, vinculo, updated_at)
+            SELECT %s, {bloque}, COUNT(*), SUM({digesto}), SUM({vinculo}), {self.AHORA}
+            FROM {tabla}
+            WHERE id IN ({", ".join(["%s"] * len(ids))})
+            GROUP BY {bloque}
+            ON CONFLICT (tabla, bloque)
+            DO UPDATE SET filas = bloques_control.filas + EXCLUDED.filas,
+                          digesto = bloques_control.digesto + EXCLUDED.digesto,
+                          vinculo = bloques_control.vinculo + EXCLUDED.vinculo,
+                          updated_at = EXCLUDED.updated_at;
+            """,
+            (tabla, *ids)
+        )
+
+    def resumen_bloques(self) -> list:
+        """Bloques sellados y filas que cubren, por tabla."""
+        return self._filas(
+            """
+            SELECT tabla, COUNT(*) AS bloques, SUM(filas) AS filas, MAX(updated_at) AS ultimo_cambio
+            FROM bloques_control
+            GROUP BY tabla
+            ORDER BY tabla;
+            """
+        )
+
+    def diferencias_bloques(self, tabla: str) -> list:
+        """
+        Bloques cuyas filas actuales no coinciden con sus sumas de control. Las sumas de cada
+        bloque se recalculan en la base en una sola pasada y solo vuelven los bloques distintos,
+        con la diferencia (actual - sellado) de filas, digesto y vínculo.
+        """
+        if tabla == "historial_saldo":
+            self._sincronizar_historial()
+        bloque, digesto, vinculo = self._expresiones_control(tabla)
+        return self._filas(
+            f"""
+            SELECT bloque, SUM(filas) AS filas, SUM(digesto) AS digesto, SUM(vinculo) AS vinculo
+            FROM (
+                SELECT {bloque} AS bloque, 1 AS filas, {digesto} AS digesto, {vinculo} AS vinculo
+                FROM {tabla}
+                UNION ALL
+                SELECT bloque, -filas, -digesto, -vinculo
+                FROM bloques_control
+                WHERE tabla = %s
+            ) d
+            GROUP BY bloque
+            HAVING SUM(filas) <> 0 OR SUM(digesto) <> 0 OR SUM(vinculo) <> 0
+            ORDER BY bloque;
+            """,
+            (tabla,)
+        )
+
+    def diferencias_vinculo(self) -> list:
+        """
+        Bloques en que saldo_actual e historial_saldo no registran los mismos movimientos,
+        según sus sumas de control (solo lee bloques_control). filas = saldo - historial.
+        """
+        self._sincronizar_historial()
+        return self._filas(
+            """
+            SELECT bloque,
+                   SUM(CASE WHEN tabla = 'saldo_actual' THEN filas ELSE -filas END) AS filas,
+                   SUM(CASE WHEN tabla = 'saldo_actual' THEN vinculo ELSE -vinculo END) AS vinculo
+            FROM bloques_control
+            WHERE tabla IN ('saldo_actual', 'historial_saldo')
+            GROUP BY bloque
+            HAVING SUM(CASE WHEN tabla = 'saldo_actual' THEN filas ELSE -filas END) <> 0
+                OR SUM(CASE WHEN tabla = 'saldo_actual' THEN vinculo ELSE -vinculo END) <> 0
+            ORDER BY bloque;
+            """
+        )
+
+    def filas_bloque(self, tabla: str, bloque: int) -> list:
+        """Filas de un bloque (el bloque -1 de historial_saldo son las filas sin movimiento vinculado)."""
+        if tabla not in TABLAS_CONTROLADAS:
+            raise ValueError(f"Tabla sin control de integridad: {tabla}")
+        if tabla == "historial_saldo":
+            self._sincronizar_historial()
+        columna = TABLAS_CONTROLADAS[tabla][0]
+        if bloque < 0:
+            return self._filas(f"SELECT * FROM {tabla} WHERE {columna} IS NULL ORDER BY id;")
+        return self._filas(
+            f"SELECT * FROM {tabla} WHERE {columna} BETWEEN %s AND %s ORDER BY id;",
+            (bloque * TAMANO_BLOQUE, (bloque + 1) * TAMANO_BLOQUE - 1)
+        )
+
+    def resellar_bloques(self, tabla: str, bloques: list) -> int:
+        """Reemplaza las sumas de control de esos bloques por las de sus filas actuales. Devuelve los bloques sellados."""
+        bloque, digesto, vinculo = self._expresiones_control(tabla)
+        sellados = 0
+        with self.transaccion():
+            for inicio in range(0, len(bloques), 1000):
+                parte = bloques[inicio:inicio + 1000]
+                lista = ", ".join(["%s"] * len(parte))
+                self._ejecutar(f"DELETE FROM bloques_control WHERE tabla = %s AND bloque IN ({lista});",
+                               (tabla, *parte))
+                sellados += self._ejecutar(
+                    f"""
+                    INSERT INTO bloques_control (tabla, bloque, filas, digesto, vinculo, updated_at)
+                    SELECT %s, {bloque}, COUNT(*), SUM({digesto}), SUM({vinculo}), {self.AHORA}
+                    FROM {tabla}
+                    WHERE {bloque} IN ({lista})
+                    GROUP BY {bloque};
+                    """,
+                    (tabla, *parte)
+                )
+        return sellados
+
+    def historial_sin_vinculo(self) -> list:
+        """Ids de historial_saldo sin movimiento de saldo_actual vinculado (filas anteriores al vínculo)."""
+        self._sincronizar_historial()
+        return [f["id"] for f in self._filas("SELECT id FROM historial_saldo WHERE saldo_id IS NULL ORDER BY id;")]
+
+    def saldo_sin_historial(self) -> list:
+        """Ids de saldo_actual que ninguna fila de historial_saldo registra."""
+        self._sincronizar_historial()
+        return [f["id"] for f in self._filas(
+            """
+            SELECT id FROM saldo_actual s
+            WHERE NOT EXISTS (SELECT 1 FROM historial_saldo h WHERE h.saldo_id = s.id)
+            ORDER BY id;
+            """
+        )]
+
+    def vincular_historial(self, pares: list) -> int:
+        """Vincula filas de historial_saldo sin vínculo a movimientos ([(historial_id, saldo_id)])."""
+        vinculadas = 0
+        with self.transaccion():
+            for inicio in range(0, len(pares), 1000):
+                parte = pares[inicio:inicio + 1000]
+                vinculadas += self._ejecutar(
+                    f"""
+                    UPDATE historial_saldo SET saldo_id = v.column2
+                    FROM (VALUES {", ".join(["(%s, %s)"] * len(parte))}) AS v
+                    WHERE historial_saldo.id = v.column1 AND historial_saldo.saldo_id IS NULL;
+                    """,
+                    tuple(v for par in parte for v in par)
+                )
+        return vinculadas
+
+
+# ---------------- Selección del backend ---------------- #
+
+_repositorio = None
+_bloqueo_repositorio = threading.Lock()
+
+
+def crear_repositorio(backend: Optional[str] = None) -> RepositorioFinanzas:
+    """
+    Crea un repositorio según FINANZAS_BACKEND:
+      - 'postgres' (por defecto): usa FINANZAS_DSN (por defecto, el servicio "db" de docker-compose)
+        y, si está FINANZAS_DSN_LECTURA, manda las herramientas de solo lectura a esa réplica
+      - 'sqlite': base embebida en FINANZAS_SQLITE (por defecto, en memoria)
+      - 'memoria': SQLite en memoria
+    """
+    backend = (backend or os.environ.get("FINANZAS_BACKEND", "postgres")).lower()
+    if backend == "postgres":
+        from .repositorio_postgres import RepositorioPostgres
+        repositorio = RepositorioPostgres(os.environ.get("FINANZAS_DSN"), os.environ.get("FINANZAS_DSN_LECTURA"))
+    elif backend in ("sqlite", "memoria"):
+        from .repositorio_sqlite import RepositorioSQLite
+        ruta = ":memory:" if backend == "memoria" else os.environ.get("FINANZAS_SQLITE", ":memory:")
+        repositorio = RepositorioSQLite(ruta)
+    else:
+        raise ValueError(f"Backend desconocido: {backend}. Opciones: postgres, sqlite, memoria")
+    # historial_saldo se escribe en segundo plano salvo FINANZAS_HISTORIAL_ASINCRONO=0
+    if os.environ.get("FINANZAS_HISTORIAL_ASINCRONO", "1") != "0":
+        repositorio.activar_escritor_historial()
+    # Caché de lecturas coherente entre réplicas (LISTEN/NOTIFY) salvo FINANZAS_CACHE=0
+    if os.environ.get("FINANZAS_CACHE", "1") != "0":
+        repositorio.iniciar_escucha()
+    # Movimientos recurrentes generados en segundo plano salvo FINANZAS_RECURRENTES=0
+    if os.environ.get("FINANZAS_RECURRENTES", "1") != "0":
+        repositorio.activar_programador_recurrentes()
+    return repositorio
+
+
+def obtener_repositorio() -> RepositorioFinanzas:
+    """Repositorio activo del proceso (se crea en el primer uso)."""
+    global _repositorio
+    if _repositorio is None:
+        with _bloqueo_repositorio:
+            if _repositorio is None:
+                _repositorio = crear_repositorio()
+    return _repositorio
+
+
+def usar_repositorio(repositorio: RepositorioFinanzas) -> Optional[RepositorioFinanzas]:
+    """Reemplaza el repositorio activo (pruebas, benchmarks). Devuelve el anterior."""
+    global _repositorio
+    with _bloqueo_repositorio:
+        anterior, _repositorio = _repositorio, repositorio
+    return anterior
@@ -0,0 +1,529 @@
+# Backend Postgres del repositorio (psycopg2)
+import decimal
+import logging
+import os
+import re
+import select
+import threading
+from typing import Optional
+
+import psycopg2
+import psycopg2.extras
+import psycopg2.pool
+
+from . import cache, plazos
+from .instrumentacion import CursorInstrumentado
+from .repositorio import RepositorioFinanzas, lectura_replica
+
+log = logging.getLogger(__name__)
+
+# Lo que hace que una consulta con SELECT/WITH no sea una lectura pura (no se repite con ANALYZE)
+_ESCRIBE = re.compile(r"\b(INSERT|UPDATE|DELETE|NEXTVAL|SETVAL|PG_NOTIFY)\b")
+
+# El host "db" es el servicio definido en docker-compose
+DSN_POR_DEFECTO = "dbname=finanzas user=postgres password=postgres host=db port=5432"
+
+# Consultas de búsqueda por tabla. Las condiciones coinciden con los índices de
+# init.sql: texto completo en español sobre descripcion y trigramas (pg_trgm)
+# sobre descripcion y contraparte/persona.
+FUENTES_BUSQUEDA = {
+    "transacciones": """
+        SELECT 'transacciones' AS origen, id, fecha::timestamp AS fecha, monto,
+               NULL::varchar AS moneda, descripcion, contraparte,
+               GREATEST(ts_rank(to_tsvector('spanish', COALESCE(descripcion, '')), plainto_tsquery('spanish', %(q)s)),
+                        word_similarity(%(q)s, COALESCE(descripcion, '')),
+                        word_similarity(%(q)s, COALESCE(contraparte, ''))) AS relevancia
+        FROM transacciones
+        WHERE to_tsvector('spanish', COALESCE(descripcion, '')) @@ plainto_tsquery('spanish', %(q)s)
+           OR %(q)s <%% descripcion
+           OR %(q)s <%% contraparte
+    """,
+    "saldo_actual": """
+        SELECT 'saldo_actual' AS origen, id, updated_at AS fecha, monto,
+               moneda, descripcion, NULL::varchar AS contraparte,
+               GREATEST(ts_rank(to_tsvector('spanish', COALESCE(descripcion, '')), plainto_tsquery('spanish', %(q)s)),
+                        word_similarity(%(q)s, COALESCE(descripcion, ''))) AS relevancia
+        FROM saldo_actual
+        WHERE to_tsvector('spanish', COALESCE(descripcion, '')) @@ plainto_tsquery('spanish', %(q)s)
+           OR %(q)s <%% descripcion
+    """,
+    "prestamos": """
+        SELECT 'prestamos' AS origen, id, fecha_prestamo::timestamp AS fecha, monto_total AS monto,
+               moneda, descripcion, persona AS contraparte,
+               GREATEST(ts_rank(to_tsvector('spanish', COALESCE(descripcion, '')), plainto_tsquery('spanish', %(q)s)),
+                        word_similarity(%(q)s, COALESCE(descripcion, '')),
+                        word_similarity(%(q)s, persona)) AS relevancia
+        FROM prestamos
+        WHERE to_tsvector('spanish', COALESCE(descripcion, '')) @@ plainto_tsquery('spanish', %(q)s)
+           OR %(q)s <%% descripcion
+           OR %(q)s <%% persona
+    """,
+    "historial_saldo": """
+        SELECT 'historial_saldo' AS origen, id, fecha_operacion AS fecha, monto_operacion AS monto,
+               'USD'::varchar AS moneda, descripcion, NULL::varchar AS contraparte,
+               GREATEST(ts_rank(to_tsvector('spanish', COALESCE(descripcion, '')), plainto_tsquery('spanish', %(q)s)),
+                        word_similarity(%(q)s, COALESCE(descripcion, ''))) AS relevancia
+        FROM historial_saldo
+        WHERE to_tsvector('spanish', COALESCE(descripcion, '')) @@ plainto_tsquery('spanish', %(q)s)
+           OR %(q)s <%% descripcion
+    """
+}
+
+# Canal de NOTIFY por el que las réplicas se avisan qué tablas cambiaron.
+# Payload: "<id de réplica>|tabla1,tabla2"
+CANAL_CAMBIOS = "finanzas_cambios"
+
+# Conexiones que el pool del primario mantiene abiertas; si se agotan, se abre una suelta
+MAX_CONEXIONES = int(os.environ.get("FINANZAS_POOL", "10"))
+
+# Conexiones abiertas como máximo contra la réplica de lectura; si se agotan, se lee del primario
+MAX_CONEXIONES_LECTURA = int(os.environ.get("FINANZAS_POOL_LECTURA", "10"))
+
+# Paso entre puntos de la serie de patrimonio
+INTERVALOS_SQL = {"dia": "1 day", "semana": "1 week", "mes": "1 month"}
+
+
+class _Pool(psycopg2.pool.ThreadedConnectionPool):
+    """
+    Pool que abre las conexiones a medida que hacen falta y conserva hasta maxconn ociosas
+    (psycopg2 solo conserva minconn, y esas las abre todas al crear el pool).
+    """
+
+    def __init__(self, maxconn: int, *args, **kwargs):
+        super().__init__(0, maxconn, *args, **kwargs)
+        self.minconn = maxconn
+
+
+def _lsn(texto: str) -> int:
+    """Posición de WAL ('16/B374D848') como entero comparable."""
+    alto, _, bajo = texto.partition("/")
+    return (int(alto, 16) << 32) + int(bajo, 16)
+
+
+class RepositorioPostgres(RepositorioFinanzas):
+    """
+    Repositorio sobre Postgres: cada transacción toma una conexión de un pool (init.sql
+    define el esquema). Búsqueda, P&L cambiario y serie de patrimonio se resuelven en una
+    sola consulta.
+
+    Con dsn_lectura, las herramientas de solo lectura (repositorio.solo_lectura) usan un pool
+    aparte contra esa réplica. Para leer lo propio, cada commit con escrituras guarda la
+    posición de WAL del primario y la réplica solo se usa cuando ya la reprodujo.
+    """
+
+    nombre = "postgres"
+
+    def __init__(self, dsn: Optional[str] = None, dsn_lectura: Optional[str] = None):
+        super().__init__()
+        self.dsn = dsn or DSN_POR_DEFECTO
+        self._escucha = None
+        self._fin_escucha = threading.Event()
+        self._pool = _Pool(MAX_CONEXIONES, self.dsn)
+        self.dsn_lectura = dsn_lectura
+        self._pool_lectura = (_Pool(MAX_CONEXIONES_LECTURA, dsn_lectura)
+                              if dsn_lectura else None)
+        self._bloqueo_lsn = threading.Lock()
+        # Última escritura que debe verse al leer y última posición que se sabe reproducida en la réplica
+        self._lsn_escrito = 0
+        self._lsn_replica = 0
+        self._lecturas = {"replica": 0, "primario_por_atraso": 0, "primario_sin_conexion": 0}
+
+    def _abrir(self):
+        if self._pool_lectura is not None and lectura_replica.get():
+            conexion = self._abrir_replica()
+            if conexion is not None:
+                return conexion
+        return self._abrir_primario()
+
+    def _abrir_primario(self):
+        """
+        Conexión del pool del primario; si está agotado (o la del pool ya no sirve), una
+        suelta que se cierra al terminar. Con una herramienta en curso, lo que le queda de
+        plazo pasa a statement_timeout y lock_timeout con SET LOCAL (vale solo para esta
+        transacción), y un temporizador cancela la consulta al vencer el plazo
+        (statement_timeout acota cada consulta; el temporizador, la transacción).
+        """
+        restante_ms = plazos.restante_ms()
+        if restante_ms is not None:
+            plazos.verificar()
+        conexion = None
+        try:
+            conexion = self._pool.getconn()
+            if restante_ms is not None:
+                cur = conexion.cursor()
+                cur.execute("SET LOCAL statement_timeout = %s; SET LOCAL lock_timeout = %s;",
+                            (restante_ms, restante_ms))
+                cur.close()
+            self._local.pool = self._pool
+        except psycopg2.Error:
+            if conexion is not None:
+                self._pool.putconn(conexion, close=True)
+            conexion = self._conectar(restante_ms)
+        if restante_ms is not None:
+            self._vigilar(conexion, restante_ms)
+        return conexion
+
+    def _conectar(self, restante_ms: Optional[int]):
+        """Conexión fuera del pool, con el plazo como opciones de la sesión."""
+        if restante_ms is None:
+            return psycopg2.connect(self.dsn)
+        try:
+            return psycopg2.connect(
+                self.dsn,
+                connect_timeout=max(2, -(-restante_ms // 1000)),
+                options=f"-c statement_timeout={restante_ms} -c lock_timeout={restante_ms}"
+            )
+        except psycopg2.OperationalError as e:
+            if plazos.restante() <= 0:
+                plazos.vencer(e)
+            raise
+
+    def _abrir_replica(self):
+        """
+        Conexión del pool de la réplica, o None si hay que leer del primario: pool agotado,
+        réplica caída o atrasada respecto de la última escritura. Las conexiones del pool se
+        reutilizan, así que el plazo se aplica con SET LOCAL (vale solo para esta transacción).
+        """
+        plazos.verificar()
+        try:
+            conexion = self._pool_lectura.getconn()
+        except (psycopg2.pool.PoolError, psycopg2.OperationalError):
+            self._contar_lectura("primario_sin_conexion")
+            return None
+        try:
+            conexion.set_session(readonly=True)
+            cur = conexion.cursor()
+            restante_ms = plazos.restante_ms()
+            if restante_ms is not None:
+                cur.execute("SET LOCAL statement_timeout = %s; SET LOCAL lock_timeout = %s;",
+                            (restante_ms, restante_ms))
+            al_dia = self._replica_al_dia(cur)
+            cur.close()
+        except psycopg2.Error:
+            self._pool_lectura.putconn(conexion, close=True)
+            self._contar_lectura("primario_sin_conexion")
+            return None
+        if not al_dia:
+            conexion.rollback()
+            self._pool_lectura.putconn(conexion)
+            self._contar_lectura("primario_por_atraso")
+            return None
+        self._contar_lectura("replica")
+        self._local.pool = self._pool_lectura
+        if restante_ms is not None:
+            self._vigilar(conexion, restante_ms)
+        return conexion
+
+    def _vigilar(self, conexion, restante_ms: int) -> None:
+        """Cancela la consulta en curso si la transacción sigue abierta al vencer el plazo."""
+        self._local.vigilante = threading.Timer(restante_ms / 1000, conexion.cancel)
+        self._local.vigilante.daemon = True
+        self._local.vigilante.start()
+
+    def _cerrar(self, conexion, confirmar: bool) -> None:
+        vigilante = getattr(self._local, "vigilante", None)
+        if vigilante is not None:
+            vigilante.cancel()
+            self._local.vigilante = None
+        pool, self._local.pool = getattr(self._local, "pool", None), None
+        escritura, self._local.escritura = getattr(self._local, "escritura", False), False
+        sana = False
+        try:
+            if confirmar:
+                conexion.commit()
+                if escritura and self._pool_lectura is not None:
+                    self._registrar_escritura(conexion)
+            else:
+                conexion.rollback()
+            sana = True
+        finally:
+            if pool is None:
+                conexion.close()
+            else:
+                pool.putconn(conexion, close=not sana or bool(conexion.closed))
+
+    # ---------------- Réplica de lectura ---------------- #
+
+    def _registrar_escritura(self, conexion) -> None:
+        """Después del commit: las lecturas siguientes tienen que ver al menos esta posición de WAL."""
+        cur = conexion.cursor()
+        cur.execute("SELECT pg_current_wal_lsn()::text;")
+        self._exigir_lsn(_lsn(cur.fetchone()[0]))
+        cur.close()
+
+    def _exigir_lsn(self, lsn: int) -> None:
+        with self._bloqueo_lsn:
+            self._lsn_escrito = max(self._lsn_escrito, lsn)
+
+    def _replica_al_dia(self, cur) -> bool:
+        """True si la réplica ya reprodujo la última escritura conocida (solo consulta si hace falta)."""
+        with self._bloqueo_lsn:
+            objetivo = self._lsn_escrito
+            if objetivo <= self._lsn_replica:
+                return True
+        cur.execute("SELECT pg_last_wal_replay_lsn()::text;")
+        reproducido = cur.fetchone()[0]
+        # NULL: el servidor no es un standby (la "réplica" es el mismo primario)
+        lsn = objetivo if reproducido is None else _lsn(reproducido)
+        with self._bloqueo_lsn:
+            self._lsn_replica = max(self._lsn_replica, lsn)
+        return lsn >= objetivo
+
+    def _contar_lectura(self, destino: str) -> None:
+        with self._bloqueo_lsn:
+            self._lecturas[destino] += 1
+
+    def estadisticas_lectura(self) -> Optional[dict]:
+        if self._pool_lectura is None:
+            return None
+        with self._bloqueo_lsn:
+            return {**self._lecturas, "atrasada": self._lsn_replica < self._lsn_escrito}
+
+    def _nuevo_cursor(self, conexion):
+        return conexion.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
+    def _inicio_mes(self, expr: str) -> str:
+        return f"date_trunc('month', {expr}::date)::date"
+
+    def _fecha_de(self, expr: str) -> str:
+        return f"{expr}::date"
+
+    def _digesto(self, expr: str) -> str:
+        return f"('x' || substr(md5({expr}), 1, 12))::bit(48)::bigint"
+
+    def _bloquear_tabla(self, tabla: str) -> None:
+        self._ejecutar(f"LOCK TABLE {tabla} IN EXCLUSIVE MODE;")
+
+    # ---------------- Coherencia de cachés entre réplicas ---------------- #
+
+    def _publicar_cambios(self, tablas: set) -> None:
+        # La transacción escribió: después del commit se registra su posición de WAL
+        self._local.escritura = True
+        # NOTIFY es transaccional: se entrega con el commit y se descarta con un rollback
+        self._ejecutar("SELECT pg_notify(%s, %s);", (CANAL_CAMBIOS, f"{self.id_replica}|{','.join(sorted(tablas))}"))
+
+    def iniciar_escucha(self) -> None:
+        """
+        Hilo con una conexión dedicada en LISTEN. Mientras está conectado, las lecturas se
+        cachean y cada aviso de otra réplica vacía las cachés de las tablas que cambió.
+        Si la conexión se pierde, la caché se apaga (podrían perderse avisos) hasta reconectar.
+        """
+        if self._escucha is None:
+            self._escucha = threading.Thread(target=self._escuchar, name="escucha-cambios", daemon=True)
+            self._escucha.start()
+
+    def detener_escucha(self, timeout: float = 5.0) -> None:
+        self._fin_escucha.set()
+        if self._escucha is not None:
+            self._escucha.join(timeout)
+            self._escucha = None
+
+    def _escuchar(self) -> None:
+        espera = 1
+        while not self._fin_escucha.is_set():
+            conexion = None
+            try:
+                conexion = psycopg2.connect(self.dsn, keepalives=1, keepalives_idle=30,
+                                            keepalives_interval=10, keepalives_count=3)
+                conexion.autocommit = True
+                cur = conexion.cursor()
+                cur.execute(f"LISTEN {CANAL_CAMBIOS};")
+                # Desde acá no se pierde ningún aviso: se arranca con la caché vacía
+                cache.invalidar_todo()
+                self.usar_cache = True
+                espera = 1
+                while not self._fin_escucha.is_set():
+                    if select.select([conexion], [], [], 1.0) == ([], [], []):
+                        continue
+                    conexion.poll()
+                    avisos = [n.payload for n in conexion.notifies]
+                    conexion.notifies.clear()
+                    ajenos = [p for p in avisos if p.partition("|")[0] != self.id_replica]
+                    if ajenos and self._pool_lectura is not None:
+                        # Antes de invalidar: una relectura no puede venir de una réplica
+                        # que todavía no tiene el cambio (quedaría en caché)
+                        cur.execute("SELECT pg_current_wal_lsn()::text;")
+                        self._exigir_lsn(_lsn(cur.fetchone()[0]))
+                    for payload in ajenos:
+                        self._recibir_cambio(payload)
+            except Exception as e:
+                log.error("Escucha de cambios interrumpida: %s: %s", type(e).__name__, e)
+            finally:
+                self.usar_cache = False
+                cache.invalidar_todo()
+                if conexion is not None:
+                    conexion.close()
+            self._fin_escucha.wait(espera)
+            espera = min(espera * 2, 30)
+
+    def _recibir_cambio(self, payload: str) -> None:
+        origen, _, tablas = payload.partition("|")
+        # Los cambios propios ya se invalidaron al hacer commit
+        if origen != self.id_replica and tablas:
+            cache.invalidar(tablas.split(","))
+
+    def _es_timeout(self, error: Exception) -> bool:
+        return isinstance(error, (psycopg2.extensions.QueryCanceledError, psycopg2.errors.LockNotAvailable))
+
+    def _plan_consulta(self, conexion, sql: str, params, duracion_ms: float):
+        """
+        Plan en formato JSON. ANALYZE vuelve a ejecutar la consulta, así que se usa solo con
+        lecturas puras y si al plazo le queda más que lo que tardó la consulta; las escrituras
+        (y las lecturas sin margen) llevan EXPLAIN simple, que no ejecuta nada. Corre dentro
+        de un savepoint para que un error no deje abortada la transacción del llamador.
+        """
+        texto = sql.lstrip().upper()
+        if not texto.startswith(("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")):
+            return None
+        restante_ms = plazos.restante_ms()
+        analizar = (texto.startswith(("SELECT", "WITH")) and not _ESCRIBE.search(texto)
+                    and (restante_ms is None or restante_ms > duracion_ms))
+        opciones = "ANALYZE, BUFFERS, FORMAT JSON" if analizar else "FORMAT JSON"
+        cur = conexion.cursor()
+        try:
+            cur.execute("SAVEPOINT plan_consulta;")
+            try:
+                cur.execute(f"EXPLAIN ({opciones}) {sql}", params)
+                return cur.fetchone()[0]
+            finally:
+                cur.execute("ROLLBACK TO SAVEPOINT plan_consulta;")
+        finally:
+            cur.close()
+
+    def buscar(self, consulta: str, origenes: list, limite: int, desplazamiento: int) -> tuple:
+        """Texto completo en español + trigramas, ordenado por relevancia y paginado en la base."""
+        if "historial_saldo" in origenes:
+            self._sincronizar_historial()
+        filas = self._filas(
+            f"""
+            SELECT *, COUNT(*) OVER () AS total_resultados
+            FROM ({" UNION ALL ".join(FUENTES_BUSQUEDA[o] for o in origenes)}) resultados
+            ORDER BY relevancia DESC, fecha DESC
+            LIMIT %(limite)s OFFSET %(desplazamiento)s;
+            """,
+            {"q": consulta, "limite": limite, "desplazamiento": desplazamiento}
+        )
+        total = filas[0]["total_resultados"] if filas else 0
+        for fila in filas:
+            del fila["total_resultados"]
+        return filas, total
+
+    def pnl_cambiario(self, columnas_grupo: list, estado: str, tasas_hoy: dict) -> tuple:
+        """Todo el cálculo se hace en una sola consulta sobre el libro completo."""
+        grupo_sql = ", ".join(columnas_grupo)
+        with self.transaccion():
+            filas = self._ejecutar_crudo(
+                f"""
+                WITH tasas_hoy AS (
+                    SELECT * FROM unnest(%s::text[], %s::numeric[]) AS t(moneda, tasa)
+                ),
+                base AS (
+                    SELECT p.id, p.persona, p.moneda, p.estado, p.monto_total, p.monto_en_mano,
+                           p.cotizacion_momento AS tasa_origen,
+                           CASE WHEN p.estado = 'finalizado' THEN p.cotizacion_finalizacion
+                                ELSE t.tasa END AS tasa_cierre
+                    FROM prestamos p
+                    LEFT JOIN tasas_hoy t ON t.moneda = p.moneda
+                    WHERE %s = 'todos' OR p.estado = %s
+                )
+                SELECT {grupo_sql},
+                       COUNT(*) AS cantidad,
+                       SUM(monto_total * tasa_origen) AS prestado_usd_origen,
+                       SUM(monto_total * tasa_cierre) AS prestado_usd_cierre,
+                       SUM(monto_total * (tasa_cierre - tasa_origen))
+                           FILTER (WHERE estado = 'finalizado') AS pnl_realizado_usd,
+                       SUM(monto_total * (tasa_cierre - tasa_origen))
+                           FILTER (WHERE estado = 'activo') AS pnl_no_realizado_usd,
+                       SUM(monto_en_mano * tasa_cierre) AS ganancia_intereses_usd
+                FROM base
+                WHERE tasa_origen IS NOT NULL AND tasa_cierre IS NOT NULL
+                GROUP BY {grupo_sql}
+                ORDER BY {grupo_sql};
+                """,
+                (list(tasas_hoy.keys()), list(tasas_hoy.values()), estado, estado)
+            )
+            # Préstamos que no pueden valuarse (sin cotización de origen o de cierre)
+            sin_cotizacion = self._fila(
+                """
+                SELECT COUNT(*) AS cantidad FROM prestamos
+                WHERE (%s = 'todos' OR estado = %s)
+                  AND (cotizacion_momento IS NULL
+                       OR (estado = 'finalizado' AND cotizacion_finalizacion IS NULL)
+                       OR (estado = 'activo' AND NOT moneda = ANY(%s::text[])));
+                """,
+                (estado, estado, list(tasas_hoy.keys()))
+            )["cantidad"]
+
+        return [
+            [round(float(v), 2) if isinstance(v, decimal.Decimal) else (0 if v is None else v) for v in fila]
+            for fila in filas
+        ], sin_cotizacion
+
+    def serie_patrimonio(self, desde, intervalo: str) -> list:
+        filas = self._ejecutar_crudo(
+            """
+            WITH puntos AS (
+                SELECT d::date AS fecha
+                FROM generate_series(%s::date, CURRENT_DATE, %s::interval) d
+                UNION
+                SELECT CURRENT_DATE
+            ),
+            monedas AS (
+                SELECT DISTINCT moneda FROM saldo_diario
+            ),
+            valuado AS (
+                SELECT p.fecha, m.moneda, COALESCE(s.saldo_cierre, 0) AS saldo,
+                       CASE WHEN m.moneda = 'USD' THEN 1
+                            ELSE COALESCE(h.tasa, actual.tasa) END AS tasa
+                FROM puntos p
+                CROSS JOIN monedas m
+                LEFT JOIN LATERAL (
+                    SELECT saldo_cierre FROM saldo_diario sd
+                    WHERE sd.moneda = m.moneda AND sd.fecha <= p.fecha
+                    ORDER BY sd.fecha DESC LIMIT 1
+                ) s ON TRUE
+                LEFT JOIN LATERAL (
+                    SELECT tasa FROM tasas_cambio_historial th
+                    WHERE th.moneda_origen = m.moneda AND th.moneda_destino = 'USD'
+                      AND th.fecha <= p.fecha
+                    ORDER BY th.fecha DESC LIMIT 1
+                ) h ON TRUE
+                LEFT JOIN tasas_cambio actual
+                    ON actual.moneda_origen = m.moneda AND actual.moneda_destino = 'USD'
+            ),
+            serie AS (
+                SELECT fecha,
+                       SUM(saldo * tasa) AS patrimonio_usd,
+                       MAX(1 / NULLIF(tasa, 0)) FILTER (WHERE moneda = 'ARS') AS ars_por_usd,
+                       COUNT(*) FILTER (WHERE tasa IS NULL AND saldo <> 0) AS monedas_sin_tasa
+                FROM valuado
+                GROUP BY fecha
+            )
+            SELECT fecha, patrimonio_usd, patrimonio_usd * ars_por_usd AS patrimonio_ars,
+                   patrimonio_usd - LAG(patrimonio_usd) OVER (ORDER BY fecha) AS variacion_usd,
+                   monedas_sin_tasa
+            FROM serie
+            ORDER BY fecha;
+            """,
+            (desde, INTERVALOS_SQL[intervalo])
+        )
+        return [
+            [fecha.isoformat()] + [float(v) if v is not None else None for v in valores] + [sin_tasa]
+            for fecha, *valores, sin_tasa in filas
+        ]
+
+    def _ejecutar_crudo(self, sql: str, params=None) -> list:
+        """Ejecuta una consulta y devuelve las filas como tuplas (en el orden de las columnas)."""
+        with self.transaccion():
+            plazos.verificar()
+            conexion = self._local.conexion
+            cur = CursorInstrumentado(conexion.cursor(), self, conexion)
+            try:
+                cur.execute(sql, params)
+                return cur.fetchall()
+            except Exception as e:
+                if self._es_timeout(e):
+                    plazos.vencer(e)
+                raise
+            finally:
+                cur.close()
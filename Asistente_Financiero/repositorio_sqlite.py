@@ -0,0 +1,315 @@
+# Backend embebido del repositorio (SQLite): modo local de un solo usuario, pruebas y benchmarks
+import datetime
+import decimal
+import hashlib
+import sqlite3
+import threading
+from typing import Optional
+
+from . import plazos
+from .repositorio import RepositorioFinanzas
+
+# Mismo esquema que init.sql, sin índices de texto (la búsqueda usa la versión portable)
+ESQUEMA = """
+PRAGMA foreign_keys = ON;
+
+CREATE TABLE IF NOT EXISTS transacciones (
+    id INTEGER PRIMARY KEY,
+    tipo VARCHAR(20) NOT NULL,
+    monto NUMERIC(12,2) NOT NULL,
+    fecha DATE NOT NULL,
+    descripcion TEXT,
+    contraparte VARCHAR(100),
+    categoria VARCHAR(50),
+    created_at TIMESTAMP DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS tasas_cambio (
+    id INTEGER PRIMARY KEY,
+    moneda_origen VARCHAR(10) NOT NULL,
+    moneda_destino VARCHAR(10) NOT NULL,
+    tasa NUMERIC(18,8) NOT NULL,
+    fecha_actualizacion TIMESTAMP DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime')),
+    UNIQUE (moneda_origen, moneda_destino)
+);
+
+CREATE TABLE IF NOT EXISTS prestamos (
+    id INTEGER PRIMARY KEY,
+    monto_total NUMERIC(14,2) NOT NULL,
+    moneda VARCHAR(10) NOT NULL,
+    persona VARCHAR(100) NOT NULL,
+    porcentaje_interes NUMERIC(6,2) DEFAULT 0,
+    tiene_intermediario BOOLEAN DEFAULT FALSE,
+    porcentaje_intermediario NUMERIC(6,2) DEFAULT 0,
+    monto_intermediario NUMERIC(14,2) DEFAULT 0,
+    monto_en_mano NUMERIC(14,2) DEFAULT 0,
+    fecha_prestamo DATE NOT NULL,
+    cotizacion_momento NUMERIC(18,8),
+    descripcion TEXT,
+    estado VARCHAR(20) DEFAULT 'activo',
+    created_at TIMESTAMP DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime')),
+    fecha_finalizacion DATE,
+    cotizacion_finalizacion NUMERIC(18,8),
+    saldo_pendiente NUMERIC(14,2),
+    ganancia_cobrada NUMERIC(14,2) NOT NULL DEFAULT 0,
+    monto_cobrado NUMERIC(14,2) NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS saldo_actual (
+    id INTEGER PRIMARY KEY,
+    monto NUMERIC(14,2) NOT NULL,
+    moneda VARCHAR(10) NOT NULL,
+    descripcion TEXT,
+    categoria VARCHAR(50),
+    updated_at TIMESTAMP DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS historial_saldo (
+    id INTEGER PRIMARY KEY,
+    tipo_operacion VARCHAR(50),
+    monto_operacion NUMERIC(14,2),
+    saldo_anterior NUMERIC(14,2),
+    saldo_nuevo NUMERIC(14,2),
+    descripcion TEXT,
+    fecha_operacion TIMESTAMP DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime')),
+    saldo_id INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS tasas_cambio_historial (
+    moneda_origen VARCHAR(10) NOT NULL,
+    moneda_destino VARCHAR(10) NOT NULL,
+    fecha DATE NOT NULL,
+    tasa NUMERIC(18,8) NOT NULL,
+    PRIMARY KEY (moneda_origen, moneda_destino, fecha)
+);
+
+CREATE TABLE IF NOT EXISTS saldo_diario (
+    moneda VARCHAR(10) NOT NULL,
+    fecha DATE NOT NULL,
+    movimiento NUMERIC(16,2) NOT NULL DEFAULT 0,
+    saldo_cierre NUMERIC(16,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (moneda, fecha)
+);
+
+CREATE TABLE IF NOT EXISTS transacciones_mensual (
+    mes DATE NOT NULL,
+    tipo VARCHAR(20) NOT NULL,
+    contraparte VARCHAR(100) NOT NULL DEFAULT '',
+    cantidad INTEGER NOT NULL DEFAULT 0,
+    total NUMERIC(16,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (mes, tipo, contraparte)
+);
+
+CREATE TABLE IF NOT EXISTS contrapartes (
+    clave VARCHAR(100) PRIMARY KEY,
+    nombre VARCHAR(100) NOT NULL,
+    created_at TIMESTAMP DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS exposicion_contraparte (
+    clave VARCHAR(100) NOT NULL REFERENCES contrapartes (clave),
+    moneda VARCHAR(10) NOT NULL,
+    prestamos_activos INTEGER NOT NULL DEFAULT 0,
+    monto_activo NUMERIC(16,2) NOT NULL DEFAULT 0,
+    intereses_pendientes NUMERIC(16,2) NOT NULL DEFAULT 0,
+    ganancia_pendiente NUMERIC(16,2) NOT NULL DEFAULT 0,
+    prestamos_totales INTEGER NOT NULL DEFAULT 0,
+    monto_historico NUMERIC(16,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (clave, moneda)
+);
+
+CREATE INDEX IF NOT EXISTS idx_prestamos_persona
+    ON prestamos (lower(trim(persona)), fecha_prestamo DESC);
+CREATE INDEX IF NOT EXISTS idx_transacciones_contraparte
+    ON transacciones (lower(trim(contraparte)), fecha DESC);
+
+CREATE TABLE IF NOT EXISTS pagos_prestamo (
+    id INTEGER PRIMARY KEY,
+    prestamo_id INTEGER NOT NULL REFERENCES prestamos (id),
+    monto NUMERIC(14,2) NOT NULL,
+    fecha_pago DATE NOT NULL,
+    ganancia NUMERIC(14,2) NOT NULL DEFAULT 0,
+    descripcion TEXT,
+    created_at TIMESTAMP DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_pagos_prestamo_prestamo ON pagos_prestamo (prestamo_id, fecha_pago);
+
+CREATE TABLE IF NOT EXISTS reglas_recurrentes (
+    id INTEGER PRIMARY KEY,
+    tipo VARCHAR(20) NOT NULL,
+    monto NUMERIC(14,2) NOT NULL,
+    moneda VARCHAR(10) NOT NULL,
+    descripcion TEXT NOT NULL,
+    frecuencia VARCHAR(10) NOT NULL DEFAULT 'mensual',
+    dia INTEGER NOT NULL,
+    proxima_fecha DATE NOT NULL,
+    ultima_aplicacion DATE,
+    aplicaciones INTEGER NOT NULL DEFAULT 0,
+    activa BOOLEAN NOT NULL DEFAULT 1,
+    created_at TIMESTAMP DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_reglas_recurrentes_vencidas ON reglas_recurrentes (proxima_fecha) WHERE activa;
+
+CREATE TABLE IF NOT EXISTS estadisticas_categoria (
+    categoria VARCHAR(50) PRIMARY KEY,
+    cantidad INTEGER NOT NULL DEFAULT 0,
+    media_usd REAL NOT NULL DEFAULT 0,
+    m2_usd REAL NOT NULL DEFAULT 0,
+    maximo_usd NUMERIC(14,2) NOT NULL DEFAULT 0,
+    ultimo_gasto TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS gasto_categoria_diario (
+    categoria VARCHAR(50) NOT NULL,
+    fecha DATE NOT NULL,
+    cantidad INTEGER NOT NULL DEFAULT 0,
+    total_usd NUMERIC(16,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (categoria, fecha)
+);
+
+CREATE TABLE IF NOT EXISTS presupuestos_categoria (
+    categoria VARCHAR(50) PRIMARY KEY,
+    limite_usd NUMERIC(14,2) NOT NULL,
+    periodo VARCHAR(10) NOT NULL DEFAULT 'mensual',
+    updated_at TIMESTAMP DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_transacciones_fecha ON transacciones (fecha);
+CREATE INDEX IF NOT EXISTS idx_saldo_actual_updated_at ON saldo_actual (updated_at);
+
+CREATE TABLE IF NOT EXISTS reglas_categoria (
+    id INTEGER PRIMARY KEY,
+    patron VARCHAR(100) NOT NULL UNIQUE,
+    categoria VARCHAR(50) NOT NULL,
+    created_at TIMESTAMP DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS bloques_control (
+    tabla VARCHAR(30) NOT NULL,
+    bloque INTEGER NOT NULL,
+    filas INTEGER NOT NULL DEFAULT 0,
+    digesto INTEGER NOT NULL DEFAULT 0,
+    vinculo INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime')),
+    PRIMARY KEY (tabla, bloque)
+);
+"""
+
+# Columnas agregadas a tablas existentes: un archivo creado antes no las tiene
+COLUMNAS_AGREGADAS = (
+    ("transacciones", "categoria", "VARCHAR(50)"),
+    ("saldo_actual", "categoria", "VARCHAR(50)"),
+    ("historial_saldo", "saldo_id", "INTEGER"),
+)
+
+# Índices sobre columnas agregadas: se crean después de agregarlas
+INDICES_AGREGADOS = (
+    "CREATE INDEX IF NOT EXISTS idx_historial_saldo_saldo_id ON historial_saldo (saldo_id);",
+)
+
+
+def _digesto(texto: Optional[str]) -> Optional[int]:
+    """Primeros 48 bits del MD5 del texto (lo mismo que calcula Postgres en _digesto); NULL si es NULL."""
+    if texto is None:
+        return None
+    return int(hashlib.md5(texto.encode("utf-8")).hexdigest()[:12], 16)
+
+
+class RepositorioSQLite(RepositorioFinanzas):
+    """
+    Repositorio embebido sin servidor. Usa una sola conexión (una base en memoria vive
+    lo que vive su conexión) y un candado que serializa las transacciones entre hilos.
+    BEGIN IMMEDIATE toma el bloqueo de escritura al empezar, así que no hace falta FOR UPDATE.
+    """
+
+    nombre = "sqlite"
+
+    AHORA = "strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime')"
+    HOY = "date('now', 'localtime')"
+    PARA_ACTUALIZAR = ""
+    CONEXION_UNICA = True
+
+    def __init__(self, ruta: str = ":memory:"):
+        super().__init__()
+        self.ruta = ruta
+        self._bloqueo = threading.RLock()
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self._conexion.row_factory = sqlite3.Row
+        self._conexion.executescript(ESQUEMA)
+        for tabla, columna, tipo in COLUMNAS_AGREGADAS:
+            columnas = [c["name"] for c in self._conexion.execute(f"PRAGMA table_info({tabla});")]
+            if columna not in columnas:
+                self._conexion.execute(f"ALTER TABLE {tabla} ADD COLUMN {columna} {tipo};")
+        for indice in INDICES_AGREGADOS:
+            self._conexion.execute(indice)
+        self._conexion.create_function("digesto", 1, _digesto, deterministic=True)
+
+    def _abrir(self):
+        # Con plazo: la espera del candado y cada consulta quedan acotadas a lo que queda
+        plazo = plazos.plazo_actual.get()
+        if plazo is None:
+            self._bloqueo.acquire()
+        elif not self._bloqueo.acquire(timeout=max(0.0, plazo.restante())):
+            plazos.vencer()
+        try:
+            self._conexion.execute("BEGIN IMMEDIATE;")
+            if plazo is not None:
+                # El manejador de progreso interrumpe la consulta en curso al vencer el plazo
+                self._conexion.set_progress_handler(lambda: plazo.restante() <= 0, 10000)
+        except Exception:
+            self._bloqueo.release()
+            raise
+        return self._conexion
+
+    def _cerrar(self, conexion, confirmar: bool) -> None:
+        try:
+            # El commit/rollback no se interrumpe (dejaría la transacción abierta)
+            conexion.set_progress_handler(None, 0)
+            conexion.execute("COMMIT;" if confirmar else "ROLLBACK;")
+        finally:
+            self._bloqueo.release()
+
+    def _nuevo_cursor(self, conexion):
+        return conexion.cursor()
+
+    def iniciar_escucha(self) -> None:
+        # En memoria no hay otros procesos: invalidar localmente alcanza. Un archivo puede
+        # compartirse con otros procesos que no avisan, así que ahí no se cachea.
+        self.usar_cache = self.ruta == ":memory:"
+
+    def _es_timeout(self, error: Exception) -> bool:
+        return isinstance(error, sqlite3.OperationalError) and "interrupted" in str(error)
+
+    def _plan_consulta(self, conexion, sql: str, params, duracion_ms: float):
+        """EXPLAIN QUERY PLAN (SQLite no tiene ANALYZE por consulta): una línea por paso."""
+        return [fila["detail"] for fila in conexion.execute(f"EXPLAIN QUERY PLAN {sql}", params or ()).fetchall()]
+
+    def _sql(self, sql: str) -> str:
+        return sql.replace("%s", "?")
+
+    def _parametros(self, params):
+        # sqlite3 no adapta Decimal ni (sin advertencias) fechas
+        def adaptar(valor):
+            if isinstance(valor, decimal.Decimal):
+                return float(valor)
+            if isinstance(valor, (datetime.date, datetime.datetime)):
+                return valor.isoformat()
+            return valor
+        return tuple(adaptar(v) for v in params) if params else ()
+
+    def _inicio_mes(self, expr: str) -> str:
+        return f"date({expr}, 'start of month')"
+
+    def _fecha_de(self, expr: str) -> str:
+        return f"date({expr})"
+
+    def _digesto(self, expr: str) -> str:
+        return f"digesto({expr})"
+
+    def cerrar(self) -> None:
+        """Escribe el historial pendiente y cierra la conexión (en memoria, descarta los datos)."""
+        if self.escritor_historial is not None:
+            self.escritor_historial.cerrar()
+        self._conexion.close()
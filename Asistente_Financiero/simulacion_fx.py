@@ -0,0 +1,94 @@
+# Simulación Monte Carlo de escenarios de tipo de cambio ARS/USD
+import functools
+import numpy as np
+
+from . import cache, plazos
+
+# Percentiles que se reportan en cada distribución
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Cantidad de simulaciones por bloque (limita la memoria de la matriz de caminos)
+TAMANO_BLOQUE = 10000
+
+DIAS_POR_ANIO = 365
+
+
+def _resumen(valores: np.ndarray) -> dict:
+    """Resume una distribución con media, desvío y percentiles."""
+    percentiles = np.percentile(valores, PERCENTILES)
+    resumen = {f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, percentiles)}
+    resumen["media"] = round(float(valores.mean()), 2)
+    resumen["desvio"] = round(float(valores.std()), 2)
+    return resumen
+
+
+@functools.lru_cache(maxsize=32)
+def simular_escenarios_fx(usd_fijo: float, ars: float, ars_por_usd: float,
+                          horizonte_dias: int, n_simulaciones: int,
+                          devaluacion_anual: float, volatilidad_anual: float,
+                          semilla: int) -> dict:
+    """
+    Simula caminos diarios del tipo de cambio ARS/USD (movimiento browniano geométrico)
+    y valúa la posición neta al final del horizonte.
+
+    La caché se indexa por los argumentos: como la posición (usd_fijo, ars) es la foto
+    agregada de préstamos y saldos, cualquier cambio en los datos genera otra clave.
+
+    Args:
+        usd_fijo (float): posición expresada en USD (USD y otras monedas ya convertidas)
+        ars (float): posición en ARS
+        ars_por_usd (float): cotización inicial (cuántos ARS vale 1 USD)
+        horizonte_dias (int): días a simular
+        n_simulaciones (int): cantidad de caminos
+        devaluacion_anual (float): deriva anual esperada del ARS/USD (0.3 = 30%)
+        volatilidad_anual (float): volatilidad anual del ARS/USD
+        semilla (int): semilla del generador para resultados reproducibles
+    """
+    rng = np.random.default_rng(semilla)
+    dt = 1.0 / DIAS_POR_ANIO
+    mu = np.log1p(devaluacion_anual)
+    deriva = (mu - 0.5 * volatilidad_anual ** 2) * dt
+    difusion = volatilidad_anual * np.sqrt(dt)
+
+    log_final = np.empty(n_simulaciones)
+    log_max = np.empty(n_simulaciones)
+    log_min = np.empty(n_simulaciones)
+
+    # Se procesa por bloques: cada bloque es una matriz (simulaciones x días)
+    for inicio in range(0, n_simulaciones, TAMANO_BLOQUE):
+        plazos.verificar()
+        fin = min(inicio + TAMANO_BLOQUE, n_simulaciones)
+        pasos = rng.standard_normal((fin - inicio, horizonte_dias))
+        pasos *= difusion
+        pasos += deriva
+        caminos = np.cumsum(pasos, axis=1)
+        log_final[inicio:fin] = caminos[:, -1]
+        log_max[inicio:fin] = np.maximum(caminos.max(axis=1), 0.0)
+        log_min[inicio:fin] = np.minimum(caminos.min(axis=1), 0.0)
+
+    cotizacion_final = ars_por_usd * np.exp(log_final)
+    patrimonio_usd = usd_fijo + ars / cotizacion_final
+    patrimonio_ars = usd_fijo * cotizacion_final + ars
+
+    # Peor valor en USD a lo largo del camino: con ARS positivos ocurre en el
+    # máximo del tipo de cambio, con ARS negativos en el mínimo
+    peor_log = log_max if ars >= 0 else log_min
+    peor_usd = usd_fijo + ars / (ars_por_usd * np.exp(peor_log))
+
+    patrimonio_inicial_usd = usd_fijo + ars / ars_por_usd
+
+    return {
+        "patrimonio_inicial_usd": round(patrimonio_inicial_usd, 2),
+        "patrimonio_inicial_ars": round(usd_fijo * ars_por_usd + ars, 2),
+        "cotizacion_final_ars_por_usd": _resumen(cotizacion_final),
+        "patrimonio_final_usd": _resumen(patrimonio_usd),
+        "patrimonio_final_ars": _resumen(patrimonio_ars),
+        "peor_patrimonio_usd_en_camino": _resumen(peor_usd),
+        "probabilidad_perdida_usd": round(float((patrimonio_usd < patrimonio_inicial_usd).mean()), 4),
+    }
+
+
+# Sin tablas: la clave ya incluye la posición, así que no hace falta invalidarla; se registra
+# para que aparezca en las estadísticas de cachés
+cache.registrar("simulacion_fx", (), simular_escenarios_fx.cache_clear,
+                lambda: simular_escenarios_fx.cache_info()._asdict())
@@ -1,4 +1,5 @@
 from google.adk.agents import Agent
+from google.adk.tools.tool_context import ToolContext
 import random
 import json
 import os
@@ -10,6 +11,8 @@ import decimal
 import datetime
 import requests
 
+from .sesiones import AlmacenEstados
+
 # Configuración del juego (importada localmente para evitar problemas de dependencias)
 try:
     from .config import HIRAGANA_GAME_CONFIG, EXTENDED_DIFFICULTY
@@ -100,16 +103,8 @@ except Exception as e:
 # Lista de kanji disponibles para facilitar selección aleatoria
 KANJI_LIST = list(KANJI_N5_DICT.keys()) if KANJI_N5_DICT else []
 
-# Variables globales para el estado del juego
-game_state = {
-    'current_question': None,
-    'score': 0,
-    'total_questions': 0,
-    'current_mode': None,  # 'hiragana' o 'kanji'
-    'difficulty_level': 'basico',
-    'kanji_score': 0,
-    'kanji_total': 0
-}
+# Estado del juego de cada sesión (pregunta activa, puntaje, dificultad)
+estados = AlmacenEstados()
 
 # Niveles de dificultad expandidos desde config
 DIFFICULTY_LEVELS = {
@@ -122,20 +117,11 @@ DIFFICULTY_LEVELS = {
 
 # ---------------- TOOLS DEL JUEGO ---------------- #
 
-def start_hiragana_game() -> dict:
+def start_hiragana_game(tool_context: Optional[ToolContext] = None) -> dict:
     """
     Inicia el sistema de aprendizaje japonés mostrando todas las opciones disponibles.
     """
-    global game_state
-    game_state = {
-        'current_question': None,
-        'score': 0,
-        'total_questions': 0,
-        'current_mode': None,
-        'difficulty_level': 'basico',
-        'kanji_score': 0,
-        'kanji_total': 0
-    }
+    game_state = estados.reiniciar(tool_context)
     
     kanji_status = f"📚 **Kanji N5**: {len(KANJI_LIST)} disponibles" if KANJI_LIST else "⚠️ **Kanji**: No disponible"
     
@@ -173,14 +159,14 @@ def start_hiragana_game() -> dict:
         "game_state": game_state
     }
 
-def set_difficulty_level(level: str) -> dict:
+def set_difficulty_level(level: str, tool_context: Optional[ToolContext] = None) -> dict:
     """
     Configura el nivel de dificultad del juego.
     
     Args:
         level (str): 'principiante', 'basico', 'intermedio', 'avanzado' o 'maestro'
     """
-    global game_state
+    game_state = estados.obtener(tool_context)
     
     available_levels = list(DIFFICULTY_LEVELS.keys())
     if level.lower() not in DIFFICULTY_LEVELS:
@@ -219,11 +205,11 @@ def set_difficulty_level(level: str) -> dict:
         "sample_characters": characters[:10]
     }
 
-def generate_hiragana_question() -> dict:
+def generate_hiragana_question(tool_context: Optional[ToolContext] = None) -> dict:
     """
     Genera una pregunta donde el usuario debe adivinar el romaji de un hiragana.
     """
-    global game_state
+    game_state = estados.obtener(tool_context)
     
     characters = DIFFICULTY_LEVELS[game_state['difficulty_level']]
     hiragana_char = random.choice(characters)
@@ -247,11 +233,11 @@ def generate_hiragana_question() -> dict:
         }
     }
 
-def generate_romaji_question() -> dict:
+def generate_romaji_question(tool_context: Optional[ToolContext] = None) -> dict:
     """
     Genera una pregunta donde el usuario debe escribir el hiragana correspondiente al romaji.
     """
-    global game_state
+    game_state = estados.obtener(tool_context)
     
     characters = DIFFICULTY_LEVELS[game_state['difficulty_level']]
     hiragana_char = random.choice(characters)
@@ -275,14 +261,14 @@ def generate_romaji_question() -> dict:
         }
     }
 
-def check_answer(user_answer: str) -> dict:
+def check_answer(user_answer: str, tool_context: Optional[ToolContext] = None) -> dict:
     """
     Verifica la respuesta del usuario y proporciona feedback.
     
     Args:
         user_answer (str): La respuesta proporcionada por el usuario
     """
-    global game_state
+    game_state = estados.obtener(tool_context)
     
     if not game_state['current_question']:
         return {
@@ -351,11 +337,11 @@ def check_answer(user_answer: str) -> dict:
         "accuracy": accuracy
     }
 
-def get_game_stats() -> dict:
+def get_game_stats(tool_context: Optional[ToolContext] = None) -> dict:
     """
     Muestra las estadísticas actuales del juego.
     """
-    global game_state
+    game_state = estados.obtener(tool_context)
     
     if game_state['total_questions'] == 0:
         return {
@@ -436,14 +422,14 @@ def show_hiragana_table() -> dict:
         "total_characters": len(HIRAGANA_DICT)
     }
 
-def get_random_hiragana_set(count: int = 5) -> dict:
+def get_random_hiragana_set(count: int = 5, tool_context: Optional[ToolContext] = None) -> dict:
     """
     Genera un conjunto aleatorio de hiragana para práctica.
     
     Args:
         count (int): Número de caracteres a mostrar (por defecto 5)
     """
-    global game_state
+    game_state = estados.obtener(tool_context)
     
     if count > 20:
         count = 20
@@ -467,14 +453,14 @@ def get_random_hiragana_set(count: int = 5) -> dict:
         "characters": [{"hiragana": char, "romaji": HIRAGANA_DICT[char]} for char in selected_chars]
     }
 
-def generate_multiple_choice_question(question_type: str = "hiragana_to_romaji") -> dict:
+def generate_multiple_choice_question(question_type: str = "hiragana_to_romaji", tool_context: Optional[ToolContext] = None) -> dict:
     """
     Genera una pregunta de opción múltiple para facilitar el aprendizaje.
     
     Args:
         question_type (str): "hiragana_to_romaji" o "romaji_to_hiragana"
     """
-    global game_state
+    game_state = estados.obtener(tool_context)
     
     characters = DIFFICULTY_LEVELS[game_state['difficulty_level']]
     
@@ -565,14 +551,14 @@ def generate_multiple_choice_question(question_type: str = "hiragana_to_romaji")
         }
     }
 
-def check_multiple_choice_answer(option_number: str) -> dict:
+def check_multiple_choice_answer(option_number: str, tool_context: Optional[ToolContext] = None) -> dict:
     """
     Verifica la respuesta de opción múltiple del usuario.
     
     Args:
         option_number (str): Número de la opción seleccionada (1-4)
     """
-    global game_state
+    game_state = estados.obtener(tool_context)
     
     if not game_state['current_question'] or game_state['current_question'].get('type') != 'multiple_choice':
         return {
@@ -646,7 +632,7 @@ def check_multiple_choice_answer(option_number: str) -> dict:
             motivation_msg = "\n🎯 **No te desanimes!** Sigue usando opciones múltiples para familiarizarte."
     
     # Generar automáticamente la siguiente pregunta del mismo tipo
-    next_question_result = generate_multiple_choice_question(question['question_type'])
+    next_question_result = generate_multiple_choice_question(question['question_type'], tool_context)
     
     if next_question_result['status'] == 'success':
         next_question_text = f"\n\n🎯 **SIGUIENTE PREGUNTA:**\n\n{next_question_result['message']}"
@@ -669,7 +655,7 @@ def check_multiple_choice_answer(option_number: str) -> dict:
         "auto_generated_next": next_question_result['status'] == 'success'
     }
 
-def quick_answer(answer: str) -> dict:
+def quick_answer(answer: str, tool_context: Optional[ToolContext] = None) -> dict:
     """
     Función universal para responder tanto preguntas de opción múltiple como abiertas.
     Detecta automáticamente el tipo de pregunta activa y procesa la respuesta.
@@ -677,7 +663,7 @@ def quick_answer(answer: str) -> dict:
     Args:
         answer (str): La respuesta del usuario (número 1-4 para múltiple choice, texto para abiertas)
     """
-    global game_state
+    game_state = estados.obtener(tool_context)
     
     if not game_state['current_question']:
         return {
@@ -690,7 +676,7 @@ def quick_answer(answer: str) -> dict:
     if question_type == 'multiple_choice':
         # Es una pregunta de hiragana múltiple choice
         if answer.strip().isdigit() and 1 <= int(answer.strip()) <= 4:
-            return check_multiple_choice_answer(answer.strip())
+            return check_multiple_choice_answer(answer.strip(), tool_context)
         else:
             return {
                 "status": "error", 
@@ -699,7 +685,7 @@ def quick_answer(answer: str) -> dict:
     elif question_type == 'kanji_multiple_choice':
         # Es una pregunta de kanji múltiple choice
         if answer.strip().isdigit() and 1 <= int(answer.strip()) <= 4:
-            return check_kanji_multiple_choice_answer(answer.strip())
+            return check_kanji_multiple_choice_answer(answer.strip(), tool_context)
         else:
             return {
                 "status": "error", 
@@ -707,7 +693,7 @@ def quick_answer(answer: str) -> dict:
             }
     else:
         # Es una pregunta abierta de hiragana
-        return check_answer(answer)
+        return check_answer(answer, tool_context)
 
 # ---------------- FUNCIONES DE KANJI ---------------- #
 
@@ -743,14 +729,14 @@ def generate_kanji_flashcard() -> dict:
         }
     }
 
-def generate_kanji_multiple_choice(question_type: str = "kanji_to_meaning") -> dict:
+def generate_kanji_multiple_choice(question_type: str = "kanji_to_meaning", tool_context: Optional[ToolContext] = None) -> dict:
     """
     Genera una pregunta de múltiple choice sobre kanji.
     
     Args:
         question_type (str): "kanji_to_meaning", "meaning_to_kanji", "kanji_to_reading"
     """
-    global game_state
+    game_state = estados.obtener(tool_context)
     
     if not KANJI_LIST:
         return {
@@ -833,14 +819,14 @@ def generate_kanji_multiple_choice(question_type: str = "kanji_to_meaning") -> d
         }
     }
 
-def check_kanji_multiple_choice_answer(option_number: str) -> dict:
+def check_kanji_multiple_choice_answer(option_number: str, tool_context: Optional[ToolContext] = None) -> dict:
     """
     Verifica la respuesta de múltiple choice para kanji y genera automáticamente la siguiente pregunta.
     
     Args:
         option_number (str): Número de la opción seleccionada (1-4)
     """
-    global game_state
+    game_state = estados.obtener(tool_context)
     
     if not game_state['current_question'] or game_state['current_question'].get('type') != 'kanji_multiple_choice':
         return {
@@ -886,7 +872,7 @@ def check_kanji_multiple_choice_answer(option_number: str) -> dict:
     game_state['current_question'] = None
     
     # Generar siguiente pregunta automáticamente
-    next_question_result = generate_kanji_multiple_choice(question['question_type'])
+    next_question_result = generate_kanji_multiple_choice(question['question_type'], tool_context)
     
     if is_correct:
         # Mensaje corto cuando acierta: solo información del kanji + siguiente pregunta
@@ -950,10 +936,11 @@ def check_kanji_multiple_choice_answer(option_number: str) -> dict:
             "auto_generated_next": next_question_result['status'] == 'success'
         }
 
-def get_kanji_stats() -> dict:
+def get_kanji_stats(tool_context: Optional[ToolContext] = None) -> dict:
     """
     Muestra estadísticas específicas de kanji.
     """
+    game_state = estados.obtener(tool_context)
     kanji_score = game_state.get('kanji_score', 0)
     kanji_total = game_state.get('kanji_total', 0)
     
@@ -1025,11 +1012,11 @@ def get_learning_tips() -> dict:
         "tips": random_tips
     }
 
-def show_progress_summary() -> dict:
+def show_progress_summary(tool_context: Optional[ToolContext] = None) -> dict:
     """
     Muestra un resumen completo del progreso del usuario con recomendaciones.
     """
-    global game_state
+    game_state = estados.obtener(tool_context)
     
     if game_state['total_questions'] == 0:
         return {
@@ -1082,21 +1069,15 @@ def show_progress_summary() -> dict:
         }
     }
 
-def reset_game_progress() -> dict:
+def reset_game_progress(tool_context: Optional[ToolContext] = None) -> dict:
     """
     Reinicia completamente el progreso del juego.
     """
-    global game_state
+    game_state = estados.obtener(tool_context)
     
     old_stats = f"{game_state['score']}/{game_state['total_questions']}"
     
-    game_state = {
-        'current_question': None,
-        'score': 0,
-        'total_questions': 0,
-        'current_mode': None,
-        'difficulty_level': 'basico'
-    }
+    game_state = estados.reiniciar(tool_context)
     
     return {
         "status": "success",
@@ -0,0 +1,79 @@
+# Estado del juego por sesión de ADK (pregunta activa, puntaje, dificultad)
+import threading
+import time
+from collections import OrderedDict
+
+# Sesiones en memoria como máximo; al pasarse se descarta la usada hace más tiempo
+MAX_SESIONES = 10000
+# Una sesión sin actividad durante este tiempo se descarta (segundos)
+TTL_SESION = 4 * 60 * 60
+
+# Clave de las llamadas hechas fuera de ADK (sin tool_context)
+SESION_LOCAL = ("local", "local", "local")
+
+
+def estado_inicial() -> dict:
+    return {
+        'current_question': None,
+        'score': 0,
+        'total_questions': 0,
+        'current_mode': None,  # 'hiragana' o 'kanji'
+        'difficulty_level': 'basico',
+        'kanji_score': 0,
+        'kanji_total': 0
+    }
+
+
+def clave_sesion(tool_context) -> tuple:
+    """(aplicación, usuario, sesión) de la invocación en curso."""
+    if tool_context is None:
+        return SESION_LOCAL
+    sesion = tool_context._invocation_context.session
+    return (sesion.app_name, sesion.user_id, sesion.id)
+
+
+class AlmacenEstados:
+    """
+    Estados del juego por sesión, con descarte LRU (más de max_sesiones) y por inactividad
+    (ttl_s). Los accesos al almacén se serializan con un lock; cada estado lo modifican solo
+    las herramientas de su propia sesión.
+    """
+
+    def __init__(self, max_sesiones: int = MAX_SESIONES, ttl_s: float = TTL_SESION):
+        self.max_sesiones = max_sesiones
+        self.ttl_s = ttl_s
+        self._estados = OrderedDict()  # clave -> (último uso, estado), del menos al más reciente
+        self._bloqueo = threading.Lock()
+
+    def _descartar(self, ahora: float):
+        while self._estados:
+            clave, (ultimo_uso, _) = next(iter(self._estados.items()))
+            if len(self._estados) <= self.max_sesiones and ahora - ultimo_uso <= self.ttl_s:
+                break
+            del self._estados[clave]
+
+    def obtener(self, tool_context) -> dict:
+        """Estado de la sesión; si no existe (o venció) empieza uno nuevo."""
+        clave = clave_sesion(tool_context)
+        ahora = time.monotonic()
+        with self._bloqueo:
+            entrada = self._estados.pop(clave, None)
+            estado = entrada[1] if entrada and ahora - entrada[0] <= self.ttl_s else estado_inicial()
+            self._estados[clave] = (ahora, estado)
+            self._descartar(ahora)
+            return estado
+
+    def reiniciar(self, tool_context) -> dict:
+        """Reemplaza el estado de la sesión por uno nuevo y lo devuelve."""
+        clave = clave_sesion(tool_context)
+        ahora = time.monotonic()
+        with self._bloqueo:
+            self._estados.pop(clave, None)
+            estado = self._estados[clave] = (ahora, estado_inicial())
+            self._descartar(ahora)
+            return estado[1]
+
+    def __len__(self) -> int:
+        with self._bloqueo:
+            self._descartar(time.monotonic())
+            return len(self._estados)
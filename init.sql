@@ -6,4 +6,275 @@ CREATE TABLE IF NOT EXISTS transacciones (
     descripcion TEXT,
     contraparte VARCHAR(100),
     created_at TIMESTAMP DEFAULT NOW()
-);
\ No newline at end of file
+);
+
+CREATE TABLE IF NOT EXISTS tasas_cambio (
+    id SERIAL PRIMARY KEY,
+    moneda_origen VARCHAR(10) NOT NULL,
+    moneda_destino VARCHAR(10) NOT NULL,
+    tasa NUMERIC(18,8) NOT NULL,
+    fecha_actualizacion TIMESTAMP DEFAULT NOW(),
+    UNIQUE (moneda_origen, moneda_destino)
+);
+
+CREATE TABLE IF NOT EXISTS prestamos (
+    id SERIAL PRIMARY KEY,
+    monto_total NUMERIC(14,2) NOT NULL,
+    moneda VARCHAR(10) NOT NULL,
+    persona VARCHAR(100) NOT NULL,
+    porcentaje_interes NUMERIC(6,2) DEFAULT 0,
+    tiene_intermediario BOOLEAN DEFAULT FALSE,
+    porcentaje_intermediario NUMERIC(6,2) DEFAULT 0,
+    monto_intermediario NUMERIC(14,2) DEFAULT 0,
+    monto_en_mano NUMERIC(14,2) DEFAULT 0,
+    fecha_prestamo DATE NOT NULL,
+    cotizacion_momento NUMERIC(18,8),
+    descripcion TEXT,
+    estado VARCHAR(20) DEFAULT 'activo',
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Cotización y fecha de cierre para el P&L cambiario realizado
+ALTER TABLE prestamos ADD COLUMN IF NOT EXISTS fecha_finalizacion DATE;
+ALTER TABLE prestamos ADD COLUMN IF NOT EXISTS cotizacion_finalizacion NUMERIC(18,8);
+
+CREATE TABLE IF NOT EXISTS saldo_actual (
+    id SERIAL PRIMARY KEY,
+    monto NUMERIC(14,2) NOT NULL,
+    moneda VARCHAR(10) NOT NULL,
+    descripcion TEXT,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS historial_saldo (
+    id SERIAL PRIMARY KEY,
+    tipo_operacion VARCHAR(50),
+    monto_operacion NUMERIC(14,2),
+    saldo_anterior NUMERIC(14,2),
+    saldo_nuevo NUMERIC(14,2),
+    descripcion TEXT,
+    fecha_operacion TIMESTAMP DEFAULT NOW()
+);
+
+-- Historial diario de cotizaciones (tasas_cambio solo guarda la última)
+CREATE TABLE IF NOT EXISTS tasas_cambio_historial (
+    moneda_origen VARCHAR(10) NOT NULL,
+    moneda_destino VARCHAR(10) NOT NULL,
+    fecha DATE NOT NULL,
+    tasa NUMERIC(18,8) NOT NULL,
+    PRIMARY KEY (moneda_origen, moneda_destino, fecha)
+);
+
+INSERT INTO tasas_cambio_historial (moneda_origen, moneda_destino, fecha, tasa)
+SELECT moneda_origen, moneda_destino, fecha_actualizacion::date, tasa
+FROM tasas_cambio
+ON CONFLICT DO NOTHING;
+
+-- Rollup diario de saldo_actual: movimiento del día y saldo al cierre por moneda
+CREATE TABLE IF NOT EXISTS saldo_diario (
+    moneda VARCHAR(10) NOT NULL,
+    fecha DATE NOT NULL,
+    movimiento NUMERIC(16,2) NOT NULL DEFAULT 0,
+    saldo_cierre NUMERIC(16,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (moneda, fecha)
+);
+
+INSERT INTO saldo_diario (moneda, fecha, movimiento, saldo_cierre)
+SELECT moneda, fecha, movimiento,
+       SUM(movimiento) OVER (PARTITION BY moneda ORDER BY fecha)
+FROM (
+    SELECT moneda, updated_at::date AS fecha, SUM(monto) AS movimiento
+    FROM saldo_actual
+    GROUP BY moneda, updated_at::date
+) diario
+WHERE NOT EXISTS (SELECT 1 FROM saldo_diario);
+
+-- Rollup mensual de transacciones por tipo y contraparte ('' = sin contraparte)
+CREATE TABLE IF NOT EXISTS transacciones_mensual (
+    mes DATE NOT NULL,
+    tipo VARCHAR(20) NOT NULL,
+    contraparte VARCHAR(100) NOT NULL DEFAULT '',
+    cantidad INTEGER NOT NULL DEFAULT 0,
+    total NUMERIC(16,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (mes, tipo, contraparte)
+);
+
+INSERT INTO transacciones_mensual (mes, tipo, contraparte, cantidad, total)
+SELECT date_trunc('month', fecha)::date, tipo, COALESCE(contraparte, ''), COUNT(*), SUM(monto)
+FROM transacciones
+WHERE NOT EXISTS (SELECT 1 FROM transacciones_mensual)
+GROUP BY 1, 2, 3;
+
+-- Búsqueda: índices de texto completo (español) y trigramas sobre descripciones y contrapartes
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_transacciones_descripcion_fts
+    ON transacciones USING GIN (to_tsvector('spanish', COALESCE(descripcion, '')));
+CREATE INDEX IF NOT EXISTS idx_transacciones_descripcion_trgm
+    ON transacciones USING GIN (descripcion gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_transacciones_contraparte_trgm
+    ON transacciones USING GIN (contraparte gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_saldo_actual_descripcion_fts
+    ON saldo_actual USING GIN (to_tsvector('spanish', COALESCE(descripcion, '')));
+CREATE INDEX IF NOT EXISTS idx_saldo_actual_descripcion_trgm
+    ON saldo_actual USING GIN (descripcion gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_prestamos_descripcion_fts
+    ON prestamos USING GIN (to_tsvector('spanish', COALESCE(descripcion, '')));
+CREATE INDEX IF NOT EXISTS idx_prestamos_descripcion_trgm
+    ON prestamos USING GIN (descripcion gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_prestamos_persona_trgm
+    ON prestamos USING GIN (persona gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_historial_saldo_descripcion_fts
+    ON historial_saldo USING GIN (to_tsvector('spanish', COALESCE(descripcion, '')));
+CREATE INDEX IF NOT EXISTS idx_historial_saldo_descripcion_trgm
+    ON historial_saldo USING GIN (descripcion gin_trgm_ops);
+
+-- Dimensión de contrapartes (clave = nombre normalizado) y exposición por persona y moneda
+CREATE TABLE IF NOT EXISTS contrapartes (
+    clave VARCHAR(100) PRIMARY KEY,
+    nombre VARCHAR(100) NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS exposicion_contraparte (
+    clave VARCHAR(100) NOT NULL REFERENCES contrapartes (clave),
+    moneda VARCHAR(10) NOT NULL,
+    prestamos_activos INTEGER NOT NULL DEFAULT 0,
+    monto_activo NUMERIC(16,2) NOT NULL DEFAULT 0,
+    intereses_pendientes NUMERIC(16,2) NOT NULL DEFAULT 0,
+    ganancia_pendiente NUMERIC(16,2) NOT NULL DEFAULT 0,
+    prestamos_totales INTEGER NOT NULL DEFAULT 0,
+    monto_historico NUMERIC(16,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (clave, moneda)
+);
+
+CREATE INDEX IF NOT EXISTS idx_prestamos_persona
+    ON prestamos (lower(trim(persona)), fecha_prestamo DESC);
+CREATE INDEX IF NOT EXISTS idx_transacciones_contraparte
+    ON transacciones (lower(trim(contraparte)), fecha DESC);
+
+INSERT INTO contrapartes (clave, nombre)
+SELECT DISTINCT ON (lower(trim(nombre))) lower(trim(nombre)), trim(nombre)
+FROM (
+    SELECT persona AS nombre FROM prestamos
+    UNION ALL
+    SELECT contraparte FROM transacciones WHERE contraparte IS NOT NULL AND trim(contraparte) <> ''
+) nombres
+ON CONFLICT DO NOTHING;
+
+INSERT INTO exposicion_contraparte (clave, moneda, prestamos_activos, monto_activo, intereses_pendientes,
+                                    ganancia_pendiente, prestamos_totales, monto_historico)
+SELECT lower(trim(persona)), moneda,
+       COUNT(*) FILTER (WHERE estado = 'activo'),
+       COALESCE(SUM(monto_total) FILTER (WHERE estado = 'activo'), 0),
+       COALESCE(SUM(monto_total * porcentaje_interes / 100) FILTER (WHERE estado = 'activo'), 0),
+       COALESCE(SUM(monto_en_mano) FILTER (WHERE estado = 'activo'), 0),
+       COUNT(*),
+       SUM(monto_total)
+FROM prestamos
+WHERE NOT EXISTS (SELECT 1 FROM exposicion_contraparte)
+GROUP BY lower(trim(persona)), moneda;
+
+-- Pagos parciales: saldo pendiente (capital + intereses) y ganancia cobrada guardados en el préstamo
+ALTER TABLE prestamos ADD COLUMN IF NOT EXISTS saldo_pendiente NUMERIC(14,2);
+ALTER TABLE prestamos ADD COLUMN IF NOT EXISTS ganancia_cobrada NUMERIC(14,2) NOT NULL DEFAULT 0;
+ALTER TABLE prestamos ADD COLUMN IF NOT EXISTS monto_cobrado NUMERIC(14,2) NOT NULL DEFAULT 0;
+
+UPDATE prestamos
+SET saldo_pendiente = CASE WHEN estado = 'activo' THEN monto_total * (1 + porcentaje_interes / 100) ELSE 0 END,
+    ganancia_cobrada = CASE WHEN estado = 'activo' THEN 0 ELSE monto_en_mano END
+WHERE saldo_pendiente IS NULL;
+
+CREATE TABLE IF NOT EXISTS pagos_prestamo (
+    id SERIAL PRIMARY KEY,
+    prestamo_id INTEGER NOT NULL REFERENCES prestamos (id),
+    monto NUMERIC(14,2) NOT NULL,
+    fecha_pago DATE NOT NULL,
+    ganancia NUMERIC(14,2) NOT NULL DEFAULT 0,
+    descripcion TEXT,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_pagos_prestamo_prestamo ON pagos_prestamo (prestamo_id, fecha_pago);
+
+-- Ingresos y gastos recurrentes: el programador (recurrentes.py) genera los movimientos vencidos
+CREATE TABLE IF NOT EXISTS reglas_recurrentes (
+    id SERIAL PRIMARY KEY,
+    tipo VARCHAR(20) NOT NULL,
+    monto NUMERIC(14,2) NOT NULL,
+    moneda VARCHAR(10) NOT NULL,
+    descripcion TEXT NOT NULL,
+    frecuencia VARCHAR(10) NOT NULL DEFAULT 'mensual',
+    dia INTEGER NOT NULL,
+    proxima_fecha DATE NOT NULL,
+    ultima_aplicacion DATE,
+    aplicaciones INTEGER NOT NULL DEFAULT 0,
+    activa BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_reglas_recurrentes_vencidas ON reglas_recurrentes (proxima_fecha) WHERE activa;
+
+-- Estadísticas de gasto por categoría, mantenidas en cada gasto (estadisticas_gasto.py):
+-- media y varianza con el método de Welford (m2 = suma de cuadrados de las desviaciones)
+CREATE TABLE IF NOT EXISTS estadisticas_categoria (
+    categoria VARCHAR(50) PRIMARY KEY,
+    cantidad INTEGER NOT NULL DEFAULT 0,
+    media_usd DOUBLE PRECISION NOT NULL DEFAULT 0,
+    m2_usd DOUBLE PRECISION NOT NULL DEFAULT 0,
+    maximo_usd NUMERIC(14,2) NOT NULL DEFAULT 0,
+    ultimo_gasto TIMESTAMP
+);
+
+-- Gasto por categoría y día: las ventanas móviles (7 y 30 días, mes, semana) suman a lo sumo 31 filas
+CREATE TABLE IF NOT EXISTS gasto_categoria_diario (
+    categoria VARCHAR(50) NOT NULL,
+    fecha DATE NOT NULL,
+    cantidad INTEGER NOT NULL DEFAULT 0,
+    total_usd NUMERIC(16,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (categoria, fecha)
+);
+
+CREATE TABLE IF NOT EXISTS presupuestos_categoria (
+    categoria VARCHAR(50) PRIMARY KEY,
+    limite_usd NUMERIC(14,2) NOT NULL,
+    periodo VARCHAR(10) NOT NULL DEFAULT 'mensual',
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Categoría de cada movimiento del libro (categorizacion.py): se asigna al insertar y
+-- las filas existentes se completan con `python -m Asistente_Financiero.categorizacion`
+ALTER TABLE transacciones ADD COLUMN IF NOT EXISTS categoria VARCHAR(50);
+ALTER TABLE saldo_actual ADD COLUMN IF NOT EXISTS categoria VARCHAR(50);
+
+CREATE INDEX IF NOT EXISTS idx_transacciones_fecha ON transacciones (fecha);
+CREATE INDEX IF NOT EXISTS idx_saldo_actual_updated_at ON saldo_actual (updated_at);
+
+-- Reglas del usuario (palabra o frase normalizada -> categoría); tienen prioridad sobre el diccionario base
+CREATE TABLE IF NOT EXISTS reglas_categoria (
+    id SERIAL PRIMARY KEY,
+    patron VARCHAR(100) NOT NULL UNIQUE,
+    categoria VARCHAR(50) NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Movimiento de saldo_actual que registra cada fila de historial_saldo (conciliacion.py)
+ALTER TABLE historial_saldo ADD COLUMN IF NOT EXISTS saldo_id INTEGER;
+CREATE INDEX IF NOT EXISTS idx_historial_saldo_saldo_id ON historial_saldo (saldo_id);
+
+-- Sumas de control por bloques de TAMANO_BLOQUE filas del libro (conciliacion.py), mantenidas
+-- al insertar: cantidad de filas, suma de los digestos de su contenido y suma de los digestos
+-- del movimiento (id en saldo_actual, saldo_id en historial_saldo). Las filas existentes se
+-- sellan con `python -m Asistente_Financiero.conciliacion --sellar`
+CREATE TABLE IF NOT EXISTS bloques_control (
+    tabla VARCHAR(30) NOT NULL,
+    bloque INTEGER NOT NULL,
+    filas INTEGER NOT NULL DEFAULT 0,
+    digesto BIGINT NOT NULL DEFAULT 0,
+    vinculo BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (tabla, bloque)
+);